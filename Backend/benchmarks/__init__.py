@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# Performance benchmarks for the HealthCheck API (run from the Backend folder)
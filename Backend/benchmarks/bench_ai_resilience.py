@@ -0,0 +1,126 @@
+# benchmarks/bench_ai_resilience.py
+# Retries, hedging and the circuit breaker around the AI call, against the fake backend with injected failures
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_ai_resilience --calls 300 --concurrency 16
+#
+# Three scenarios, each run with the feature off and on:
+#   retries - 20% of calls fail transiently; share of analyses that still succeed
+#   hedging - lognormal latency with a long tail; p50/p95/p99 and extra backend calls
+#   breaker - the backend is down; how long callers wait before getting an error
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("AI_BACKEND", "fake")
+
+from services import resilience_service
+from services.ai_backends import FakeBackend
+from services.ai_service import analyze_lab_results_async, set_ai_backend
+from services.resilience_service import CircuitBreaker, LatencyTracker
+
+
+class CountingBackend(FakeBackend):
+    """FakeBackend that counts how many requests actually reached it."""
+
+    calls = 0
+
+    async def generate_async(self, prompt: str) -> dict:
+        CountingBackend.calls += 1
+        return await super().generate_async(prompt)
+
+
+def configure(**settings) -> None:
+    """Override resilience settings and start from a fresh breaker and latency history."""
+    for name, value in settings.items():
+        setattr(resilience_service, name, value)
+    resilience_service.ai_breaker = CircuitBreaker(
+        failure_rate=resilience_service.AI_BREAKER_FAILURE_RATE,
+        min_calls=resilience_service.AI_BREAKER_MIN_CALLS,
+        window_seconds=resilience_service.AI_BREAKER_WINDOW_SECONDS,
+        open_seconds=resilience_service.AI_BREAKER_OPEN_SECONDS,
+    )
+    resilience_service.ai_latencies = LatencyTracker()
+    CountingBackend.calls = 0
+
+
+async def run_calls(calls: int, concurrency: int) -> tuple[list[float], int]:
+    """Analyze `calls` documents with bounded concurrency; returns latencies and failures."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one(i: int):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            response = await analyze_lab_results_async(f"documento {i}")
+            latencies.append(time.perf_counter() - start)
+            failures += "error" in response
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return latencies, failures
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[int(p / 100 * (len(ordered) - 1))] * 1000
+
+
+async def bench_retries(calls: int, concurrency: int) -> None:
+    print(f"retries: {calls} calls, 20% transient failures, 20 ms latency")
+    for label, retries in (("no retries", 0), ("2 retries", 2)):
+        configure(AI_MAX_RETRIES=retries, AI_RETRY_BASE_DELAY_SECONDS=0.01, AI_HEDGE_ENABLED=False, AI_BREAKER_MIN_CALLS=10**9)
+        set_ai_backend(CountingBackend(latency_ms=20, error_rate=0.2, seed=1))
+        latencies, failures = await run_calls(calls, concurrency)
+        print(
+            f"  {label:<12} success {1 - failures / calls:>6.1%} | p50 {percentile(latencies, 50):>6.1f} ms | "
+            f"p99 {percentile(latencies, 99):>6.1f} ms | backend calls {CountingBackend.calls}"
+        )
+
+
+async def bench_hedging(calls: int, concurrency: int) -> None:
+    print(f"hedging: {calls} calls, lognormal latency mean 50 ms / stddev 100 ms")
+    for label, hedge in (("no hedging", False), ("hedge at p90", True)):
+        configure(AI_MAX_RETRIES=0, AI_HEDGE_ENABLED=hedge, AI_HEDGE_PERCENTILE=90, AI_HEDGE_MIN_SAMPLES=20, AI_BREAKER_MIN_CALLS=10**9)
+        set_ai_backend(CountingBackend(latency_ms=50, latency_stddev_ms=100, distribution="lognormal", seed=2))
+        await run_calls(40, concurrency)  # latency history for the hedging threshold
+        CountingBackend.calls = 0
+        latencies, _ = await run_calls(calls, concurrency)
+        print(
+            f"  {label:<12} p50 {percentile(latencies, 50):>6.1f} ms | p95 {percentile(latencies, 95):>6.1f} ms | "
+            f"p99 {percentile(latencies, 99):>6.1f} ms | extra backend calls {CountingBackend.calls / calls - 1:>5.1%}"
+        )
+
+
+async def bench_breaker(calls: int, concurrency: int) -> None:
+    print(f"breaker: {calls} calls while the backend fails every request after 200 ms")
+    for label, min_calls in (("no breaker", 10**9), ("breaker", 10)):
+        configure(AI_MAX_RETRIES=2, AI_RETRY_BASE_DELAY_SECONDS=0.05, AI_HEDGE_ENABLED=False, AI_BREAKER_MIN_CALLS=min_calls)
+        set_ai_backend(CountingBackend(latency_ms=200, error_rate=1.0))
+        start = time.perf_counter()
+        latencies, failures = await run_calls(calls, concurrency)
+        elapsed = time.perf_counter() - start
+        print(
+            f"  {label:<12} {failures}/{calls} failed in {elapsed:.2f}s | caller wait p50 {percentile(latencies, 50):>6.1f} ms | "
+            f"backend calls {CountingBackend.calls} | breaker {resilience_service.ai_breaker.snapshot()['state']}"
+        )
+
+
+if __name__ == "__main__":
+    import logging
+
+    parser = argparse.ArgumentParser(description="AI call resilience benchmark")
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    async def main():
+        await bench_retries(args.calls, args.concurrency)
+        await bench_hedging(args.calls, args.concurrency)
+        await bench_breaker(args.calls, args.concurrency)
+
+    # One event loop: ai_service's semaphore is bound to the first loop that uses it
+    asyncio.run(main())
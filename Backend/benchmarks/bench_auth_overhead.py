@@ -0,0 +1,88 @@
+# benchmarks/bench_auth_overhead.py
+# Per-request cost of resolving the authenticated user: database lookup vs. user cache vs. claims-only tokens
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_auth_overhead --iterations 2000
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("AI_BACKEND", "fake")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/bench.db"
+
+import httpx
+from fastapi.security import HTTPAuthorizationCredentials
+
+from routes import auth as auth_routes
+from services.auth_cache_service import user_cache
+
+
+def summary(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    p50 = statistics.median(ordered) * 1e6
+    p95 = ordered[int(0.95 * (len(ordered) - 1))] * 1e6
+    return f"p50 {p50:>8.1f} µs | p95 {p95:>8.1f} µs"
+
+
+async def measure(token: str, iterations: int, http: httpx.AsyncClient) -> tuple[list[float], list[float]]:
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    dependency = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await auth_routes.get_current_user(credentials)
+        dependency.append(time.perf_counter() - start)
+
+    headers = {"Authorization": f"Bearer {token}"}
+    requests = []
+    for _ in range(max(1, iterations // 10)):
+        start = time.perf_counter()
+        response = await http.get("/history?limit=1", headers=headers)
+        requests.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return dependency, requests
+
+
+async def run(iterations: int) -> None:
+    from main import app
+    from models import init_db
+
+    init_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        await http.post("/auth/register", json={"username": "bench", "email": "bench@example.com", "password": "pw"})
+        response = await http.post("/auth/login", json={"email": "bench@example.com", "password": "pw"})
+        token = response.json()["access_token"]
+        user_id = (await auth_routes.get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))).id
+
+        print(f"get_current_user x {iterations} and GET /history x {max(1, iterations // 10)}:")
+
+        user_cache.enabled = False
+        dependency, requests = await measure(token, iterations, http)
+        print(f"  database lookup  get_current_user {summary(dependency)} || GET /history {summary(requests)}")
+
+        user_cache.enabled = True
+        user_cache.clear()
+        dependency, requests = await measure(token, iterations, http)
+        print(f"  user cache       get_current_user {summary(dependency)} || GET /history {summary(requests)}")
+        stats = user_cache.get_stats()
+        print(f"                   token hit rate {stats['token_hit_rate']:.1%}, user hit rate {stats['user_hit_rate']:.1%}")
+
+        auth_routes.AUTH_CLAIMS_ONLY = True
+        claims_token = auth_routes.create_access_token(user_id, "bench", "bench@example.com")
+        dependency, requests = await measure(claims_token, iterations, http)
+        print(f"  claims-only      get_current_user {summary(dependency)} || GET /history {summary(requests)}")
+
+
+if __name__ == "__main__":
+    import logging
+
+    parser = argparse.ArgumentParser(description="Authenticated request overhead")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.iterations))
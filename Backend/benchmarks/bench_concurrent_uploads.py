@@ -0,0 +1,74 @@
+# benchmarks/bench_concurrent_uploads.py
+# Measures wall time of N concurrent /upload-pdf calls (or one /upload-pdfs batch) against the fake AI backend
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_concurrent_uploads --uploads 8 --latency 1.0
+#   python -m benchmarks.bench_concurrent_uploads --uploads 5 --batch
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("AI_BACKEND", "fake")
+os.environ.setdefault("ANALYSIS_CACHE_ENABLED", "false")  # measure real AI calls, not cache hits
+
+import fitz  # PyMuPDF
+import httpx
+
+
+def make_sample_pdf(pages: int = 2) -> bytes:
+    """Build a small lab-report-like PDF in memory."""
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Laboratorio Clinico Demo - Pagina {page_num + 1}")
+        page.insert_text((72, 100), "Paciente: Juan Perez  Edad: 45")
+        for row in range(30):
+            page.insert_text((72, 130 + row * 18), f"Hemoglobina {13 + row % 3}.2 g/dL  (13.0 - 17.0)")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+async def run(uploads: int, latency: float, batch: bool = False) -> None:
+    from main import app
+    from routes import pdf as pdf_routes
+    from services.ai_backends import FakeBackend
+    from services.ai_service import set_ai_backend
+
+    set_ai_backend(FakeBackend(latency_ms=latency * 1000, distribution="fixed", error_rate=0))
+    pdf_routes.limiter.enabled = False
+
+    pdf_bytes = make_sample_pdf()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def upload(i: int):
+            files = {"file": (f"report_{i}.pdf", pdf_bytes, "application/pdf")}
+            return await client.post("/upload-pdf", files=files)
+
+        async def upload_batch():
+            files = [("files", (f"report_{i}.pdf", pdf_bytes, "application/pdf")) for i in range(uploads)]
+            return await client.post("/upload-pdfs", files=files)
+
+        start = time.perf_counter()
+        if batch:
+            response = await upload_batch()
+            ok = response.json()["succeeded"] if response.status_code == 200 else 0
+        else:
+            responses = await asyncio.gather(*(upload(i) for i in range(uploads)))
+            ok = sum(1 for r in responses if r.status_code == 200)
+        elapsed = time.perf_counter() - start
+
+    mode = "batch" if batch else "concurrent"
+    print(f"Uploads: {uploads} ({mode}) | OK: {ok} | LLM latency: {latency:.2f}s")
+    print(f"Wall time: {elapsed:.2f}s ({elapsed / latency:.2f}x one LLM latency)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent upload benchmark")
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--batch", action="store_true", help="Send all files in one /upload-pdfs request")
+    args = parser.parse_args()
+    asyncio.run(run(args.uploads, args.latency, args.batch))
@@ -0,0 +1,140 @@
+# benchmarks/bench_db_concurrency.py
+# Concurrent logins, history reads and history writes under each database mode
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_db_concurrency --clients 50 --rounds 10
+#
+# Modes (each runs in its own process against a throwaway SQLite file):
+#   legacy    - rollback journal, synchronous=FULL, sync sessions in threads (previous setup)
+#   wal       - WAL, synchronous=NORMAL, busy timeout, sync sessions in threads
+#   wal-async - same pragmas, AsyncSession through aiosqlite (DB_ASYNC_ENABLED=true)
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = {
+    "legacy": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "DB_ASYNC_ENABLED": "false"},
+    "wal": {"SQLITE_JOURNAL_MODE": "WAL", "SQLITE_SYNCHRONOUS": "NORMAL", "DB_ASYNC_ENABLED": "false"},
+    "wal-async": {"SQLITE_JOURNAL_MODE": "WAL", "SQLITE_SYNCHRONOUS": "NORMAL", "DB_ASYNC_ENABLED": "true"},
+}
+
+PASSWORD = "benchmark-password"
+
+
+async def run_worker(clients: int, rounds: int) -> dict:
+    """Drive the app in-process; configuration comes from the environment set by the parent."""
+    import httpx
+    from werkzeug.security import generate_password_hash
+
+    from main import app
+    from models import AnalysisResult, User, SessionLocal, init_db, run_db
+    from services.history_service import save_analysis_result
+
+    init_db()
+    # A single cheap hash so the benchmark measures the database, not password hashing
+    password_hash = generate_password_hash(PASSWORD, method="pbkdf2:sha256:1")
+    db = SessionLocal()
+    users = [User(username=f"user{i}", email=f"user{i}@example.com", password_hash=password_hash) for i in range(clients)]
+    db.add_all(users)
+    db.commit()
+    db.execute(AnalysisResult.__table__.insert(), [
+        {"user_id": user.id, "filename": f"r{j}.pdf", "results_json": {"analysis_result": {"resumenEjecutivo": "x" * 2000}}}
+        for user in users for j in range(50)
+    ])
+    db.commit()
+    user_ids = [user.id for user in users]
+    db.close()
+
+    latencies = {"login": [], "history": [], "save": []}
+    errors = 0
+
+    async def client(i: int, http: httpx.AsyncClient):
+        nonlocal errors
+        for _ in range(rounds):
+            start = time.perf_counter()
+            response = await http.post("/auth/login", json={"email": f"user{i}@example.com", "password": PASSWORD})
+            latencies["login"].append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+                continue
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            start = time.perf_counter()
+            response = await http.get("/history", headers=headers)
+            latencies["history"].append(time.perf_counter() - start)
+            errors += response.status_code != 200
+
+            start = time.perf_counter()
+            try:
+                await run_db(save_analysis_result, user_ids[i], "nuevo.pdf", {"analysis_result": {"resumenEjecutivo": "y" * 2000}})
+            except Exception:
+                errors += 1
+            latencies["save"].append(time.perf_counter() - start)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(i, http) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+
+    def summary(samples: list[float]) -> dict:
+        ordered = sorted(samples)
+        return {
+            "p50_ms": round(statistics.median(ordered) * 1000, 2),
+            "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 2),
+        }
+
+    operations = sum(len(samples) for samples in latencies.values())
+    return {
+        "operations_per_second": round(operations / elapsed, 1),
+        "errors": errors,
+        **{name: summary(samples) for name, samples in latencies.items()},
+    }
+
+
+def run_mode(mode: str, clients: int, rounds: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            **MODES[mode],
+            "AI_BACKEND": "fake",
+            "DATABASE_URL": f"sqlite:///{tmp}/bench.db",
+            "JOB_STORAGE_DIR": f"{tmp}/jobs",
+        }
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_db_concurrency", "--worker", "--clients", str(clients), "--rounds", str(rounds)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Database concurrency benchmark")
+    parser.add_argument("--clients", type=int, default=50, help="Concurrent users")
+    parser.add_argument("--rounds", type=int, default=10, help="login + history + save rounds per user")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        import logging
+
+        logging.disable(logging.INFO)
+        print(json.dumps(asyncio.run(run_worker(args.clients, args.rounds))))
+        sys.exit(0)
+
+    print(f"{args.clients} concurrent users x {args.rounds} rounds (login, GET /history, save)")
+    for mode in args.modes:
+        result = run_mode(mode, args.clients, args.rounds)
+        print(
+            f"  {mode:<10} {result['operations_per_second']:>8} ops/s | errors {result['errors']:>3} | "
+            f"login p95 {result['login']['p95_ms']:>8} ms | history p95 {result['history']['p95_ms']:>8} ms | "
+            f"save p95 {result['save']['p95_ms']:>8} ms"
+        )
@@ -0,0 +1,141 @@
+# benchmarks/bench_history.py
+# GET /history listing cost for a user with many saved analyses: keyset vs. OFFSET pagination
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_history --results 10000
+#
+# Uses a throwaway SQLite database, never webcheck.db.
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("AI_BACKEND", "fake")
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from models import AnalysisResult, Base, User
+from services.history_service import get_history_item, list_history
+
+
+def make_payload(i: int) -> dict:
+    """An /upload-pdf payload of realistic size (~6 KB)."""
+    return {
+        "message": "PDF procesado correctamente",
+        "filename": f"reporte_{i}.pdf",
+        "pages": 2,
+        "analysis_result": {
+            "isValid": True,
+            "interpretacionConceptos": "Hallazgo simulado. " * 120,
+            "resultadosSimplificados": "Explicación simulada. " * 100,
+            "resumenEjecutivo": "Resumen simulado. " * 30,
+        },
+    }
+
+
+def seed(session_factory, results: int, other_users: int) -> int:
+    db = session_factory()
+    users = [User(username=f"user{i}", email=f"user{i}@example.com", password_hash="x") for i in range(other_users + 1)]
+    db.add_all(users)
+    db.commit()
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    rows = []
+    for user in users:
+        for i in range(results):
+            rows.append({
+                "user_id": user.id,
+                "filename": f"reporte_{i}.pdf",
+                "results_json": make_payload(i),
+                "created_at": start + timedelta(minutes=i),
+            })
+    db.execute(AnalysisResult.__table__.insert(), rows)
+    db.commit()
+    user_id = users[0].id
+    db.close()
+    return user_id
+
+
+def timed(fn, repeat: int = 5) -> float:
+    """Median milliseconds of fn()."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def offset_page(db, user_id: int, limit: int, offset: int):
+    """The naive alternative: OFFSET pagination loading whole rows, results_json included."""
+    return db.execute(
+        text(
+            "SELECT * FROM analysis_results WHERE user_id = :user_id "
+            "ORDER BY created_at DESC, id DESC LIMIT :limit OFFSET :offset"
+        ),
+        {"user_id": user_id, "limit": limit, "offset": offset},
+    ).all()
+
+
+def run(results: int, other_users: int, limit: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/history.db")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+
+        start = time.perf_counter()
+        user_id = seed(session_factory, results, other_users)
+        print(f"Seeded {results} results for {other_users + 1} users in {time.perf_counter() - start:.1f}s")
+
+        db = session_factory()
+        plan = db.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id, filename, created_at FROM analysis_results "
+            "WHERE user_id = 1 AND (created_at, id) < ('2100-01-01', 1) ORDER BY created_at DESC, id DESC LIMIT 21"
+        )).all()
+        print("Query plan: " + " | ".join(row[-1] for row in plan))
+
+        first_page = timed(lambda: list_history(db, user_id, limit))
+
+        # Walk every page with the cursor, timing each one
+        page_times = []
+        cursor = None
+        pages = 0
+        while True:
+            page_start = time.perf_counter()
+            page = list_history(db, user_id, limit, cursor)
+            page_times.append((time.perf_counter() - page_start) * 1000)
+            pages += 1
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        last_offset = max(0, results - limit)
+        offset_first = timed(lambda: offset_page(db, user_id, limit, 0))
+        offset_last = timed(lambda: offset_page(db, user_id, limit, last_offset))
+        load_all = timed(lambda: db.execute(
+            text("SELECT * FROM analysis_results WHERE user_id = :user_id"), {"user_id": user_id}
+        ).all(), repeat=3)
+        detail = timed(lambda: get_history_item(db, user_id, results // 2))
+        db.close()
+        engine.dispose()
+
+    print(f"\nKeyset (GET /history, limit {limit}):")
+    print(f"  first page:               {first_page:.2f} ms")
+    print(f"  walk {pages} pages:          p50 {statistics.median(page_times):.2f} ms | max {max(page_times):.2f} ms | last {page_times[-1]:.2f} ms")
+    print("OFFSET with full rows (for comparison):")
+    print(f"  first page:               {offset_first:.2f} ms")
+    print(f"  last page (offset {last_offset}): {offset_last:.2f} ms")
+    print(f"Whole history with results_json (no pagination): {load_all:.2f} ms")
+    print(f"Single result (GET /history/<id>, results_json loaded): {detail:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="History listing benchmark")
+    parser.add_argument("--results", type=int, default=10000, help="Saved analyses for the measured user")
+    parser.add_argument("--other-users", type=int, default=2, help="Other users with as many results")
+    parser.add_argument("--limit", type=int, default=20, help="Page size")
+    args = parser.parse_args()
+    run(args.results, args.other_users, args.limit)
@@ -0,0 +1,102 @@
+# benchmarks/bench_large_reports.py
+# 1-, 20- and 100-page reports: sequential vs page-parallel extraction, single-call vs sectioned analysis
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_large_reports --pages 1 20 100 --section-tokens 4000
+#
+# Extraction is timed on its own (sequential extract_for_analysis vs. the
+# page-range process pool). Analysis uses a fake backend whose latency grows
+# with the prompt (--base-ms + --ms-per-1k-tokens), which is what makes one
+# huge prompt slower than several concurrent sections.
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("AI_BACKEND", "fake")
+os.environ.setdefault("ANALYSIS_CACHE_ENABLED", "false")
+
+from benchmarks.sample_reports import make_lab_report
+from services import analysis_service, pdf_service
+from services.ai_backends import FakeBackend
+from services.ai_service import set_ai_backend
+
+
+class PromptSizedBackend(FakeBackend):
+    """FakeBackend whose latency is a base plus a cost per 1k prompt tokens."""
+
+    def __init__(self, base_ms: float, ms_per_1k_tokens: float):
+        super().__init__(latency_ms=0)
+        self.base_ms = base_ms
+        self.ms_per_1k_tokens = ms_per_1k_tokens
+
+    async def generate_async(self, prompt: str) -> dict:
+        await asyncio.sleep((self.base_ms + self.ms_per_1k_tokens * len(prompt) / 4000) / 1000)
+        return await super().generate_async(prompt)
+
+
+async def time_extraction(path: str, parallel: bool, repeats: int) -> tuple[float, dict]:
+    pdf_service.PDF_PARALLEL_MIN_PAGES = 1 if parallel else 10**9
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        document = await pdf_service.extract_for_analysis_async(path)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, document
+
+
+async def time_analysis(prompt_text: str, sectioned: bool, section_tokens: int) -> tuple[float, dict]:
+    analysis_service.AI_SECTION_THRESHOLD_TOKENS = section_tokens if sectioned else 10**9
+    analysis_service.AI_SECTION_MAX_TOKENS = section_tokens
+    analysis_service.AI_MAX_SECTIONS = 10**6
+    start = time.perf_counter()
+    ai_response, _ = await analysis_service.analyze_prompt_text(prompt_text)
+    return (time.perf_counter() - start) * 1000, ai_response
+
+
+async def run(page_counts: list[int], section_tokens: int, base_ms: float, ms_per_1k: float, repeats: int, workers: int) -> None:
+    pdf_service.PDF_PAGE_WORKERS = workers
+    set_ai_backend(PromptSizedBackend(base_ms, ms_per_1k))
+    # Start the page process pool outside the measurements
+    await asyncio.gather(*(
+        asyncio.get_running_loop().run_in_executor(pdf_service.get_page_executor(), time.sleep, 0)
+        for _ in range(pdf_service.PDF_PAGE_WORKERS)
+    ))
+    print(
+        f"{pdf_service.PDF_PAGE_WORKERS} page workers ({os.cpu_count()} CPUs), {pdf_service.PDF_PAGES_PER_TASK} pages per task, "
+        f"sections of {section_tokens} tokens, AI latency {base_ms:.0f} ms + {ms_per_1k:.0f} ms/1k tokens"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in page_counts:
+            path = os.path.join(tmp, f"report_{pages}.pdf")
+            with open(path, "wb") as f:
+                f.write(make_lab_report(pages=pages, rows_per_page=25))
+
+            sequential_ms, document = await time_extraction(path, parallel=False, repeats=repeats)
+            parallel_ms, _ = await time_extraction(path, parallel=True, repeats=repeats)
+            single_ms, _ = await time_analysis(document["prompt_text"], sectioned=False, section_tokens=section_tokens)
+            sectioned_ms, ai_response = await time_analysis(document["prompt_text"], sectioned=True, section_tokens=section_tokens)
+            print(
+                f"  {pages:>3} pages | prompt ~{document['extraction']['prompt_tokens_estimate']:>6} tokens | "
+                f"extract sequential {sequential_ms:>7.1f} ms, parallel {parallel_ms:>7.1f} ms | "
+                f"analysis single call {single_ms:>7.1f} ms, {ai_response.get('sections', 1)} section(s) {sectioned_ms:>7.1f} ms"
+            )
+    pdf_service.shutdown_pdf_executor()
+
+
+if __name__ == "__main__":
+    import logging
+
+    parser = argparse.ArgumentParser(description="Large report extraction and sectioned analysis benchmark")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 20, 100])
+    parser.add_argument("--section-tokens", type=int, default=4000)
+    parser.add_argument("--base-ms", type=float, default=800)
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=150)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=max(2, os.cpu_count() or 1), help="Page worker processes")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.pages, args.section_tokens, args.base_ms, args.ms_per_1k_tokens, args.repeats, args.workers))
@@ -0,0 +1,95 @@
+# benchmarks/bench_metrics_overhead.py
+# Cost of the /metrics instrumentation and Server-Timing header relative to a request
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_metrics_overhead                     # worst case: instant AI backend
+#   python -m benchmarks.bench_metrics_overhead --latency-ms 1500   # typical Gemini latency
+#
+# The instrumentation of one request (ServerTimingMiddleware, the read, extract,
+# prompt_build, llm and json_parse timers and the token counters) is replayed
+# in a tight loop and compared with the p50 of real /upload-pdf requests.
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("AI_BACKEND", "fake")
+os.environ.setdefault("ANALYSIS_CACHE_ENABLED", "false")
+
+import httpx
+
+from benchmarks.sample_reports import make_lab_report
+from services.metrics_service import AI_TOKENS, ServerTimingMiddleware, stage_timer
+
+STAGES = ["read", "extract", "prompt_build", "llm", "json_parse"]
+BUDGET = 0.01  # Instrumentation must stay under 1% of request time
+
+
+def instrumentation_cost(iterations: int) -> float:
+    """Seconds spent on the metrics work of one request."""
+    async def instrumented_app(scope, receive, send):
+        for stage in STAGES:
+            with stage_timer(stage):
+                pass
+        AI_TOKENS.inc(1000, type="input")
+        AI_TOKENS.inc(500, type="output")
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def bare_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop_send(message):
+        pass
+
+    async def loop(app):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await app({"type": "http"}, None, noop_send)
+        return (time.perf_counter() - start) / iterations
+
+    async def measure():
+        return await loop(ServerTimingMiddleware(instrumented_app)) - await loop(bare_app)
+
+    return asyncio.run(measure())
+
+
+async def request_time(requests: int, latency_ms: float) -> float:
+    """p50 seconds of sequential /upload-pdf requests for a small report."""
+    from main import app
+    from routes import pdf as pdf_routes
+    from services.ai_backends import FakeBackend
+    from services.ai_service import set_ai_backend
+
+    set_ai_backend(FakeBackend(latency_ms=latency_ms, distribution="fixed", error_rate=0, seed=0))
+    pdf_routes.limiter.enabled = False
+    pdf_bytes = make_lab_report(pages=1, rows_per_page=8)
+
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for i in range(requests):
+            start = time.perf_counter()
+            response = await client.post("/upload-pdf", files={"file": (f"r{i}.pdf", pdf_bytes, "application/pdf")})
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+        print(f"Server-Timing: {response.headers.get('server-timing')}")
+    return statistics.median(latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Metrics instrumentation overhead")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fake LLM latency")
+    args = parser.parse_args()
+
+    cost = instrumentation_cost(args.iterations)
+    p50 = asyncio.run(request_time(args.requests, args.latency_ms))
+    overhead = cost / p50
+    print(f"Instrumentation per request: {cost * 1e6:.1f} µs")
+    print(f"/upload-pdf p50:             {p50 * 1000:.2f} ms")
+    print(f"Overhead:                    {overhead:.3%} (budget {BUDGET:.0%}) -> {'OK' if overhead < BUDGET else 'OVER BUDGET'}")
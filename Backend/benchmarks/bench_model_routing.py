@@ -0,0 +1,127 @@
+# benchmarks/bench_model_routing.py
+# Latency and token savings of the model router on a corpus of sample reports
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_model_routing --reports 60 --full-latency-ms 1200 --light-latency-ms 400
+#
+# Builds a mixed corpus (single-panel all-normal reports, small reports with a
+# few values out of range, two-page panels and long multi-page reports),
+# extracts each once, then analyzes the whole corpus twice with fake backends:
+# every report on the full tier, and every report on the tier route_document
+# picks. The analysis cache is off so every report reaches its tier.
+#
+# The fake backend counts input tokens from the prompt actually sent; its
+# answer is canned, so output tokens do not reflect the shorter answers the
+# short prompt asks for (real savings are larger).
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("AI_BACKEND", "fake")
+
+from benchmarks.sample_reports import make_lab_report
+from services.ai_backends import FakeBackend
+from services.ai_service import set_ai_backend
+from services.analysis_service import analyze_prompt_text
+from services.cache_service import analysis_cache
+from services.pdf_service import extract_for_analysis
+from services.routing_service import build_template_response, route_document
+
+# (share of the corpus, make_lab_report arguments)
+CORPUS_MIX = [
+    (0.4, dict(pages=1, rows_per_page=12, abnormal_rate=0.0)),
+    (0.3, dict(pages=1, rows_per_page=12, abnormal_rate=0.08)),
+    (0.2, dict(pages=2, rows_per_page=15, abnormal_rate=0.15)),
+    (0.1, dict(pages=8, rows_per_page=18, abnormal_rate=0.15)),
+]
+
+
+def build_corpus(reports: int) -> list[dict]:
+    documents = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for share, kwargs in CORPUS_MIX:
+            for _ in range(max(1, round(reports * share))):
+                path = os.path.join(tmp, f"{len(documents)}.pdf")
+                with open(path, "wb") as f:
+                    f.write(make_lab_report(**kwargs, seed=len(documents)))
+                documents.append(extract_for_analysis(path))
+    return documents
+
+
+async def analyze_corpus(documents: list[dict], routed: bool, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, tokens, tiers = [], [], {"template": 0, "light": 0, "full": 0}
+
+    async def analyze(document: dict):
+        async with semaphore:
+            start = time.perf_counter()
+            tier = route_document(document)["tier"] if routed else "full"
+            if tier == "template":
+                ai_response = build_template_response(document)
+            else:
+                ai_response, _ = await analyze_prompt_text(document["prompt_text"], tier)
+            latencies.append(time.perf_counter() - start)
+            tokens.append(ai_response["tokens"])
+            tiers[tier] += 1
+
+    await asyncio.gather(*(analyze(document) for document in documents))
+    latencies.sort()
+    return {
+        "tiers": tiers,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "input_tokens": sum(t["input"] for t in tokens),
+        "total_tokens": sum(t["total"] for t in tokens),
+    }
+
+
+def bench_router_overhead(documents: list[dict], repeat: int = 200) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for document in documents:
+            route_document(document)
+    return (time.perf_counter() - start) / (repeat * len(documents)) * 1e6
+
+
+async def main(reports: int, full_latency_ms: float, light_latency_ms: float, concurrency: int) -> None:
+    analysis_cache.enabled = False
+    set_ai_backend(FakeBackend(latency_ms=full_latency_ms))
+    set_ai_backend(FakeBackend(latency_ms=light_latency_ms, model_name="light"), tier="light")
+
+    documents = build_corpus(reports)
+    print(
+        f"Corpus: {len(documents)} reports | fake latency full {full_latency_ms:.0f} ms, "
+        f"light {light_latency_ms:.0f} ms | router {bench_router_overhead(documents):.1f} µs/report"
+    )
+
+    baseline = await analyze_corpus(documents, routed=False, concurrency=concurrency)
+    routed = await analyze_corpus(documents, routed=True, concurrency=concurrency)
+    for label, result in (("always full", baseline), ("routed", routed)):
+        tiers = ", ".join(f"{tier} {count}" for tier, count in result["tiers"].items())
+        print(
+            f"  {label:<12} p50 {result['p50_ms']:>7.1f} ms | p95 {result['p95_ms']:>7.1f} ms | "
+            f"mean {result['mean_ms']:>7.1f} ms | input tokens {result['input_tokens']:>7} | "
+            f"total tokens {result['total_tokens']:>7} | {tiers}"
+        )
+    print(
+        f"Savings: {1 - routed['total_tokens'] / baseline['total_tokens']:.0%} tokens, "
+        f"{1 - routed['mean_ms'] / baseline['mean_ms']:.0%} mean analysis latency"
+    )
+
+
+if __name__ == "__main__":
+    import logging
+
+    parser = argparse.ArgumentParser(description="Model routing latency/token benchmark")
+    parser.add_argument("--reports", type=int, default=60)
+    parser.add_argument("--full-latency-ms", type=float, default=1200)
+    parser.add_argument("--light-latency-ms", type=float, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    asyncio.run(main(args.reports, args.full_latency_ms, args.light_latency_ms, args.concurrency))
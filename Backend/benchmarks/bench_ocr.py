@@ -0,0 +1,103 @@
+# benchmarks/bench_ocr.py
+# Selective OCR: only scanned pages are rasterized and OCR'd, repeated scans come from the OCR cache
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_ocr --pages 10 --scanned 2 --repeats 3
+#
+# Three runs over the same report (text pages plus image-only scanned pages):
+#   every page  - OCR of all pages, as a blanket OCR pass would do
+#   selective   - only pages without a text layer, cold OCR cache
+#   cached      - the same upload again; scanned pages come from the cache
+# Without Tesseract (fitz.get_tessdata() fails) the engine is simulated: the
+# page is still rasterized at OCR_DPI, then --simulated-ms of CPU stand in
+# for Tesseract.
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("AI_BACKEND", "fake")
+
+import fitz
+
+from benchmarks.sample_reports import make_lab_report
+from services import pdf_service
+
+SIMULATED_SECONDS = 0.25
+
+
+def simulated_ocr_page(pdf_source: str | bytes, page_number: int, tessdata: str) -> tuple[str, list[str], float]:
+    """Stand-in for pdf_service.ocr_page: real rasterization, busy CPU instead of Tesseract."""
+    started = time.perf_counter()
+    with pdf_service.open_pdf(pdf_source) as pdf_document:
+        pdf_document[page_number].get_pixmap(dpi=pdf_service.OCR_DPI, colorspace=fitz.csGRAY)
+    while time.perf_counter() - started < SIMULATED_SECONDS:
+        pass
+    text = f"Hemoglobina 14.2 g/dL 12.0 - 16.0\nGlucosa 92 mg/dL 70 - 100\nPágina escaneada {page_number + 1}\n"
+    return text, text.splitlines(), time.perf_counter() - started
+
+
+async def time_extraction(path: str, repeats: int, clear_cache: bool) -> tuple[float, dict]:
+    samples = []
+    for _ in range(repeats):
+        if clear_cache:
+            pdf_service._ocr_cache.clear()
+        start = time.perf_counter()
+        document = await pdf_service.extract_for_analysis_async(path)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, document["extraction"]["ocr"]
+
+
+async def run(pages: int, scanned: int, repeats: int) -> None:
+    engine = "tesseract"
+    if pdf_service.tessdata_dir() is None:
+        engine = f"simulated ({SIMULATED_SECONDS * 1000:.0f} ms/page)"
+        pdf_service.tessdata_dir = lambda: "simulated"
+        pdf_service.ocr_page = simulated_ocr_page
+    # Start the page process pool outside the measurements
+    await asyncio.gather(*(
+        asyncio.get_running_loop().run_in_executor(pdf_service.get_page_executor(), time.sleep, 0)
+        for _ in range(pdf_service.PDF_PAGE_WORKERS)
+    ))
+    print(
+        f"{pages} text pages + {scanned} scanned, OCR at {pdf_service.OCR_DPI} dpi, engine {engine}, "
+        f"{pdf_service.PDF_PAGE_WORKERS} page workers ({os.cpu_count()} CPUs)"
+    )
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_bench_ocr_report.pdf")
+    with open(path, "wb") as f:
+        f.write(make_lab_report(pages=pages, scanned_pages=scanned))
+    try:
+        page_needs_ocr = pdf_service.page_needs_ocr
+        pdf_service.page_needs_ocr = lambda page, text: True
+        results = [("every page", *await time_extraction(path, repeats, clear_cache=True))]
+        pdf_service.page_needs_ocr = page_needs_ocr
+        results.append(("selective", *await time_extraction(path, repeats, clear_cache=True)))
+        results.append(("cached", *await time_extraction(path, repeats, clear_cache=False)))
+    finally:
+        os.remove(path)
+
+    for label, elapsed_ms, ocr in results:
+        page_ms = ocr["page_ms"]
+        print(
+            f"  {label:<11} {elapsed_ms:>8.1f} ms | OCR'd {ocr['ocr_pages']:>3}, cached {ocr['cached_pages']:>3}, "
+            f"share {ocr['ocr_share']:>6.1%} | per page "
+            + (f"median {statistics.median(page_ms):.1f} ms, max {max(page_ms):.1f} ms" if page_ms else "-")
+        )
+    pdf_service.shutdown_pdf_executor()
+
+
+if __name__ == "__main__":
+    import logging
+
+    parser = argparse.ArgumentParser(description="Selective OCR benchmark")
+    parser.add_argument("--pages", type=int, default=10, help="Pages with a text layer")
+    parser.add_argument("--scanned", type=int, default=2, help="Image-only pages")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--simulated-ms", type=float, default=250, help="OCR cost per page when Tesseract is missing")
+    args = parser.parse_args()
+    SIMULATED_SECONDS = args.simulated_ms / 1000
+    logging.disable(logging.WARNING)
+    asyncio.run(run(args.pages, args.scanned, args.repeats))
@@ -0,0 +1,103 @@
+# benchmarks/bench_password_hashing.py
+# Login burst vs. other database-backed requests: hashing on the shared threadpool vs. its own executor
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_password_hashing --logins 40 --probes 40
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("AI_BACKEND", "fake")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/bench.db"
+
+import httpx
+from werkzeug.security import check_password_hash
+
+from routes import auth as auth_routes
+from services import password_service
+from services.auth_cache_service import user_cache
+
+
+async def verify_on_shared_threadpool(password_hash: str, password: str) -> bool:
+    """The previous behaviour: hashing in the default executor shared with run_db and friends."""
+    return await asyncio.to_thread(check_password_hash, password_hash, password)
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[int(p / 100 * (len(ordered) - 1))] * 1000
+
+
+async def burst(http: httpx.AsyncClient, logins: int, probes: int, token: str) -> dict:
+    login_times, probe_times = [], []
+    rejected = 0
+
+    async def login():
+        nonlocal rejected
+        start = time.perf_counter()
+        response = await http.post("/auth/login", json={"email": "bench@example.com", "password": "pw"})
+        if response.status_code == 503:
+            rejected += 1
+            return
+        login_times.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+
+    async def probe(delay: float):
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        response = await http.get("/history?limit=5", headers={"Authorization": f"Bearer {token}"})
+        probe_times.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)), *(probe(i * 0.005) for i in range(probes)))
+    elapsed = time.perf_counter() - start
+    return {
+        "elapsed": elapsed,
+        "rejected": rejected,
+        "login_p50": percentile(login_times, 50),
+        "probe_p50": percentile(probe_times, 50),
+        "probe_p95": percentile(probe_times, 95),
+    }
+
+
+async def run(logins: int, probes: int) -> None:
+    from main import app
+    from models import init_db
+
+    init_db()
+    # Uncached user lookups so the probes really need a database thread
+    user_cache.enabled = False
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as http:
+        await http.post("/auth/register", json={"username": "bench", "email": "bench@example.com", "password": "pw"})
+        token = (await http.post("/auth/login", json={"email": "bench@example.com", "password": "pw"})).json()["access_token"]
+
+        print(f"{logins} logins ({password_service.current_hash_method()}) + {probes} GET /history probes:")
+        for label, verify in (
+            ("shared threadpool", verify_on_shared_threadpool),
+            ("hashing executor", password_service.verify_password),
+        ):
+            auth_routes.verify_password = verify
+            result = await burst(http, logins, probes, token)
+            print(
+                f"  {label:<18} burst {result['elapsed']:.2f}s | login p50 {result['login_p50']:.0f} ms "
+                f"({result['rejected']} rejected with 503) | "
+                f"GET /history p50 {result['probe_p50']:.1f} ms, p95 {result['probe_p95']:.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    import logging
+
+    parser = argparse.ArgumentParser(description="Password hashing isolation benchmark")
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--probes", type=int, default=40)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.logins, args.probes))
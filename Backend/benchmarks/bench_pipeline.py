@@ -0,0 +1,230 @@
+# benchmarks/bench_pipeline.py
+# End-to-end benchmark of the upload pipeline on synthetic lab reports (offline, fake AI backend)
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_pipeline                          # default scenarios
+#   python -m benchmarks.bench_pipeline --quick --output a.json  # smaller run, save results
+#   python -m benchmarks.bench_pipeline --compare a.json         # compare against a saved run
+#
+# For every scenario it reports:
+#   - end-to-end /upload-pdf latency (p50/p95/p99) and requests/second at a given concurrency
+#   - per-stage latency and peak Python memory: read, extract, prompt build, LLM, JSON parse
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+os.environ.setdefault("AI_BACKEND", "fake")
+os.environ.setdefault("ANALYSIS_CACHE_ENABLED", "false")  # every request must run the full pipeline
+
+import httpx
+from fastapi import UploadFile
+
+from benchmarks.sample_reports import make_lab_report
+
+SCENARIOS = [
+    {"name": "1p-sparse", "pages": 1, "rows_per_page": 8, "scanned_pages": 0, "concurrency": 1},
+    {"name": "2p-dense", "pages": 2, "rows_per_page": 30, "scanned_pages": 0, "concurrency": 4},
+    {"name": "10p-dense", "pages": 10, "rows_per_page": 30, "scanned_pages": 0, "concurrency": 4},
+    {"name": "5p+3scanned", "pages": 5, "rows_per_page": 20, "scanned_pages": 3, "concurrency": 4},
+    {"name": "2p-dense-c16", "pages": 2, "rows_per_page": 30, "scanned_pages": 0, "concurrency": 16},
+]
+
+STAGES = ["read", "extract", "prompt_build", "llm", "json_parse"]
+
+
+def percentiles(samples: list[float]) -> dict:
+    """p50/p95/p99/mean of a list of seconds, reported in milliseconds."""
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    ordered = sorted(samples)
+
+    def pick(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000, 2)
+
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99), "mean": round(statistics.mean(ordered) * 1000, 2)}
+
+
+def _upload_file(data: bytes) -> UploadFile:
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(data)
+    spooled.seek(0)
+    return UploadFile(file=spooled, filename="report.pdf")
+
+
+async def _measure_stage(samples: dict, peaks: dict, stage: str, fn, *args):
+    """Await/call fn, recording its duration and peak traced memory under stage."""
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    result = fn(*args)
+    if asyncio.iscoroutine(result):
+        result = await result
+    samples[stage].append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    peaks[stage] = max(peaks[stage], peak - base)
+    return result
+
+
+async def run_stages(pdf_bytes: bytes, iterations: int) -> dict:
+    """Run each pipeline stage directly, sequentially, to attribute time and memory."""
+    from routes.pdf import spool_pdf_upload
+    from services.ai_service import analyze_lab_results_async, build_prompt
+    from services.analysis_service import parse_analysis_response
+    from services.pdf_service import extract_for_analysis
+
+    samples = {stage: [] for stage in STAGES}
+    peaks = {stage: 0 for stage in STAGES}
+    tracemalloc.start()
+    try:
+        for _ in range(iterations):
+            upload = _upload_file(pdf_bytes)
+            pdf_path, _ = await _measure_stage(samples, peaks, "read", spool_pdf_upload, upload)
+            try:
+                document = await _measure_stage(samples, peaks, "extract", extract_for_analysis, pdf_path)
+            finally:
+                os.unlink(pdf_path)
+            await _measure_stage(samples, peaks, "prompt_build", build_prompt, document["prompt_text"])
+            ai_response = await _measure_stage(samples, peaks, "llm", analyze_lab_results_async, document["prompt_text"])
+            await _measure_stage(samples, peaks, "json_parse", parse_analysis_response, ai_response["text"])
+    finally:
+        tracemalloc.stop()
+
+    return {
+        stage: {**percentiles(samples[stage]), "peak_memory_kb": round(peaks[stage] / 1024, 1)}
+        for stage in STAGES
+    }
+
+
+async def run_end_to_end(client: httpx.AsyncClient, pdf_bytes: bytes, requests: int, concurrency: int) -> dict:
+    """Send requests to /upload-pdf with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/upload-pdf", files={"file": (f"report_{i}.pdf", pdf_bytes, "application/pdf")}
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "requests_per_second": round(requests / elapsed, 2),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+async def run(scenarios: list[dict], requests: int, iterations: int, latency_ms: float) -> dict:
+    from main import app
+    from routes import pdf as pdf_routes
+    from services.ai_backends import FakeBackend
+    from services.ai_service import set_ai_backend
+
+    set_ai_backend(FakeBackend(latency_ms=latency_ms, distribution="fixed", error_rate=0, seed=0))
+    pdf_routes.limiter.enabled = False
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for scenario in scenarios:
+            pdf_bytes = make_lab_report(
+                pages=scenario["pages"],
+                rows_per_page=scenario["rows_per_page"],
+                scanned_pages=scenario["scanned_pages"],
+            )
+            end_to_end = await run_end_to_end(client, pdf_bytes, requests, scenario["concurrency"])
+            stages = await run_stages(pdf_bytes, iterations)
+            results.append({
+                **scenario,
+                "pdf_size_kb": round(len(pdf_bytes) / 1024, 1),
+                "end_to_end": end_to_end,
+                "stages": stages,
+            })
+            print_scenario(results[-1])
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "fake_llm_latency_ms": latency_ms,
+        "requests_per_scenario": requests,
+        "stage_iterations": iterations,
+        "scenarios": results,
+    }
+
+
+def print_scenario(result: dict) -> None:
+    e2e = result["end_to_end"]
+    lat = e2e["latency_ms"]
+    print(
+        f"\n[{result['name']}] {result['pages']}p+{result['scanned_pages']} scanned, "
+        f"{result['rows_per_page']} rows/page, {result['pdf_size_kb']} KB, concurrency {e2e['concurrency']}"
+    )
+    print(
+        f"  end-to-end: p50 {lat['p50']} ms | p95 {lat['p95']} ms | p99 {lat['p99']} ms | "
+        f"{e2e['requests_per_second']} req/s | errors {e2e['errors']}"
+    )
+    for stage, data in result["stages"].items():
+        print(f"  {stage:<13} p50 {data['p50']:>9} ms | p95 {data['p95']:>9} ms | peak {data['peak_memory_kb']:>9} KB")
+
+
+def compare(current: dict, previous: dict) -> None:
+    """Print p50/p95 deltas per scenario and stage against a previous run."""
+    previous_by_name = {s["name"]: s for s in previous["scenarios"]}
+    print(f"\nComparison against run from {previous['timestamp']}:")
+    for scenario in current["scenarios"]:
+        before = previous_by_name.get(scenario["name"])
+        if before is None:
+            continue
+        rows = [("end_to_end", scenario["end_to_end"]["latency_ms"], before["end_to_end"]["latency_ms"])]
+        rows += [(stage, scenario["stages"][stage], before["stages"].get(stage, {})) for stage in STAGES]
+        print(f"  [{scenario['name']}]")
+        for label, now, then in rows:
+            deltas = []
+            for key in ("p50", "p95"):
+                if then.get(key):
+                    deltas.append(f"{key} {then[key]} -> {now[key]} ms ({(now[key] - then[key]) / then[key]:+.0%})")
+            print(f"    {label:<13} " + " | ".join(deltas))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload pipeline benchmark")
+    parser.add_argument("--requests", type=int, default=32, help="End-to-end requests per scenario")
+    parser.add_argument("--iterations", type=int, default=10, help="Stage-by-stage iterations per scenario")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Fake LLM latency")
+    parser.add_argument("--quick", action="store_true", help="Fewer requests and scenarios")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS[:3] if args.quick else SCENARIOS
+    requests = 8 if args.quick else args.requests
+    iterations = 3 if args.quick else args.iterations
+
+    report = asyncio.run(run(scenarios, requests, iterations, args.latency_ms))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
@@ -0,0 +1,41 @@
+# benchmarks/bench_prompt_tokens.py
+# Compares estimated prompt tokens: raw page text vs. the structured lab table
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_prompt_tokens
+
+import os
+
+os.environ.setdefault("AI_BACKEND", "fake")
+
+from benchmarks.sample_reports import make_lab_report
+
+REPORTS = [
+    ("1 page, 10 rows", dict(pages=1, rows_per_page=10)),
+    ("2 pages, 15 rows", dict(pages=2, rows_per_page=15)),
+    ("5 pages, 25 rows", dict(pages=5, rows_per_page=25)),
+    ("10 pages, 30 rows", dict(pages=10, rows_per_page=30)),
+]
+
+
+def run() -> None:
+    from services.ai_service import build_prompt, estimate_tokens
+    from services.pdf_service import extract_for_analysis
+
+    instructions = estimate_tokens(build_prompt(""))
+    print(f"Prompt instructions alone: ~{instructions} tokens\n")
+    print(f"{'Report':<20} {'mode':<11} {'rows':>5} {'conf':>6} {'raw tok':>8} {'table tok':>10} {'saved':>7}")
+    for label, kwargs in REPORTS:
+        document = extract_for_analysis(make_lab_report(**kwargs))
+        extraction = document["extraction"]
+        raw = extraction["raw_tokens_estimate"]
+        prompt = extraction["prompt_tokens_estimate"]
+        saved = 1 - prompt / raw if raw else 0
+        print(
+            f"{label:<20} {extraction['mode']:<11} {extraction['rows']:>5} {extraction['confidence']:>6} "
+            f"{raw:>8} {prompt:>10} {saved:>6.0%}"
+        )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,162 @@
+# benchmarks/bench_rate_limiter.py
+# Per-request cost of the shared rate limiter: client key, storage backends and a full GET /health
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_rate_limiter --iterations 5000
+#
+# Backends: memory:// (per process), sqlite:// (file shared by workers) and
+# webcheck-redis:// against benchmarks.fake_redis (network round trips of a
+# real server are not included). The last check forks several processes that
+# hit the same SQLite file, which is what several uvicorn workers do.
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("AI_BACKEND", "fake")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/bench.db"
+os.environ.setdefault("RATE_LIMIT_TRUSTED_PROXIES", "127.0.0.1")
+
+import httpx
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+from starlette.requests import Request
+
+from benchmarks.fake_redis import FakeRedis
+from routes.auth import create_access_token
+from services.auth_cache_service import user_cache
+from services.rate_limit_service import RedisCompatibleStorage, SQLiteStorage, limiter, rate_limit_key
+
+
+def summary(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    p50 = statistics.median(ordered) * 1e6
+    p95 = ordered[int(0.95 * (len(ordered) - 1))] * 1e6
+    return f"p50 {p50:>8.1f} µs | p95 {p95:>8.1f} µs"
+
+
+def make_request(headers: dict[str, str], client: str = "127.0.0.1") -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/health",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        "client": (client, 50000),
+    })
+
+
+def timed(fn, iterations: int) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def storages() -> dict:
+    return {
+        "memory": MemoryStorage(),
+        "sqlite": SQLiteStorage(f"sqlite:///{_tmp.name}/ratelimits.db"),
+        "redis (fake)": RedisCompatibleStorage("webcheck-redis://fake", client=FakeRedis()),
+    }
+
+
+def bench_keys(iterations: int) -> None:
+    token = create_access_token(1)
+    cases = {
+        "anonymous": make_request({}),
+        "X-Forwarded-For": make_request({"X-Forwarded-For": "203.0.113.7, 127.0.0.1"}),
+        "JWT (cached)": make_request({"Authorization": f"Bearer {token}"}),
+    }
+    print(f"rate_limit_key x {iterations}:")
+    for label, request in cases.items():
+        print(f"  {label:<18} {summary(timed(lambda: rate_limit_key(request), iterations))} -> {rate_limit_key(request)}")
+
+    def uncached():
+        user_cache.clear()
+        rate_limit_key(cases["JWT (cached)"])
+
+    print(f"  {'JWT (decode)':<18} {summary(timed(uncached, iterations))}")
+
+
+def bench_storages(iterations: int) -> None:
+    item = parse("1000000/minute")
+    print(f"fixed-window hit x {iterations} (one key per client, 100 clients):")
+    for label, storage in storages().items():
+        strategy = FixedWindowRateLimiter(storage)
+        counter = iter(range(10**9))
+        samples = timed(lambda: strategy.hit(item, f"user:{next(counter) % 100}"), iterations)
+        print(f"  {label:<18} {summary(samples)}")
+
+
+async def bench_requests(iterations: int) -> None:
+    from main import app
+    from models import init_db
+
+    init_db()
+    transport = httpx.ASGITransport(app=app)
+    print(f"GET /health x {iterations} (limiter counters reset every 50 requests, outside the timing):")
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        async def measure() -> list[float]:
+            samples = []
+            for i in range(iterations):
+                if i % 50 == 0:
+                    limiter.reset()
+                start = time.perf_counter()
+                response = await http.get("/health")
+                samples.append(time.perf_counter() - start)
+                response.raise_for_status()
+            return samples
+
+        await measure()  # warm-up
+        limiter.enabled = False
+        baseline = statistics.median(await measure())
+        print(f"  {'limiter disabled':<18} p50 {baseline * 1e6:>8.1f} µs")
+        limiter.enabled = True
+        for label, storage in storages().items():
+            limiter._storage = storage
+            limiter._limiter = FixedWindowRateLimiter(storage)
+            median = statistics.median(await measure())
+            print(f"  {label:<18} p50 {median * 1e6:>8.1f} µs (+{(median - baseline) * 1e6:.1f} µs)")
+
+
+def _worker(path: str, hits: int, allowed) -> None:
+    strategy = FixedWindowRateLimiter(SQLiteStorage(f"sqlite:///{path}"))
+    item = parse("10/minute")
+    count = sum(strategy.hit(item, "user:1") for _ in range(hits))
+    with allowed.get_lock():
+        allowed.value += count
+
+
+def bench_shared_workers(workers: int) -> None:
+    path = f"{_tmp.name}/shared.db"
+    SQLiteStorage(f"sqlite:///{path}")
+    allowed = multiprocessing.Value("i", 0)
+    processes = [multiprocessing.Process(target=_worker, args=(path, 10, allowed)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    print(f"{workers} worker processes x 10 hits against one 10/minute limit on sqlite: {allowed.value} allowed")
+
+
+if __name__ == "__main__":
+    import logging
+
+    parser = argparse.ArgumentParser(description="Rate limiter overhead benchmark")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    bench_keys(args.iterations)
+    bench_storages(args.iterations)
+    asyncio.run(bench_requests(max(1, args.iterations // 5)))
+    bench_shared_workers(args.workers)
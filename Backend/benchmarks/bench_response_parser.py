@@ -0,0 +1,96 @@
+# benchmarks/bench_response_parser.py
+# Previous json.loads + regex cascade vs. the single-pass LabAnalysis parser on typical AI replies
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_response_parser --iterations 2000
+#
+# For every reply shape the table shows which path handled it and the cost of
+# one parse. "usable" means the result has the five LabAnalysis fields with
+# the real analysis in them (not the plain-text fallback), i.e. the user did
+# not need to upload the report again. AI error payloads no longer reach the
+# parser (raise_for_ai_error answers 502 first); that row shows what the old
+# path turned them into: a 200 with no analysis.
+
+import argparse
+import json
+import os
+import re
+import statistics
+import time
+
+os.environ.setdefault("AI_BACKEND", "fake")
+
+from services.ai_backends import DEFAULT_FAKE_RESPONSE
+from services.analysis_service import parse_analysis_response
+from services.metrics_service import AI_RESPONSES
+
+FIELDS = set(DEFAULT_FAKE_RESPONSE)
+
+
+def previous_parser(text: str) -> tuple[dict, str]:
+    """The parser before the schema: json.loads, greedy regex, then a regex-cleaned fallback."""
+    try:
+        return json.loads(text), "json"
+    except json.JSONDecodeError:
+        match = re.search(r'\{[\s\S]*\}', text)
+        if match:
+            try:
+                return json.loads(match.group()), "extracted"
+            except json.JSONDecodeError:
+                pass
+        cleaned = re.sub(r'^[\s\{]*"?\w+"?\s*:\s*"?', '', text)
+        cleaned = re.sub(r'"\s*,?\s*"?\w+"?\s*:\s*"?', '\n\n', cleaned)
+        cleaned = re.sub(r'"\s*\}?\s*$', '', cleaned)
+        return {"resultadosSimplificados": cleaned.replace('\\n', '\n').strip()}, "fallback"
+
+
+def new_parser(text: str) -> tuple[dict, str]:
+    """parse_analysis_response, with the outcome it recorded in webcheck_ai_responses_total."""
+    before = dict(AI_RESPONSES._values)
+    result = parse_analysis_response(text)
+    (outcome,) = next(key for key, count in AI_RESPONSES._values.items() if count > before.get(key, 0))
+    return result, outcome
+
+
+def replies() -> dict[str, str]:
+    analysis = dict(DEFAULT_FAKE_RESPONSE, resultadosSimplificados="Tu **hemoglobina** está \"normal\".\n" * 40)
+    clean = json.dumps(analysis, ensure_ascii=False)
+    return {
+        "clean JSON": clean,
+        "markdown fence": f"```json\n{clean}\n```",
+        "text around": f"Aquí está el análisis:\n{clean}\nEspero que sea útil.",
+        "raw newlines": clean.replace("\\n", "\n"),
+        "truncated": clean[: len(clean) - 40],
+        "field missing": json.dumps({key: value for key, value in analysis.items() if key != "errorMessage"}),
+        "AI error payload": json.dumps({"error": "No se pudo generar el análisis.", "details": 'quota "exceeded"'}),
+    }
+
+
+def usable(result: dict) -> bool:
+    return FIELDS <= result.keys() and not result["interpretacionConceptos"].startswith("⚠️")
+
+
+def measure(parser, text: str, iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        parser(text)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+if __name__ == "__main__":
+    import logging
+
+    parser = argparse.ArgumentParser(description="AI response parser benchmark")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'reply':<18} {'previous':>28} {'schema parser':>28}")
+    for label, text in replies().items():
+        row = [f"{label:<18}"]
+        for parse, timed_parse in ((previous_parser, previous_parser), (new_parser, parse_analysis_response)):
+            result, path = parse(text)
+            row.append(f"{path:>10} {'usable' if usable(result) else 'broken':>7} {measure(timed_parse, text, args.iterations):>6.1f} µs")
+        print(" ".join(row))
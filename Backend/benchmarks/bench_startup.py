@@ -0,0 +1,98 @@
+# benchmarks/bench_startup.py
+# Worker cold start: time to import main and to finish the lifespan startup, with a budget check
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_startup --repeats 5 --budget-ms 2500
+#
+# Every sample is a fresh interpreter (a new worker), on a temporary SQLite
+# database whose tables already exist, as for every worker after the first
+# deployment. Scenarios:
+#   default      - schema check on startup, clients created on first use
+#   schema off   - DB_CREATE_SCHEMA_ON_STARTUP=false (schema created once by `python -m models`)
+#   warm-up      - STARTUP_WARMUP=true (AI client, PDF executor, Tesseract lookup at startup)
+# Exits with status 1 when the median import + startup time of the default
+# scenario is over --budget-ms; tests/test_startup.py asserts the same budget.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Median import + startup time of the default scenario
+DEFAULT_BUDGET_MS = 2500
+
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+import main  # builds the app through create_app()
+imported = time.perf_counter()
+
+async def start():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+ready = asyncio.run(start())
+print(json.dumps({"import_ms": (imported - started) * 1000, "startup_ms": (ready - imported) * 1000}))
+"""
+
+SCENARIOS = {
+    "default": {},
+    "schema off": {"DB_CREATE_SCHEMA_ON_STARTUP": "false"},
+    "warm-up": {"STARTUP_WARMUP": "true"},
+}
+
+
+def sample(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], env=env, capture_output=True, text=True, check=True, cwd=BACKEND_DIR,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def prepare_env(tmp: str) -> dict:
+    """Environment of a worker on a temporary SQLite database whose tables already exist."""
+    env = dict(
+        os.environ,
+        AI_BACKEND=os.environ.get("AI_BACKEND", "fake"),
+        DATABASE_URL=f"sqlite:///{tmp}/startup.db",
+        JOB_STORAGE_DIR=os.path.join(tmp, "jobs"),
+        PYTHONWARNINGS="ignore",
+    )
+    subprocess.run([sys.executable, "-m", "models"], env=env, capture_output=True, check=True, cwd=BACKEND_DIR)
+    return env
+
+
+def median_total_ms(env: dict, repeats: int) -> float:
+    """Median import + startup time over `repeats` fresh interpreters."""
+    return statistics.median(s["import_ms"] + s["startup_ms"] for s in (sample(env) for _ in range(repeats)))
+
+
+def run(repeats: int, budget_ms: float) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        base_env = prepare_env(tmp)
+        print(f"{repeats} fresh interpreters per scenario (median)")
+        within_budget = True
+        for label, overrides in SCENARIOS.items():
+            samples = [sample({**base_env, **overrides}) for _ in range(repeats)]
+            import_ms = statistics.median(s["import_ms"] for s in samples)
+            startup_ms = statistics.median(s["startup_ms"] for s in samples)
+            total_ms = statistics.median(s["import_ms"] + s["startup_ms"] for s in samples)
+            line = f"  {label:<11} import {import_ms:>7.1f} ms | startup {startup_ms:>7.1f} ms | total {total_ms:>7.1f} ms"
+            if label == "default":
+                within_budget = total_ms <= budget_ms
+                line += f" | budget {budget_ms:.0f} ms: {'ok' if within_budget else 'EXCEEDED'}"
+            print(line)
+    return within_budget
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker startup time benchmark")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="Maximum median import + startup time")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.repeats, args.budget_ms) else 1)
@@ -0,0 +1,134 @@
+# benchmarks/bench_token_budget.py
+# Token budget admission: cost of the check, cost of a batched ledger flush, and fairness under a heavy user
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_token_budget --subjects 10000 --heavy-requests 200
+#
+# admission - estimate + reserve + charge for one request, with --subjects users in the ledger
+# flush     - one batched UPSERT of --subjects users' usage plus the refresh of today's totals
+# fairness  - one user fires --heavy-requests analyses at once while 20 light users send 5 each,
+#             under a global budget that only fits part of it: without a per-user budget the
+#             heavy user drains it; with one, the light users are still served
+# Uses a throwaway SQLite database, never webcheck.db.
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/usage.db"
+os.environ.setdefault("AI_BACKEND", "fake")
+
+from benchmarks.sample_reports import ANALYTES
+from models import init_db
+from services.ai_backends import FakeBackend
+from services.ai_service import analyze_lab_results_async, set_ai_backend
+from services.usage_service import TokenLedger, estimate_request_tokens
+
+
+def report_text(rows: int, seed: int) -> str:
+    rng = random.Random(seed)
+    lines = ["LABORATORIO CLÍNICO SAN RAFAEL", "Paciente: María López   Fecha: 12/03/2026"]
+    for analyte, unit, low, high in rng.choices(ANALYTES, k=rows):
+        lines.append(f"{analyte} {rng.uniform(low, high or 10):.1f} {unit} {low:g}-{high:g}")
+    return "\n".join(lines)
+
+
+def bench_admission(subjects: int, iterations: int) -> None:
+    ledger = TokenLedger(user_budget=300_000, global_budget=10**12)
+    ledger._committed = {f"user:{i}": random.randint(0, 200_000) for i in range(subjects)}
+    text = report_text(40, 0)
+    response = {"tokens": {"input": 2500, "output": 1200, "total": 3700}}
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        reservation = ledger.try_reserve(f"user:{i % subjects}", estimate_request_tokens(text))
+        if reservation is not None:
+            reservation.charge(response, cache_hit=False)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    print(
+        f"admission ({subjects} subjects in the ledger, {len(text)} chars of text): "
+        f"p50 {samples[len(samples) // 2] * 1e6:.1f} µs | p99 {samples[int(len(samples) * 0.99)] * 1e6:.1f} µs"
+    )
+
+
+async def bench_flush(subjects: int) -> None:
+    ledger = TokenLedger(user_budget=300_000, global_budget=0)
+    response = {"tokens": {"input": 2500, "output": 1200, "total": 3700}}
+    for i in range(subjects):
+        ledger.try_reserve(f"user:{i}", 1000).charge(response, cache_hit=False)
+    start = time.perf_counter()
+    await ledger.flush()
+    first = time.perf_counter() - start
+    for i in range(subjects):
+        ledger.try_reserve(f"user:{i}", 1000).charge(response, cache_hit=False)
+    start = time.perf_counter()
+    await ledger.flush()
+    second = time.perf_counter() - start
+    print(f"flush of {subjects} subjects: {first * 1000:.1f} ms (inserts), {second * 1000:.1f} ms (increments)")
+
+
+async def fairness(user_budget: int, global_budget: int, heavy_requests: int) -> dict:
+    ledger = TokenLedger(user_budget=user_budget, global_budget=global_budget)
+    served = {"heavy": 0, "light": 0}
+    rejected = {"heavy": 0, "light": 0}
+    tokens = {"heavy": 0, "light": 0}
+
+    async def analyze(kind: str, subject: str, seed: int):
+        text = report_text(30, seed)
+        try:
+            async with ledger.reserve(subject, text) as reservation:
+                ai_response = await analyze_lab_results_async(text)
+                reservation.charge(ai_response, cache_hit=False)
+        except Exception:
+            rejected[kind] += 1
+            return
+        served[kind] += 1
+        tokens[kind] += ai_response["tokens"]["total"]
+
+    async def light_user(i: int):
+        for j in range(5):
+            await asyncio.sleep(0.05)
+            await analyze("light", f"user:light{i}", 1000 + i * 5 + j)
+
+    await asyncio.gather(
+        *(analyze("heavy", "user:heavy", seed) for seed in range(heavy_requests)),
+        *(light_user(i) for i in range(20)),
+    )
+    return {"served": served, "rejected": rejected, "tokens": tokens}
+
+
+async def main(subjects: int, iterations: int, heavy_requests: int) -> None:
+    init_db()
+    bench_admission(subjects, iterations)
+    await bench_flush(subjects)
+
+    set_ai_backend(FakeBackend(latency_ms=50))
+    global_budget = 100 * estimate_request_tokens(report_text(30, 0))
+    print(f"fairness: global budget {global_budget} tokens, {heavy_requests} heavy + 20x5 light requests")
+    for label, user_budget in (("no per-user budget", 0), ("per-user budget", global_budget // 10)):
+        result = await fairness(user_budget, global_budget, heavy_requests)
+        print(
+            f"  {label:<19} heavy served {result['served']['heavy']:>3} / rejected {result['rejected']['heavy']:>3} | "
+            f"light served {result['served']['light']:>3} / rejected {result['rejected']['light']:>3} | "
+            f"tokens heavy {result['tokens']['heavy']}, light {result['tokens']['light']}"
+        )
+
+
+if __name__ == "__main__":
+    import logging
+
+    parser = argparse.ArgumentParser(description="Token budget admission benchmark")
+    parser.add_argument("--subjects", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--heavy-requests", type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    try:
+        asyncio.run(main(args.subjects, args.iterations, args.heavy_requests))
+    finally:
+        _tmp.cleanup()
@@ -0,0 +1,153 @@
+# benchmarks/bench_trends.py
+# "My hemoglobin over the last two years": scanning results_json blobs vs. the analyte observation index
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_trends --reports 3000 --users 3
+#
+# Seeds users with thousands of saved analyses (each payload with its
+# lab_results rows and a realistic analysis text), builds the observation
+# table with the backfill job, then times one trend query both ways.
+# Uses a throwaway SQLite database, never webcheck.db.
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/trends.db"
+os.environ.setdefault("AI_BACKEND", "fake")
+
+from sqlalchemy import text
+from sqlalchemy.orm import undefer
+
+from benchmarks.sample_reports import ANALYTES
+from models import AnalysisResult, SessionLocal, User, engine, init_db
+from services.trends_service import analyte_code, backfill_observations, query_trend
+
+
+def make_payload(i: int, rng: random.Random, rows_per_report: int, sampled_at: datetime) -> dict:
+    """An /upload-pdf payload with its parsed lab rows (~8 KB)."""
+    rows = []
+    for analyte, unit, low, high in rng.sample(ANALYTES, rows_per_report):
+        value = round(rng.uniform(low * 0.8, high * 1.2 if high else 10), 1)
+        flag = "H" if value > high else "L" if value < low else ""
+        rows.append({"analito": analyte, "valor": str(value), "unidad": unit, "referencia": f"{low:g}-{high:g}", "bandera": flag})
+    return {
+        "message": "PDF procesado correctamente",
+        "filename": f"reporte_{i}.pdf",
+        "pages": 2,
+        "lab_results": {"rows": rows, "metadata": {"fecha": sampled_at.strftime("%d/%m/%Y")}},
+        "analysis_result": {
+            "isValid": True,
+            "interpretacionConceptos": "Hallazgo simulado. " * 120,
+            "resultadosSimplificados": "Explicación simulada. " * 100,
+            "resumenEjecutivo": "Resumen simulado. " * 30,
+        },
+    }
+
+
+def seed(users: int, reports: int, rows_per_report: int) -> int:
+    rng = random.Random(0)
+    db = SessionLocal()
+    accounts = [User(username=f"user{i}", email=f"user{i}@example.com", password_hash="x") for i in range(users)]
+    db.add_all(accounts)
+    db.commit()
+    now = datetime.now(timezone.utc)
+    for user in accounts:
+        rows = []
+        for i in range(reports):
+            # Reports spread over the last five years
+            sampled_at = now - timedelta(days=5 * 365 * (reports - i) / reports)
+            rows.append({
+                "user_id": user.id,
+                "filename": f"reporte_{i}.pdf",
+                "results_json": make_payload(i, rng, rows_per_report, sampled_at),
+                "created_at": sampled_at,
+            })
+        db.execute(AnalysisResult.__table__.insert(), rows)
+        db.commit()
+    user_id = accounts[0].id
+    db.close()
+    return user_id
+
+
+def scan_blobs(db, user_id: int, code: str, since: datetime) -> list[tuple]:
+    """Without the index: load every saved payload of the user and filter in Python."""
+    points = []
+    entries = db.query(AnalysisResult).options(undefer(AnalysisResult.results_json)).filter(
+        AnalysisResult.user_id == user_id
+    ).all()
+    for entry in entries:
+        lab_results = entry.results_json.get("lab_results", {})
+        observed_at = datetime.strptime(lab_results["metadata"]["fecha"], "%d/%m/%Y")
+        if observed_at < since:
+            continue
+        for row in lab_results["rows"]:
+            if analyte_code(row["analito"]) == code:
+                points.append((observed_at, row["valor"]))
+    return sorted(points)
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def run(users: int, reports: int, rows_per_report: int, repeat: int) -> None:
+    init_db()
+    start = time.perf_counter()
+    user_id = seed(users, reports, rows_per_report)
+    print(f"Seeded {users} users x {reports} reports x {rows_per_report} rows in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    stats = backfill_observations()
+    elapsed = time.perf_counter() - start
+    print(
+        f"Backfill: {stats['results']} analyses -> {stats['observations']} observations in {elapsed:.1f}s "
+        f"({stats['results'] / elapsed:.0f} analyses/s)"
+    )
+
+    db = SessionLocal()
+    plan = db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT observed_at, value FROM analyte_observations "
+        "WHERE user_id = 1 AND analyte_code = 'hemoglobina' AND observed_at >= '2020-01-01' "
+        "AND observed_at <= '2100-01-01' ORDER BY observed_at DESC LIMIT 1001"
+    )).all()
+    print("Query plan: " + " | ".join(row[-1] for row in plan))
+
+    until = datetime.now(timezone.utc)
+    since = until - timedelta(days=730)
+    trend = query_trend(db, user_id, "Hemoglobina", since, until, 1000)
+    blob_points = scan_blobs(db, user_id, "hemoglobina", since.replace(tzinfo=None))
+    indexed_ms = timed(lambda: query_trend(db, user_id, "Hemoglobina", since, until, 1000), repeat)
+    blob_ms = timed(lambda: scan_blobs(db, user_id, "hemoglobina", since.replace(tzinfo=None)), max(1, repeat // 5))
+    db.close()
+    engine.dispose()
+
+    print(f"\nHemoglobina, last 2 years ({len(trend['points'])} points; blob scan found {len(blob_points)}):")
+    print(f"  scan results_json blobs:     {blob_ms:>9.2f} ms")
+    print(f"  GET /trends (indexed range): {indexed_ms:>9.2f} ms ({blob_ms / indexed_ms:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    import logging
+
+    parser = argparse.ArgumentParser(description="Per-analyte trend query benchmark")
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--reports", type=int, default=3000, help="Saved analyses per user")
+    parser.add_argument("--rows", type=int, default=15, help="Lab rows per report")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    try:
+        run(args.users, args.reports, args.rows, args.repeat)
+    finally:
+        _tmp.cleanup()
@@ -0,0 +1,170 @@
+# benchmarks/bench_upload_memory.py
+# Compares peak RSS per upload: whole-body read vs. chunked spooling to disk
+#
+# Usage (from the Backend folder):
+#   python -m benchmarks.bench_upload_memory --size-mb 9
+#
+# Every variant runs in a fresh interpreter, so PyMuPDF's native allocations
+# (invisible to tracemalloc) are counted and one variant's peak never hides
+# another's. The child imports the upload path and extracts a small PDF first;
+# "growth" is the peak RSS over the RSS after that warm-up (the peak is reset
+# through /proc/self/clear_refs where the kernel allows it).
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+os.environ.setdefault("AI_BACKEND", "fake")
+
+from benchmarks.bench_concurrent_uploads import make_sample_pdf
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VARIANTS = {
+    "legacy": "read() + extract(bytes)",
+    "spool": "spool + extract(path)",
+}
+
+CHILD = """
+import asyncio, json, sys
+from benchmarks.bench_upload_memory import current_rss_mb, peak_rss_mb, reset_peak_rss, run_variant, warm_up
+warm_up()
+baseline = current_rss_mb()
+reset_peak_rss()
+result = asyncio.run(run_variant(sys.argv[1], sys.argv[2]))
+peak = peak_rss_mb()
+print(json.dumps({"result": result, "baseline_mb": baseline, "peak_mb": peak, "growth_mb": peak - baseline}))
+"""
+
+
+def _proc_status_mb(field: str) -> float | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_mb() -> float:
+    rss = _proc_status_mb("VmRSS")
+    return rss if rss is not None else peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (VmHWM, or ru_maxrss where /proc is missing)."""
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def reset_peak_rss() -> None:
+    """Reset VmHWM to the current RSS (Linux only; elsewhere the peak includes the warm-up)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def make_padded_pdf(size_mb: float) -> bytes:
+    """Build a PDF of roughly size_mb by embedding incompressible data."""
+    import fitz  # PyMuPDF
+
+    doc = fitz.open(stream=make_sample_pdf(), filetype="pdf")
+    doc.embfile_add("padding.bin", os.urandom(int(size_mb * 1024 * 1024)))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def make_upload(pdf_path: str):
+    """Build an UploadFile as Starlette hands it to the route (body already spooled, 1 MB in memory at most)."""
+    import shutil
+    from fastapi import UploadFile
+
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    with open(pdf_path, "rb") as f:
+        shutil.copyfileobj(f, spooled)
+    spooled.seek(0)
+    return UploadFile(file=spooled, filename="report.pdf")
+
+
+def warm_up() -> None:
+    """Import the upload path and extract a small PDF, so the measured peak is the upload alone."""
+    from routes.pdf import spool_pdf_upload  # noqa: F401
+    from services.pdf_service import extract_text_from_pdf
+
+    extract_text_from_pdf(make_sample_pdf())
+
+
+async def run_variant(variant: str, pdf_path: str) -> str:
+    """Handle one upload of pdf_path the legacy or the spooled way; returns the page count or the HTTP error."""
+    from fastapi import HTTPException
+    from config import MAX_FILE_SIZE_MB
+    from routes.pdf import spool_pdf_upload
+    from services.pdf_service import extract_text_from_pdf
+
+    upload = make_upload(pdf_path)
+    try:
+        if variant == "legacy":
+            pdf_bytes = await upload.read()
+            if len(pdf_bytes) > MAX_FILE_SIZE_MB * 1024 * 1024:
+                raise HTTPException(status_code=413)
+            return f"{extract_text_from_pdf(pdf_bytes)[1]} pages"
+        spooled_path, _ = await spool_pdf_upload(upload)
+        try:
+            return f"{extract_text_from_pdf(spooled_path)[1]} pages"
+        finally:
+            os.unlink(spooled_path)
+    except HTTPException as e:
+        return f"HTTP {e.status_code}"
+
+
+def measure(variant: str, pdf_path: str) -> dict:
+    """Run one variant in a fresh interpreter; returns result, baseline_mb, peak_mb and growth_mb."""
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, variant, pdf_path],
+        env=dict(os.environ, AI_BACKEND=os.environ.get("AI_BACKEND", "fake"), PYTHONWARNINGS="ignore"),
+        capture_output=True, text=True, check=True, cwd=BACKEND_DIR,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(size_mb: float) -> None:
+    from config import MAX_FILE_SIZE_MB
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = {}
+        for label, upload_mb in (("accepted", size_mb), ("oversized", MAX_FILE_SIZE_MB * 2)):
+            inputs[label] = os.path.join(tmp, f"{label}.pdf")
+            with open(inputs[label], "wb") as f:
+                f.write(make_padded_pdf(upload_mb))
+
+        print(
+            f"Accepted upload: {os.path.getsize(inputs['accepted']) / (1024 * 1024):.2f} MB | "
+            f"Oversized: {os.path.getsize(inputs['oversized']) / (1024 * 1024):.2f} MB (fresh interpreter per run)"
+        )
+        for label, pdf_path in inputs.items():
+            for variant, description in VARIANTS.items():
+                sample = measure(variant, pdf_path)
+                print(
+                    f"{description + ' ' + label:<38} peak RSS: {sample['peak_mb']:7.2f} MB  "
+                    f"growth: {sample['growth_mb']:6.2f} MB  -> {sample['result']}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload memory benchmark")
+    parser.add_argument("--size-mb", type=float, default=9.0)
+    args = parser.parse_args()
+    run(args.size_mb)
@@ -0,0 +1,93 @@
+# benchmarks/fake_redis.py
+# In-process stand-in for the redis-py client, covering the commands RedisCompatibleStorage uses
+
+import fnmatch
+import threading
+import time
+
+
+class FakeRedis:
+    """Thread-safe dict with per-key deadlines; enough of redis-py for the rate limiter."""
+
+    def __init__(self):
+        self._values: dict[str, int] = {}
+        self._deadlines: dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def _expire_if_due(self, key: str) -> None:
+        deadline = self._deadlines.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._values.pop(key, None)
+            self._deadlines.pop(key, None)
+
+    def set(self, key: str, value, ex: int | None = None, nx: bool = False):
+        with self._lock:
+            self._expire_if_due(key)
+            if nx and key in self._values:
+                return None
+            self._values[key] = int(value)
+            if ex is not None:
+                self._deadlines[key] = time.monotonic() + ex
+            else:
+                self._deadlines.pop(key, None)
+            return True
+
+    def incrby(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            self._expire_if_due(key)
+            self._values[key] = self._values.get(key, 0) + amount
+            return self._values[key]
+
+    def get(self, key: str):
+        with self._lock:
+            self._expire_if_due(key)
+            value = self._values.get(key)
+            return None if value is None else str(value).encode()
+
+    def pttl(self, key: str) -> int:
+        with self._lock:
+            self._expire_if_due(key)
+            if key not in self._values:
+                return -2
+            deadline = self._deadlines.get(key)
+            return -1 if deadline is None else int((deadline - time.monotonic()) * 1000)
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            removed = 0
+            for key in keys:
+                removed += self._values.pop(key, None) is not None
+                self._deadlines.pop(key, None)
+            return removed
+
+    def scan_iter(self, match: str = "*"):
+        with self._lock:
+            keys = [key for key in self._values if fnmatch.fnmatchcase(key, match)]
+        yield from keys
+
+    def ping(self) -> bool:
+        return True
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Queues commands and runs them under the client's lock, like MULTI/EXEC."""
+
+    def __init__(self, client: FakeRedis):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name: str):
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self) -> list:
+        with self._client._lock:
+            results = [getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in self._commands]
+        self._commands = []
+        return results
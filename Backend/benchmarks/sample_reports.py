@@ -0,0 +1,108 @@
+# benchmarks/sample_reports.py
+# Synthetic lab-report PDFs with a realistic layout (letterhead, patient banner, result table, footer)
+
+import random
+import fitz  # PyMuPDF
+
+# (analyte, unit, low, high)
+ANALYTES = [
+    ("Hemoglobina", "g/dL", 12.0, 16.0),
+    ("Hematocrito", "%", 36.0, 46.0),
+    ("Eritrocitos", "10^6/uL", 4.2, 5.4),
+    ("Leucocitos", "10^3/uL", 4.5, 11.0),
+    ("Plaquetas", "10^3/uL", 150.0, 400.0),
+    ("VCM", "fL", 80.0, 100.0),
+    ("HCM", "pg", 27.0, 33.0),
+    ("Neutrófilos", "%", 40.0, 70.0),
+    ("Linfocitos", "%", 20.0, 40.0),
+    ("Glucosa", "mg/dL", 70.0, 100.0),
+    ("Urea", "mg/dL", 15.0, 45.0),
+    ("Creatinina", "mg/dL", 0.6, 1.2),
+    ("Colesterol total", "mg/dL", 0.0, 200.0),
+    ("Triglicéridos", "mg/dL", 0.0, 150.0),
+    ("Colesterol HDL", "mg/dL", 40.0, 60.0),
+    ("Colesterol LDL", "mg/dL", 0.0, 130.0),
+    ("TGO (AST)", "U/L", 5.0, 40.0),
+    ("TGP (ALT)", "U/L", 7.0, 56.0),
+    ("Ácido úrico", "mg/dL", 3.4, 7.0),
+    ("Sodio", "mmol/L", 135.0, 145.0),
+    ("Potasio", "mmol/L", 3.5, 5.1),
+    ("TSH", "uUI/mL", 0.4, 4.0),
+]
+
+LEGAL_FOOTER = (
+    "Este reporte es confidencial y está dirigido exclusivamente al paciente y a su médico tratante. "
+    "Los resultados deben ser interpretados por un profesional de la salud."
+)
+
+
+def _value_for(low: float, high: float, rng: random.Random, abnormal_rate: float) -> float:
+    if rng.random() < abnormal_rate:
+        return round(high * rng.uniform(1.1, 1.6) if high else rng.uniform(1, 10), 1)
+    return round(rng.uniform(low, high) if high else rng.uniform(1, 10), 1)
+
+
+def make_lab_report(
+    pages: int = 2,
+    rows_per_page: int = 15,
+    abnormal_rate: float = 0.15,
+    scanned_pages: int = 0,
+    seed: int = 0,
+) -> bytes:
+    """
+    Build a synthetic lab report PDF.
+
+    Args:
+        pages: Number of pages with a text layer
+        rows_per_page: Result rows per page (table density)
+        abnormal_rate: Share of values outside their reference range
+        scanned_pages: Extra image-only pages with no text layer (scan-like)
+        seed: Random seed so runs are comparable
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+
+    for page_num in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 50), "LABORATORIO CLÍNICO SAN RAFAEL", fontsize=14)
+        page.insert_text((72, 66), "Av. Reforma 123, Col. Centro   Tel. 555-123-4567   www.labsanrafael.mx", fontsize=8)
+        page.insert_text((72, 90), "Paciente: María López Hernández", fontsize=10)
+        page.insert_text((330, 90), "Edad: 52 años", fontsize=10)
+        page.insert_text((430, 90), "Sexo: F", fontsize=10)
+        page.insert_text((72, 104), "Médico: Dr. Juan Ramírez", fontsize=10)
+        page.insert_text((330, 104), "Fecha: 12/03/2026", fontsize=10)
+        page.insert_text((72, 128), "BIOMETRÍA HEMÁTICA Y QUÍMICA SANGUÍNEA", fontsize=11)
+
+        # Result table: each column is written separately, like most lab report generators
+        y = 150
+        for label, x in (("Estudio", 72), ("Resultado", 250), ("Unidades", 330), ("Valores de referencia", 420)):
+            page.insert_text((x, y), label, fontsize=9)
+        for row in range(rows_per_page):
+            y += 18
+            analyte, unit, low, high = ANALYTES[(page_num * rows_per_page + row) % len(ANALYTES)]
+            value = _value_for(low, high, rng, abnormal_rate)
+            reference = f"< {high:g}" if low == 0 else f"{low:g} - {high:g}"
+            page.insert_text((72, y), analyte + " " + "." * 20, fontsize=9)
+            page.insert_text((250, y), f"{value:g}", fontsize=9)
+            page.insert_text((330, y), unit, fontsize=9)
+            page.insert_text((420, y), reference, fontsize=9)
+
+        page.insert_text((72, 770), LEGAL_FOOTER[:95], fontsize=7)
+        page.insert_text((72, 780), LEGAL_FOOTER[95:], fontsize=7)
+        page.insert_text((500, 800), f"Página {page_num + 1} de {pages + scanned_pages}", fontsize=8)
+
+    for _ in range(scanned_pages):
+        # Render a text page to pixels and insert it as an image: no text layer remains
+        source = fitz.open()
+        src_page = source.new_page()
+        for row in range(rows_per_page):
+            analyte, unit, low, high = ANALYTES[row % len(ANALYTES)]
+            src_page.insert_text((72, 100 + row * 18), f"{analyte}   {_value_for(low, high, rng, abnormal_rate):g}   {unit}")
+        pixmap = src_page.get_pixmap(dpi=100)
+        source.close()
+        page = doc.new_page()
+        page.insert_image(page.rect, pixmap=pixmap)
+
+    data = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return data
@@ -7,29 +7,170 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-# Gemini API Configuration
+# AI Backend Configuration
+AI_BACKEND = os.getenv('AI_BACKEND', 'gemini')  # "gemini" or "fake" (offline, for load testing/CI)
+
+# Gemini API Configuration (the key is checked when the Gemini client is created, not at import)
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY no encontrada en variables de entorno")
 
 # CORS Configuration
 CORS_ORIGINS = ["*"]  # TODO: Change to specific origins in production
 
 #DB Configuration
-DATABASE_URL = "sqlite:///./webcheck.db"  # SQLite database URL
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./webcheck.db')  # Any SQLAlchemy URL (sqlite, postgresql, ...)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))  # Persistent connections per worker
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))  # Extra connections allowed under bursts
+DB_POOL_TIMEOUT_SECONDS = int(os.getenv('DB_POOL_TIMEOUT_SECONDS', '30'))  # Wait for a free connection before failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))  # Wait on a locked database instead of failing
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')  # WAL lets readers run while a write is in progress
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # NORMAL is durable enough with WAL and much faster than FULL
+# Async sessions for the auth/history routes (needs aiosqlite for SQLite or asyncpg for PostgreSQL, plus greenlet)
+DB_ASYNC_ENABLED = os.getenv('DB_ASYNC_ENABLED', 'false').lower() == 'true'
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')  # Defaults to DATABASE_URL with the async driver
+
+# Create missing tables/indexes when a worker starts; with several workers set it to false
+# and run `python -m models` once per deployment instead
+DB_CREATE_SCHEMA_ON_STARTUP = os.getenv('DB_CREATE_SCHEMA_ON_STARTUP', 'true').lower() == 'true'
 
 # JWT Authentication Configuration
 JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'change-me-in-production')
 JWT_ALGORITHM = 'HS256'
 JWT_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('JWT_ACCESS_TOKEN_EXPIRE_MINUTES', '60'))
+# Claims-only mode puts username/email in the token so get_current_user never queries the database
+# (changes to a user are not seen until their token expires)
+AUTH_CLAIMS_ONLY = os.getenv('AUTH_CLAIMS_ONLY', 'false').lower() == 'true'
+
+# Password Hashing Configuration
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')  # werkzeug method; older hashes are upgraded on login
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))  # Dedicated hashing threads
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))  # Queued + running hashes before 503
+
+# Authenticated User Cache Configuration (decoded tokens and user records, per worker)
+AUTH_CACHE_ENABLED = os.getenv('AUTH_CACHE_ENABLED', 'true').lower() == 'true'
+AUTH_CACHE_MAX_ITEMS = int(os.getenv('AUTH_CACHE_MAX_ITEMS', '1024'))  # Entries per cache (tokens, users)
+AUTH_CACHE_TTL_SECONDS = int(os.getenv('AUTH_CACHE_TTL_SECONDS', '60'))  # Bounds how stale a cached user can be
 
 # File Upload Configuration
 MAX_FILE_SIZE_MB = 10  # Maximum file size in megabytes
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+MIN_FILE_SIZE_BYTES = 100  # Smaller files are empty or corrupted
+UPLOAD_CHUNK_SIZE_BYTES = 256 * 1024  # Uploads are streamed to disk in chunks of this size
+MAX_REQUEST_SIZE_BYTES = MAX_FILE_SIZE_BYTES + 64 * 1024  # File plus multipart overhead
+
+# Batch Upload Configuration
+MAX_BATCH_FILES = int(os.getenv('MAX_BATCH_FILES', '20'))  # Files per /upload-pdfs request
+MAX_BATCH_SIZE_MB = int(os.getenv('MAX_BATCH_SIZE_MB', '50'))  # Total size of a batch request
+MAX_BATCH_REQUEST_SIZE_BYTES = MAX_BATCH_SIZE_MB * 1024 * 1024 + 64 * 1024
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '5'))  # Files of one batch analyzed at once
 
 # Rate Limiting Configuration
-RATE_LIMIT_UPLOADS = "5/minute"  # Maximum 5 uploads per minute per IP
-RATE_LIMIT_GENERAL = "60/minute"  # Maximum 60 requests per minute per IP
+# Limits apply per authenticated user, or per client IP for anonymous requests
+RATE_LIMIT_UPLOADS = "5/minute"  # Maximum 5 uploads per minute per user/IP
+RATE_LIMIT_GENERAL = "60/minute"  # Maximum 60 requests per minute per user/IP
+RATE_LIMIT_BATCH_UPLOADS = "3/minute"  # Maximum 3 batch uploads per minute per user/IP (a batch counts once)
+RATE_LIMIT_STORAGE_URI = os.getenv('RATE_LIMIT_STORAGE_URI', 'memory://')  # memory:// (per process), sqlite:///./ratelimits.db or webcheck-redis://host:6379/0 (shared by all workers)
+RATE_LIMIT_TRUSTED_PROXIES = [
+    ip.strip() for ip in os.getenv('RATE_LIMIT_TRUSTED_PROXIES', '').split(',') if ip.strip()
+]  # Proxy addresses allowed to set X-Forwarded-For (e.g. "127.0.0.1,10.0.0.2")
 
 # Model Configuration
 GEMINI_MODEL = "gemini-2.5-flash"
+
+# Model Routing Configuration (cheap local signals pick the analysis path: template, light or full)
+ROUTER_ENABLED = os.getenv('ROUTER_ENABLED', 'true').lower() == 'true'  # false = every report takes the full path
+ROUTER_LIGHT_MODEL = os.getenv('ROUTER_LIGHT_MODEL', 'gemini-2.5-flash-lite')  # Light tier model; empty = GEMINI_MODEL with the short prompt
+ROUTER_TEMPLATE_ENABLED = os.getenv('ROUTER_TEMPLATE_ENABLED', 'true').lower() == 'true'  # All-normal reports answered locally, no AI call
+ROUTER_SIMPLE_MAX_PAGES = int(os.getenv('ROUTER_SIMPLE_MAX_PAGES', '3'))  # Longer reports always take the full path
+ROUTER_TEMPLATE_MAX_ROWS = int(os.getenv('ROUTER_TEMPLATE_MAX_ROWS', '40'))  # Lab rows listed in a templated answer
+ROUTER_LIGHT_MAX_PROMPT_TOKENS = int(os.getenv('ROUTER_LIGHT_MAX_PROMPT_TOKENS', '2000'))  # Document tokens (estimated) for the light tier
+ROUTER_LIGHT_MAX_ABNORMAL_ROWS = int(os.getenv('ROUTER_LIGHT_MAX_ABNORMAL_ROWS', '3'))  # More out-of-range values take the full path
+
+# Fake AI Backend Configuration (AI_BACKEND=fake)
+FAKE_AI_LATENCY_MS = float(os.getenv('FAKE_AI_LATENCY_MS', '1500'))  # Mean simulated latency
+FAKE_AI_LATENCY_STDDEV_MS = float(os.getenv('FAKE_AI_LATENCY_STDDEV_MS', '0'))
+FAKE_AI_LATENCY_DISTRIBUTION = os.getenv('FAKE_AI_LATENCY_DISTRIBUTION', 'fixed')  # fixed, uniform, normal, lognormal
+FAKE_AI_ERROR_RATE = float(os.getenv('FAKE_AI_ERROR_RATE', '0'))  # Share of calls that fail (0-1)
+FAKE_AI_RESPONSE_FILE = os.getenv('FAKE_AI_RESPONSE_FILE')  # JSON file with a canned response (or a list of them)
+FAKE_AI_STREAM_CHUNKS = int(os.getenv('FAKE_AI_STREAM_CHUNKS', '4'))
+FAKE_AI_SEED = int(os.getenv('FAKE_AI_SEED')) if os.getenv('FAKE_AI_SEED') else None
+
+# AI Call Resilience Configuration (deadlines, retries, hedging, circuit breaker)
+AI_CALL_TIMEOUT_SECONDS = float(os.getenv('AI_CALL_TIMEOUT_SECONDS', '60'))  # Deadline per attempt
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', '2'))  # Extra attempts after a retryable error (timeout, 429, 5xx)
+AI_RETRY_BASE_DELAY_SECONDS = float(os.getenv('AI_RETRY_BASE_DELAY_SECONDS', '0.5'))  # Doubles per retry, full jitter
+AI_RETRY_MAX_DELAY_SECONDS = float(os.getenv('AI_RETRY_MAX_DELAY_SECONDS', '8'))
+AI_HEDGE_ENABLED = os.getenv('AI_HEDGE_ENABLED', 'false').lower() == 'true'  # Second request when the first is slow
+AI_HEDGE_PERCENTILE = float(os.getenv('AI_HEDGE_PERCENTILE', '95'))  # Hedge after this latency percentile
+AI_HEDGE_MIN_SAMPLES = int(os.getenv('AI_HEDGE_MIN_SAMPLES', '20'))  # Successful calls observed before hedging
+AI_BREAKER_FAILURE_RATE = float(os.getenv('AI_BREAKER_FAILURE_RATE', '0.5'))  # Failure share that opens the circuit
+AI_BREAKER_MIN_CALLS = int(os.getenv('AI_BREAKER_MIN_CALLS', '10'))  # Calls in the window before it can open
+AI_BREAKER_WINDOW_SECONDS = float(os.getenv('AI_BREAKER_WINDOW_SECONDS', '60'))
+AI_BREAKER_OPEN_SECONDS = float(os.getenv('AI_BREAKER_OPEN_SECONDS', '30'))  # Fail fast (503) this long before a probe
+
+# Structured Lab Extraction Configuration
+LAB_PARSER_ENABLED = os.getenv('LAB_PARSER_ENABLED', 'true').lower() == 'true'
+LAB_PARSER_MIN_CONFIDENCE = float(os.getenv('LAB_PARSER_MIN_CONFIDENCE', '0.6'))  # Parsed rows / candidate lines
+LAB_PARSER_MIN_ROWS = int(os.getenv('LAB_PARSER_MIN_ROWS', '3'))  # Below this, fall back to raw text
+
+# OCR Configuration (scanned pages without a text layer; Tesseract through PyMuPDF, TESSDATA_PREFIX if not on PATH)
+OCR_ENABLED = os.getenv('OCR_ENABLED', 'true').lower() == 'true'
+OCR_DPI = int(os.getenv('OCR_DPI', '200'))  # Rasterization resolution of scanned pages
+OCR_LANGUAGE = os.getenv('OCR_LANGUAGE', 'spa+eng')  # Tesseract languages
+OCR_MIN_TEXT_CHARS = int(os.getenv('OCR_MIN_TEXT_CHARS', '20'))  # Pages with an image and less text than this are OCR'd
+OCR_MAX_PAGES = int(os.getenv('OCR_MAX_PAGES', '50'))  # Scanned pages OCR'd per document
+OCR_CACHE_MAX_ITEMS = int(os.getenv('OCR_CACHE_MAX_ITEMS', '512'))  # OCR results kept by page image hash
+
+# Text Compaction Configuration (repeated headers/footers, whitespace, dot leaders)
+TEXT_COMPACTION_ENABLED = os.getenv('TEXT_COMPACTION_ENABLED', 'true').lower() == 'true'
+REPEATED_LINE_MIN_PAGE_RATIO = float(os.getenv('REPEATED_LINE_MIN_PAGE_RATIO', '0.6'))  # Share of pages a line must appear on
+
+# Concurrency Configuration
+PDF_EXECUTOR_TYPE = os.getenv('PDF_EXECUTOR_TYPE', 'thread')  # "thread" or "process"
+PDF_EXECUTOR_WORKERS = int(os.getenv('PDF_EXECUTOR_WORKERS', '4'))  # Workers for PDF text extraction
+MAX_CONCURRENT_AI_CALLS = int(os.getenv('MAX_CONCURRENT_AI_CALLS', '8'))  # Simultaneous Gemini requests per worker
+
+# Large Report Configuration (page-parallel extraction, sectioned analysis)
+MAX_PDF_PAGES = int(os.getenv('MAX_PDF_PAGES', '300'))  # Longer PDFs are rejected with 400
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '16'))  # Below this, pages are read in one task
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '10'))  # Page range handled by each extraction process
+PDF_PAGE_WORKERS = int(os.getenv('PDF_PAGE_WORKERS', str(os.cpu_count() or 2)))  # Processes for page ranges
+AI_SECTION_THRESHOLD_TOKENS = int(os.getenv('AI_SECTION_THRESHOLD_TOKENS', '12000'))  # Longer prompts are split
+AI_SECTION_MAX_TOKENS = int(os.getenv('AI_SECTION_MAX_TOKENS', '8000'))  # Document tokens per section
+AI_MAX_SECTIONS = int(os.getenv('AI_MAX_SECTIONS', '8'))  # More sections than this is rejected with 400
+
+# Token Budget Configuration (daily AI tokens per user/IP and for the whole deployment; 0 = unlimited)
+TOKEN_DAILY_BUDGET_PER_USER = int(os.getenv('TOKEN_DAILY_BUDGET_PER_USER', '300000'))  # Authenticated user, or client IP
+TOKEN_DAILY_BUDGET_GLOBAL = int(os.getenv('TOKEN_DAILY_BUDGET_GLOBAL', '10000000'))  # Keep under the Gemini quota
+TOKEN_ESTIMATED_OUTPUT_TOKENS = int(os.getenv('TOKEN_ESTIMATED_OUTPUT_TOKENS', '2000'))  # Expected answer size per AI call
+TOKEN_ADMISSION_WAIT_SECONDS = float(os.getenv('TOKEN_ADMISSION_WAIT_SECONDS', '10'))  # Wait for in-flight calls to settle before 429
+TOKEN_USAGE_FLUSH_SECONDS = float(os.getenv('TOKEN_USAGE_FLUSH_SECONDS', '5'))  # Batched ledger writes, also refreshes other workers' usage
+
+# Analysis Cache Configuration
+ANALYSIS_CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', 'true').lower() == 'true'
+ANALYSIS_CACHE_MEMORY_ITEMS = int(os.getenv('ANALYSIS_CACHE_MEMORY_ITEMS', '256'))  # In-memory LRU entries
+ANALYSIS_CACHE_MAX_ROWS = int(os.getenv('ANALYSIS_CACHE_MAX_ROWS', '5000'))  # Persistent (SQLite) entries
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv('ANALYSIS_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))  # 7 days
+ANALYSIS_CACHE_TOUCH_SECONDS = int(os.getenv('ANALYSIS_CACHE_TOUCH_SECONDS', '60'))  # A hit rewrites last_accessed_at (LRU order) only when older than this
+
+# Background Job Queue Configuration
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))  # In-process workers running the analysis pipeline
+JOB_QUEUE_MAX_DEPTH = int(os.getenv('JOB_QUEUE_MAX_DEPTH', '100'))  # Queued jobs (all workers, counted in the database) before returning 503
+JOB_MAX_PENDING_PER_CLIENT = int(os.getenv('JOB_MAX_PENDING_PER_CLIENT', '5'))  # Pending jobs per user/IP before 429
+JOB_STORAGE_DIR = os.getenv('JOB_STORAGE_DIR', './job_uploads')  # Uploaded PDFs waiting to be processed
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '120'))  # A processing job whose worker stops renewing it this long is re-queued
+
+# Observability Configuration
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'true').lower() == 'true'  # Per-stage Server-Timing response header
+
+# Startup Configuration
+# Create the AI client and PDF executor during startup instead of on the first request
+STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', 'false').lower() == 'true'
+
+# Analysis History Configuration
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '20'))  # Default items per GET /history page
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', '100'))
+
+# Analyte Trends Configuration (per-analyte observations of saved analyses)
+TRENDS_DEFAULT_DAYS = int(os.getenv('TRENDS_DEFAULT_DAYS', '730'))  # Window of GET /trends/{analyte} without ?since=
+TRENDS_MAX_POINTS = int(os.getenv('TRENDS_MAX_POINTS', '1000'))  # Observations returned per trend request
+OBSERVATIONS_BACKFILL_BATCH_SIZE = int(os.getenv('OBSERVATIONS_BACKFILL_BATCH_SIZE', '500'))  # Saved analyses per backfill transaction
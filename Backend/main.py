@@ -1,97 +1,187 @@
 # main.py
-# Application entry point - FastAPI setup and router registration
+# Application entry point - FastAPI app factory, lifespan and router registration
 
+import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, Request
+from fastapi import APIRouter, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from fastapi.responses import JSONResponse, PlainTextResponse
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
 # database and models
-from models import User, AnalysisResult, init_db
+from models import close_db, init_db
 
-from config import CORS_ORIGINS, GEMINI_API_KEY
+from config import (
+    AI_BACKEND, CORS_ORIGINS, DB_CREATE_SCHEMA_ON_STARTUP, GEMINI_API_KEY, MAX_BATCH_REQUEST_SIZE_BYTES,
+    MAX_BATCH_SIZE_MB, MAX_FILE_SIZE_MB, MAX_REQUEST_SIZE_BYTES, RATE_LIMIT_GENERAL, SERVER_TIMING_ENABLED,
+    STARTUP_WARMUP
+)
 from routes.auth import router as auth_router
 from routes.pdf import router as pdf_router
+from routes.jobs import router as jobs_router
+from routes.history import router as history_router
+from routes.trends import router as trends_router
+from routes.usage import router as usage_router
+from services.ai_service import AI_TIERS, get_ai_backend
+from services.job_service import job_queue
+from services.metrics_service import RATE_LIMIT_HITS, ServerTimingMiddleware, render_metrics
+from services.password_service import get_password_executor, shutdown_password_executor
+from services.rate_limit_service import limiter
+from services.resilience_service import ai_breaker
+from services.usage_service import token_ledger
+from services.pdf_service import get_pdf_executor, shutdown_pdf_executor, tessdata_dir
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+API_VERSION = "0.1.0"
 
-# Initialize FastAPI
-app = FastAPI(
-    title="HealthCheck API",
-    description="AI-powered laboratory results interpreter",
-    version="0.1.0"
-)
+router = APIRouter()
 
-# Initialize database
-init_db()
-
-# Create database tables on startup
-@app.on_event("startup")
-async def startup_db():
-    """Initialize database tables on application startup."""
-    init_db()
-
-# Add rate limiter to app state
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=CORS_ORIGINS,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-# Register routers
-app.include_router(auth_router)
-app.include_router(pdf_router)
-
-
-# Startup Event
-@app.on_event("startup")
-async def startup_event():
-    """Display startup banner with API information."""
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    gemini_status = "Connected" if GEMINI_API_KEY else "Not configured"
-    
-    banner = f"""
-╔══════════════════════════════════════════════════════════════╗
-║                      HEALTHCHECK API                         ║
-╠══════════════════════════════════════════════════════════════╣
-║  Version: 0.1.0                                              ║
-║  Status:  Running                                            ║
-║  Time:    {current_time:<46}     ║
-╠══════════════════════════════════════════════════════════════╣
-║  ENDPOINTS:                                                  ║
-║    • GET  /health          - Health check                    ║
-║    • POST /upload-pdf      - Upload & analyze PDF            ║
-╠══════════════════════════════════════════════════════════════╣
-║  CONFIGURATION:                                              ║
-║    • Gemini AI: {gemini_status:<43}  ║
-║    • Rate Limit: 60 requests/minute                          ║
-║    • CORS: Enabled                                           ║
-╚══════════════════════════════════════════════════════════════╝
+def _gemini_status() -> str:
+    if AI_BACKEND == "fake":
+        return "Fake"
+    return "Up" if GEMINI_API_KEY else "Down"
+
+
+def warm_up() -> None:
+    """Create the AI clients, the PDF and hashing executors and the Tesseract lookup before the first request needs them."""
+    for tier in AI_TIERS:
+        get_ai_backend(tier)
+    get_pdf_executor()
+    get_password_executor()
+    tessdata_dir()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     """
-    print(banner)
-    logger.info("HealthCheck API started successfully")
+    Per-worker startup and shutdown.
 
+    Startup creates the schema (unless DB_CREATE_SCHEMA_ON_STARTUP is off and
+    `python -m models` ran once for the deployment), starts the job workers
+    and the token ledger and, with STARTUP_WARMUP, creates the heavy clients. Otherwise they are
+    created on first use.
+    """
+    started = time.perf_counter()
+    if DB_CREATE_SCHEMA_ON_STARTUP:
+        await asyncio.to_thread(init_db)
+    # Start the background job workers and the token ledger flush once the tables exist
+    await job_queue.start()
+    await token_ledger.start()
+    if STARTUP_WARMUP:
+        await asyncio.to_thread(warm_up)
+    app.state.startup_seconds = time.perf_counter() - started
 
-@app.get("/health")
-@limiter.limit("60/minute")
+    if AI_BACKEND == "gemini" and not GEMINI_API_KEY:
+        logger.warning("⚠️ GEMINI_API_KEY no configurada: los análisis fallarán hasta definirla")
+    logger.info(
+        f"🚀 HealthCheck API {API_VERSION} lista en {app.state.startup_seconds * 1000:.0f} ms | "
+        f"Gemini: {_gemini_status()} | Esquema: {'creado' if DB_CREATE_SCHEMA_ON_STARTUP else 'omitido'} | "
+        f"Warm-up: {'sí' if STARTUP_WARMUP else 'no'}"
+    )
+    try:
+        yield
+    finally:
+        # Release the job workers, flush the token ledger, then the PDF extraction and password hashing pools and the database pools
+        await job_queue.stop()
+        await token_ledger.stop()
+        shutdown_pdf_executor()
+        shutdown_password_executor()
+        await close_db()
+
+
+async def rate_limit_exceeded(request: Request, exc: RateLimitExceeded):
+    """Count the rejection in /metrics, then answer with slowapi's default 429."""
+    route = request.scope.get("route")
+    RATE_LIMIT_HITS.inc(endpoint=route.path if route else request.url.path)
+    return _rate_limit_exceeded_handler(request, exc)
+
+
+# Reject oversized uploads from the declared Content-Length, before the body is read
+async def reject_oversized_requests(request: Request, call_next):
+    content_length = request.headers.get("content-length")
+    is_batch = request.url.path == "/upload-pdfs"
+    max_size = MAX_BATCH_REQUEST_SIZE_BYTES if is_batch else MAX_REQUEST_SIZE_BYTES
+    if content_length and content_length.isdigit() and int(content_length) > max_size:
+        max_size_mb = MAX_BATCH_SIZE_MB if is_batch else MAX_FILE_SIZE_MB
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"El archivo es demasiado grande. Tamaño máximo: {max_size_mb}MB."}
+        )
+    return await call_next(request)
+
+
+@router.get("/health")
+@limiter.limit(RATE_LIMIT_GENERAL)
 async def health_check(request: Request):
-    """Health check endpoint for monitoring."""
+    """Health check endpoint for monitoring (includes the AI circuit breaker state)."""
     timestamp = datetime.now().strftime("%H:%M:%S")
     client_ip = request.client.host
-    gemini_status = "Up" if GEMINI_API_KEY else "Down"
-    
-    logger.info(f"[{timestamp}] Health Check | IP: {client_ip} | Gemini: {gemini_status} | Status: OK")
-    return {"status": "healthy", "message": "API is operational"}
\ No newline at end of file
+    gemini_status = _gemini_status()
+    ai_circuit = ai_breaker.snapshot()
+    status = "healthy" if ai_circuit["state"] == "closed" else "degraded"
+
+    logger.info(f"[{timestamp}] Health Check | IP: {client_ip} | Gemini: {gemini_status} | Circuit: {ai_circuit['state']} | Status: {status}")
+    return {"status": status, "message": "API is operational", "ai_circuit": ai_circuit}
+
+
+@router.get("/metrics")
+async def metrics():
+    """Stage latency histograms and token/fallback/rejection counters in Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def create_app() -> FastAPI:
+    """
+    Build the FastAPI application.
+
+    Importing this module only builds the app: no database, AI client or
+    executor work happens until the lifespan startup or the first request,
+    so workers can be pre-forked cheaply (`uvicorn main:create_app --factory`
+    or the module-level `app`).
+    """
+    app = FastAPI(
+        title="HealthCheck API",
+        description="AI-powered laboratory results interpreter",
+        version=API_VERSION,
+        lifespan=lifespan,
+    )
+
+    # Add the shared rate limiter (also used by the routers) to app state
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded)
+
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ORIGINS,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Server-Timing"],
+    )
+
+    # Report per-stage durations (read, extract, prompt_build, llm, json_parse) in a Server-Timing header
+    if SERVER_TIMING_ENABLED:
+        app.add_middleware(ServerTimingMiddleware)
+
+    app.middleware("http")(reject_oversized_requests)
+
+    # Register routers
+    app.include_router(router)
+    app.include_router(auth_router)
+    app.include_router(pdf_router)
+    app.include_router(jobs_router)
+    app.include_router(history_router)
+    app.include_router(trends_router)
+    app.include_router(usage_router)
+    return app
+
+
+app = create_app()
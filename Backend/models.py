@@ -1,9 +1,14 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, create_engine
+import asyncio
+from sqlalchemy import Column, Integer, Float, String, Date, DateTime, JSON, ForeignKey, Index, create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.orm import deferred, relationship, sessionmaker
 from datetime import datetime, timezone
 from werkzeug.security import generate_password_hash, check_password_hash
-from config import DATABASE_URL
+from config import (
+    ASYNC_DATABASE_URL, DATABASE_URL, DB_ASYNC_ENABLED, DB_MAX_OVERFLOW, DB_POOL_SIZE, DB_POOL_TIMEOUT_SECONDS,
+    PASSWORD_HASH_METHOD, SQLITE_BUSY_TIMEOUT_MS, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS
+)
 
 Base = declarative_base()
 
@@ -22,7 +27,7 @@ class User(Base):
     results = relationship('AnalysisResult', back_populates='user', cascade='all, delete-orphan')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -34,22 +39,167 @@ class AnalysisResult(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     filename = Column(String(255), nullable=False)
-    results_json = Column(JSON, nullable=False)
+    # Full /upload-pdf payload; deferred so history listings never load it
+    results_json = deferred(Column(JSON, nullable=False))
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     
     # Relationship back to user
     user = relationship('User', back_populates='results')
+    
+    # Keyset pagination of a user's history: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+    __table_args__ = (
+        Index('ix_analysis_results_user_created', 'user_id', 'created_at'),
+    )
+
+
+# One lab value of a saved analysis, so per-analyte trends never read the results_json blobs
+class AnalyteObservation(Base):
+    __tablename__ = 'analyte_observations'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    result_id = Column(Integer, ForeignKey('analysis_results.id', ondelete='CASCADE'), nullable=False, index=True)
+    analyte_code = Column(String(80), nullable=False)  # Normalized name, e.g. "hemoglobina"
+    analyte_name = Column(String(120), nullable=False)  # As printed in the report
+    value = Column(Float, nullable=True)  # None when the printed value is not numeric
+    value_text = Column(String(40), nullable=False)
+    unit = Column(String(40), nullable=False, default='')
+    reference_low = Column(Float, nullable=True)
+    reference_high = Column(Float, nullable=True)
+    reference_text = Column(String(60), nullable=False, default='')
+    flag = Column(String(8), nullable=False, default='')
+    observed_at = Column(DateTime, nullable=False)  # Sample date of the report, else when it was analyzed
+    
+    # Trend of one analyte: WHERE user_id = ? AND analyte_code = ? AND observed_at BETWEEN ? AND ?
+    __table_args__ = (
+        Index('ix_analyte_observations_user_code_date', 'user_id', 'analyte_code', 'observed_at'),
+    )
+
+
+# Daily AI token consumption per subject ("user:<id>", "ip:<address>", or "*" for the whole deployment)
+class TokenUsage(Base):
+    __tablename__ = 'token_usage'
+    
+    subject = Column(String(120), primary_key=True)
+    day = Column(Date, primary_key=True, index=True)  # UTC
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    requests = Column(Integer, nullable=False, default=0)
+
+
+# Persistent tier of the analysis cache, keyed by normalized text + model + prompt version
+class AnalysisCacheEntry(Base):
+    __tablename__ = 'analysis_cache'
+    
+    cache_key = Column(String(64), primary_key=True)
+    model = Column(String(80), nullable=False)
+    prompt_version = Column(String(20), nullable=False)
+    response_json = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    last_accessed_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+
+
+# Background analysis job (POST /jobs), persisted so queued work survives restarts
+class AnalysisJob(Base):
+    __tablename__ = 'analysis_jobs'
+    
+    id = Column(String(32), primary_key=True)
+    status = Column(String(20), nullable=False, default='queued')  # queued, processing, completed, failed
+    client_key = Column(String(120), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'), nullable=True)  # Authenticated submitter; the result goes to their history
+    filename = Column(String(255), nullable=False)
+    file_path = Column(String(500), nullable=False)
+    file_size = Column(Integer, nullable=False)
+    result_json = Column(JSON, nullable=True)
+    error_message = Column(String(1000), nullable=True)
+    error_status_code = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    worker_id = Column(String(120), nullable=True)  # Worker process that claimed the job
+    lease_expires_at = Column(DateTime, nullable=True)  # Renewed while the worker is alive; stale leases are re-queued
+    
+    __table_args__ = (
+        Index('ix_analysis_jobs_status_created', 'status', 'created_at'),
+        Index('ix_analysis_jobs_client_status', 'client_key', 'status'),
+    )
+
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _engine_options(url: str) -> dict:
+    """Driver and pool options for an engine on url."""
+    parsed = make_url(url)
+    options = {}
+    if _is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+        # In-memory databases use a single shared connection, so there is no pool to size
+        if parsed.database in (None, "", ":memory:"):
+            return options
+    else:
+        options["pool_pre_ping"] = True
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT_SECONDS)
+    return options
+
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """Apply the SQLite pragmas to every new connection (WAL, synchronous, busy timeout, foreign keys)."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    # Off by default in SQLite; needed for the ON DELETE CASCADE of analyte_observations
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def _async_url(url: str) -> str:
+    """DATABASE_URL with its async driver (sqlite -> aiosqlite, postgresql -> asyncpg)."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    drivers = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+    if backend not in drivers:
+        raise ValueError(f"No hay driver asíncrono configurado para {backend}; define ASYNC_DATABASE_URL")
+    return parsed.set(drivername=f"{backend}+{drivers[backend]}").render_as_string(hide_password=False)
 
 
 # Create engine and session factory
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+if _is_sqlite(DATABASE_URL):
+    event.listen(engine, "connect", _configure_sqlite_connection)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional async engine (DB_ASYNC_ENABLED) so request handlers await the database instead of holding a thread
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC_ENABLED:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    _async_database_url = ASYNC_DATABASE_URL or _async_url(DATABASE_URL)
+    async_engine = create_async_engine(_async_database_url, **_engine_options(_async_database_url))
+    if _is_sqlite(_async_database_url):
+        event.listen(async_engine.sync_engine, "connect", _configure_sqlite_connection)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 
 # Create tables
 def init_db():
     """Initialize the database by creating all tables."""
     Base.metadata.create_all(bind=engine)
+    # create_all skips columns and indexes added to tables that already exist
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 
 # Dependency to get database session
@@ -58,4 +208,38 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def _run_in_session(fn, *args):
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+async def run_db(fn, *args):
+    """
+    Run fn(session, *args) from async code.
+    
+    With DB_ASYNC_ENABLED the session is an AsyncSession driven through run_sync,
+    so no threadpool worker is held; otherwise fn runs in a thread with a sync session.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            return await session.run_sync(fn, *args)
+    return await asyncio.to_thread(_run_in_session, fn, *args)
+
+
+async def close_db():
+    """Release pooled connections on shutdown."""
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    # One-off schema creation for deployments with DB_CREATE_SCHEMA_ON_STARTUP=false
+    init_db()
+    print(f"Esquema creado en {make_url(DATABASE_URL).render_as_string(hide_password=True)}")
\ No newline at end of file
@@ -7,13 +7,18 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from pydantic import BaseModel
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from config import JWT_ACCESS_TOKEN_EXPIRE_MINUTES, JWT_ALGORITHM, JWT_SECRET_KEY
-from models import User, get_db
+from config import AUTH_CLAIMS_ONLY, JWT_ACCESS_TOKEN_EXPIRE_MINUTES, JWT_ALGORITHM, JWT_SECRET_KEY
+from models import User, run_db
+from services.auth_cache_service import CurrentUser, user_cache
+from services.password_service import hash_password, needs_rehash, verify_password
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 
 class RegisterRequest(BaseModel):
@@ -32,57 +37,101 @@ class TokenResponse(BaseModel):
     token_type: str = "bearer"
 
 
-def create_access_token(user_id: int) -> str:
+def create_access_token(user_id: int, username: str | None = None, email: str | None = None) -> str:
     expires_delta = timedelta(minutes=JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
     expire = datetime.now(timezone.utc) + expires_delta
     payload = {"sub": str(user_id), "exp": expire}
+    # Claims-only mode: the token carries everything get_current_user returns
+    if AUTH_CLAIMS_ONLY and username and email:
+        payload.update(username=username, email=email)
     return jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
 
 
-@router.post("/register", status_code=status.HTTP_201_CREATED)
-def register_user(payload: RegisterRequest, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.email == payload.email).first()
-    if existing_user:
-        raise HTTPException(status_code=400, detail="El correo ya está registrado")
+def _find_conflict(db: Session, username: str, email: str) -> str | None:
+    """One lookup over the unique email/username indexes; returns the error for a taken email or username."""
+    rows = db.query(User.email, User.username).filter(
+        or_(User.email == email, User.username == username)
+    ).all()
+    if any(row.email == email for row in rows):
+        return "El correo ya está registrado"
+    if rows:
+        return "El nombre de usuario ya existe"
+    return None
 
-    existing_username = db.query(User).filter(User.username == payload.username).first()
-    if existing_username:
-        raise HTTPException(status_code=400, detail="El nombre de usuario ya existe")
 
-    new_user = User(username=payload.username, email=payload.email)
-    new_user.set_password(payload.password)
+def _create_user(db: Session, username: str, email: str, password_hash: str) -> dict:
+    new_user = User(username=username, email=email, password_hash=password_hash)
 
     db.add(new_user)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Registered concurrently between the conflict check and the insert
+        db.rollback()
+        conflict = _find_conflict(db, username, email) or "El usuario ya existe"
+        raise HTTPException(status_code=400, detail=conflict)
     db.refresh(new_user)
 
+    return {
+        "id": new_user.id,
+        "username": new_user.username,
+        "email": new_user.email,
+    }
+
+
+def _get_user_by_email(db: Session, email: str) -> User | None:
+    return db.query(User).filter(User.email == email).first()
+
+
+def _get_user_by_id(db: Session, user_id: int) -> User | None:
+    return db.query(User).filter(User.id == user_id).first()
+
+
+def _update_password_hash(db: Session, user_id: int, password_hash: str) -> None:
+    user = db.get(User, user_id)
+    if user is not None:
+        user.password_hash = password_hash
+        db.commit()
+
+
+@router.post("/register", status_code=status.HTTP_201_CREATED)
+async def register_user(payload: RegisterRequest):
+    # Check for duplicates before paying for the hash
+    conflict = await run_db(_find_conflict, payload.username, payload.email)
+    if conflict:
+        raise HTTPException(status_code=400, detail=conflict)
+
+    password_hash = await hash_password(payload.password)
+    user = await run_db(_create_user, payload.username, payload.email, password_hash)
+
     return {
         "message": "Usuario registrado correctamente",
-        "user": {
-            "id": new_user.id,
-            "username": new_user.username,
-            "email": new_user.email,
-        },
+        "user": user,
     }
 
 
 @router.post("/login", response_model=TokenResponse)
-def login_user(payload: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == payload.email).first()
+async def login_user(payload: LoginRequest):
+    user = await run_db(_get_user_by_email, payload.email)
 
-    if not user or not user.check_password(payload.password):
+    if not user or not await verify_password(user.password_hash, payload.password):
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
 
-    access_token = create_access_token(user.id)
+    # Upgrade hashes made with an older algorithm or cost while we have the plain password
+    if needs_rehash(user.password_hash):
+        await run_db(_update_password_hash, user.id, await hash_password(payload.password))
+
+    access_token = create_access_token(user.id, user.username, user.email)
     return TokenResponse(access_token=access_token)
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
-) -> User:
-    token = credentials.credentials
+@router.get("/cache/stats")
+async def auth_cache_stats():
+    """Hit/miss counters for the authenticated user cache."""
+    return user_cache.get_stats()
 
+
+def _decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
         user_id = payload.get("sub")
@@ -91,8 +140,40 @@ def get_current_user(
     except JWTError as exc:
         raise HTTPException(status_code=401, detail="Token inválido o expirado") from exc
 
-    user = db.query(User).filter(User.id == int(user_id)).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Usuario no encontrado")
+    return payload
+
+
+async def _user_from_token(token: str) -> CurrentUser:
+    claims = user_cache.get_token(token)
+    if claims is None:
+        claims = _decode_token(token)
+        user_cache.put_token(token, claims)
+    user_id = int(claims["sub"])
+    # Evaluated on cached claims too: the rate limiter may have cached the token first
+    if AUTH_CLAIMS_ONLY and "username" in claims and "email" in claims:
+        return CurrentUser(id=user_id, username=claims["username"], email=claims["email"])
+
+    user = user_cache.get_user(user_id)
+    if user is None:
+        db_user = await run_db(_get_user_by_id, user_id)
+        if not db_user:
+            raise HTTPException(status_code=401, detail="Usuario no encontrado")
+        user = CurrentUser.from_model(db_user)
+        user_cache.put_user(user)
 
     return user
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> CurrentUser:
+    return await _user_from_token(credentials.credentials)
+
+
+async def get_optional_user(
+    credentials: HTTPAuthorizationCredentials | None = Depends(optional_security),
+) -> CurrentUser | None:
+    """Like get_current_user, but anonymous requests get None instead of a 403."""
+    if credentials is None:
+        return None
+    return await _user_from_token(credentials.credentials)
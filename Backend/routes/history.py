@@ -0,0 +1,37 @@
+# routes/history.py
+# Analysis history of the authenticated user
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from config import HISTORY_MAX_PAGE_SIZE, HISTORY_PAGE_SIZE
+from models import run_db
+from routes.auth import get_current_user
+from services.auth_cache_service import CurrentUser
+from services.history_service import get_history_item, list_history
+
+router = APIRouter(prefix="/history", tags=["history"])
+
+
+@router.get("")
+async def get_history(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    user: CurrentUser = Depends(get_current_user),
+):
+    """
+    List the user's analyses, newest first (without the analysis payload).
+    Pass next_cursor back as ?cursor= to get the next page.
+    """
+    return await run_db(list_history, user.id, limit, cursor)
+
+
+@router.get("/{result_id}")
+async def get_history_result(
+    result_id: int,
+    user: CurrentUser = Depends(get_current_user),
+):
+    """Return one saved analysis with its full /upload-pdf payload."""
+    item = await run_db(get_history_item, user.id, result_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Análisis no encontrado")
+    return item
@@ -0,0 +1,66 @@
+# routes/jobs.py
+# Background analysis jobs: submit a PDF, then poll for the result
+
+import logging
+import os
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Request, status
+
+from config import JOB_STORAGE_DIR, RATE_LIMIT_UPLOADS
+from models import run_db
+from routes.auth import get_optional_user
+from routes.pdf import spool_pdf_upload, validate_pdf_upload
+from services.auth_cache_service import CurrentUser
+from services.job_service import get_job as load_job, job_queue
+from services.rate_limit_service import limiter, rate_limit_key
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+@router.post("", status_code=status.HTTP_202_ACCEPTED)
+@limiter.limit(RATE_LIMIT_UPLOADS)
+async def create_job(request: Request, file: UploadFile = File(...), user: CurrentUser | None = Depends(get_optional_user)):
+    """
+    Queue a PDF for analysis and return its job id immediately.
+    Poll GET /jobs/{job_id} for the result. Authenticated jobs are saved to /history when they complete.
+    """
+    logger.info(f"Recibiendo archivo (trabajo): {file.filename}")
+    validate_pdf_upload(file)
+    
+    # Uploads are kept in JOB_STORAGE_DIR so queued jobs survive restarts
+    os.makedirs(JOB_STORAGE_DIR, exist_ok=True)
+    pdf_path, file_size = await spool_pdf_upload(file, directory=JOB_STORAGE_DIR)
+    
+    try:
+        job = await job_queue.submit(
+            pdf_path, file.filename, file_size, rate_limit_key(request), user.id if user else None
+        )
+    except HTTPException:
+        os.unlink(pdf_path)
+        raise
+    
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['job_id']}",
+        "queue_depth": job_queue.queue_depth(),
+    }
+
+
+@router.get("/stats")
+async def job_stats():
+    """Queue depth and queue wait vs. processing time metrics."""
+    return job_queue.get_stats()
+
+
+@router.get("/{job_id}")
+async def get_job(request: Request, job_id: str, user: CurrentUser | None = Depends(get_optional_user)):
+    """
+    Return the status of a job and, once completed, the /upload-pdf payload.
+    Only its submitter can read it; anyone else gets 404.
+    """
+    job = await run_db(load_job, job_id, user.id if user else None, rate_limit_key(request))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
@@ -1,148 +1,285 @@
 # routes/pdf.py
 # PDF upload and processing endpoints
 
+import asyncio
 import json
 import logging
+import os
+import tempfile
 import time
-from datetime import datetime
-from fastapi import APIRouter, File, UploadFile, HTTPException, Request
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Request
+from fastapi.responses import StreamingResponse
 
-from config import MAX_FILE_SIZE_BYTES, MAX_FILE_SIZE_MB, RATE_LIMIT_UPLOADS
-from services.pdf_service import extract_text_from_pdf
-from services.ai_service import analyze_lab_results
+from config import (
+    AI_SECTION_THRESHOLD_TOKENS, BATCH_MAX_CONCURRENCY, MAX_BATCH_FILES, MAX_FILE_SIZE_BYTES, MAX_FILE_SIZE_MB, MIN_FILE_SIZE_BYTES,
+    RATE_LIMIT_BATCH_UPLOADS, RATE_LIMIT_UPLOADS, UPLOAD_CHUNK_SIZE_BYTES
+)
+from models import run_db
+from routes.auth import get_optional_user
+from services.auth_cache_service import CurrentUser
+from services.pdf_service import extract_for_analysis_async
+from services.ai_service import estimate_tokens, stream_lab_results_async
+from services.cache_service import analysis_cache
+from services.analysis_service import (
+    analyze_pdf, analyze_prompt_text, build_upload_response, parse_analysis_response, raise_for_ai_error
+)
+from services.history_service import save_analysis_result
+from services.metrics_service import INVALID_DOCUMENTS, stage_timer
+from services.rate_limit_service import limiter, rate_limit_key
+from services.routing_service import build_template_response, route_document
+from services.usage_service import token_ledger
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-limiter = Limiter(key_func=get_remote_address)
 
 
-def _create_fallback_response(raw_text: str) -> dict:
+def validate_pdf_upload(file: UploadFile) -> None:
     """
-    Create a user-friendly fallback response when JSON parsing fails.
+    Validate the upload's filename and declared content type.
     """
-    # Clean up the raw text - remove JSON artifacts
-    cleaned_text = raw_text
+    # Validate file type
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="El archivo debe ser un PDF.")
+    
+    # Validate content type
+    if file.content_type and file.content_type != 'application/pdf':
+        raise HTTPException(status_code=400, detail="El tipo de contenido debe ser application/pdf.")
+
+
+async def spool_pdf_upload(file: UploadFile, directory: str | None = None) -> tuple[str, int]:
+    """
+    Copy an uploaded PDF to a temp file in chunks, rejecting it as early as possible.
     
-    # Remove common JSON artifacts that might appear
-    import re
-    cleaned_text = re.sub(r'^[\s\{]*"?\w+"?\s*:\s*"?', '', cleaned_text)
-    cleaned_text = re.sub(r'"\s*,?\s*"?\w+"?\s*:\s*"?', '\n\n', cleaned_text)
-    cleaned_text = re.sub(r'"\s*\}?\s*$', '', cleaned_text)
-    cleaned_text = cleaned_text.replace('\\n', '\n')
+    The %PDF magic number is checked on the first chunk and the read aborts as
+    soon as MAX_FILE_SIZE_BYTES is crossed, so memory per upload stays at one chunk.
     
-    return {
-        "interpretacionConceptos": "⚠️ **Nota:** Hubo un problema al estructurar la respuesta. A continuación se muestra el análisis en formato de texto.",
-        "resultadosSimplificados": cleaned_text.strip(),
-        "resumenEjecutivo": "La respuesta de la IA no pudo ser procesada correctamente. Por favor, revisa los resultados simplificados."
-    }
+    Args:
+        file: The uploaded file
+        directory: Where to create the file (defaults to the system temp dir)
+    
+    Returns:
+        A tuple of (temp_file_path, file_size). The caller must delete the file.
+    """
+    file_size = 0
+    tmp = tempfile.NamedTemporaryFile(prefix="webcheck-", suffix=".pdf", dir=directory, delete=False)
+    try:
+        with tmp, stage_timer("read"):
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE_BYTES):
+                # Validate PDF magic number (PDF files start with %PDF)
+                if file_size == 0 and len(chunk) >= 4 and not chunk.startswith(b'%PDF'):
+                    raise HTTPException(status_code=400, detail="El archivo no es un PDF válido.")
+                
+                file_size += len(chunk)
+                
+                # Validate file size
+                if file_size > MAX_FILE_SIZE_BYTES:
+                    raise HTTPException(
+                        status_code=413, 
+                        detail=f"El archivo es demasiado grande. Tamaño máximo: {MAX_FILE_SIZE_MB}MB."
+                    )
+                tmp.write(chunk)
+        
+        # Validate minimum file size (empty or corrupted files)
+        if file_size < MIN_FILE_SIZE_BYTES:
+            raise HTTPException(status_code=400, detail="El archivo está vacío o es inválido.")
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+    
+    return tmp.name, file_size
+
+
+async def save_to_history(user: CurrentUser | None, filename: str, result: dict) -> dict:
+    """Save a successful analysis to the user's history (authenticated uploads only)."""
+    if user is not None:
+        result["history_id"] = await run_db(save_analysis_result, user.id, filename, result)
+    return result
 
 
 @router.post("/upload-pdf")
 @limiter.limit(RATE_LIMIT_UPLOADS)
-async def upload_pdf(request: Request, file: UploadFile = File(...)):
+async def upload_pdf(request: Request, file: UploadFile = File(...), user: CurrentUser | None = Depends(get_optional_user)):
     """
     Upload a PDF file and get AI-powered analysis of lab results.
-    Rate limited to prevent API abuse.
+    Rate limited to prevent API abuse. Authenticated uploads are saved to /history.
     """
     start_time = time.time()
     logger.info(f"Recibiendo archivo: {file.filename}")
     
-    # Validate file type
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="El archivo debe ser un PDF.")
+    # Validate file type and content type
+    validate_pdf_upload(file)
     
-    # Validate content type
-    if file.content_type and file.content_type != 'application/pdf':
-        raise HTTPException(status_code=400, detail="El tipo de contenido debe ser application/pdf.")
+    # Stream the upload to a temp file, validating as we go
+    pdf_path, file_size = await spool_pdf_upload(file)
+    logger.info(f"✅ PDF leído: {file_size} bytes")
     
-    # Read PDF content
-    pdf_bytes = await file.read()
-    logger.info(f"✅ PDF leído: {len(pdf_bytes)} bytes")
+    try:
+        result = await analyze_pdf(pdf_path, file.filename, file_size, start_time, rate_limit_key(request))
+        return await save_to_history(user, file.filename, result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error procesando PDF: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error procesando PDF: {str(e)}")
+    finally:
+        os.unlink(pdf_path)
+
+
+@router.post("/upload-pdfs")
+@limiter.limit(RATE_LIMIT_BATCH_UPLOADS)
+async def upload_pdfs(request: Request, files: list[UploadFile] = File(...), user: CurrentUser | None = Depends(get_optional_user)):
+    """
+    Upload several PDFs (e.g. a patient's folder of reports) and analyze them concurrently.
     
-    # Validate file size
-    if len(pdf_bytes) > MAX_FILE_SIZE_BYTES:
-        raise HTTPException(
-            status_code=413, 
-            detail=f"El archivo es demasiado grande. Tamaño máximo: {MAX_FILE_SIZE_MB}MB."
-        )
+    The batch counts once against RATE_LIMIT_BATCH_UPLOADS. Each file gets its
+    own result or error, so one bad file does not fail the whole batch.
+    """
+    start_time = time.time()
+    logger.info(f"Recibiendo lote de {len(files)} archivos")
     
-    # Validate minimum file size (empty or corrupted files)
-    if len(pdf_bytes) < 100:
-        raise HTTPException(status_code=400, detail="El archivo está vacío o es inválido.")
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"Demasiados archivos. Máximo por lote: {MAX_BATCH_FILES}.")
     
-    # Validate PDF magic number (PDF files start with %PDF)
-    if not pdf_bytes.startswith(b'%PDF'):
-        raise HTTPException(status_code=400, detail="El archivo no es un PDF válido.")
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    subject = rate_limit_key(request)
     
-    try:
-        # Calculate file size in MB
-        file_size_mb = round(len(pdf_bytes) / (1024 * 1024), 2)
-        
-        # Extract text from PDF
-        texto_completo, num_paginas = extract_text_from_pdf(pdf_bytes)
-        
-        # Count words extracted
-        word_count = len(texto_completo.split())
-        logger.info(f"Palabras extraídas: {word_count}")
-        
-        # Generate AI analysis
-        ai_response = analyze_lab_results(texto_completo)
-        analysis_result_str = ai_response["text"]
-        ai_model = ai_response["model"]
-        ai_tokens = ai_response["tokens"]
-        logger.info(f"Respuesta de IA recibida: {analysis_result_str[:200]}...")
-        logger.info(f"Modelo: {ai_model}, Tokens: {ai_tokens['total']}")
-        
-        # Parse JSON response with better error recovery
+    async def process_file(file: UploadFile) -> dict:
+        pdf_path = None
         try:
-            analysis_result_json = json.loads(analysis_result_str)
-        except json.JSONDecodeError as e:
-            logger.error(f"Error al decodificar JSON de la IA: {e}")
+            validate_pdf_upload(file)
+            pdf_path, file_size = await spool_pdf_upload(file)
+            async with semaphore:
+                result = await analyze_pdf(pdf_path, file.filename, file_size, time.time(), subject)
+            await save_to_history(user, file.filename, result)
+            return {"filename": file.filename, "status": "ok", "result": result}
+        except HTTPException as e:
+            return {"filename": file.filename, "status": "error", "status_code": e.status_code, "detail": e.detail}
+        except Exception as e:
+            logger.error(f"❌ Error procesando {file.filename}: {str(e)}")
+            return {"filename": file.filename, "status": "error", "status_code": 500, "detail": f"Error procesando PDF: {str(e)}"}
+        finally:
+            if pdf_path:
+                os.unlink(pdf_path)
+    
+    results = await asyncio.gather(*(process_file(file) for file in files))
+    succeeded = sum(1 for item in results if item["status"] == "ok")
+    
+    processing_time = round(time.time() - start_time, 2)
+    logger.info(f"Lote procesado: {succeeded}/{len(files)} correctos en {processing_time}s")
+    
+    return {
+        "message": "Lote procesado",
+        "total_files": len(files),
+        "succeeded": succeeded,
+        "failed": len(files) - succeeded,
+        "processing_time": processing_time,
+        "results": results
+    }
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/upload-pdf/stream")
+@limiter.limit(RATE_LIMIT_UPLOADS)
+async def upload_pdf_stream(request: Request, file: UploadFile = File(...), user: CurrentUser | None = Depends(get_optional_user)):
+    """
+    Streaming variant of /upload-pdf using Server-Sent Events.
+    
+    Events: received, extracted (pages/word count), analysis (text chunks as
+    Gemini generates them), then result (same payload as /upload-pdf) or error.
+    
+    Cached analyses and identical analyses in flight on the other upload paths
+    are reused without analysis events. A streamed analysis itself is not
+    shared: its chunks cannot be replayed, so identical concurrent streams each
+    call the AI (and are cached for the requests that follow).
+    """
+    start_time = time.time()
+    logger.info(f"Recibiendo archivo (stream): {file.filename}")
+    
+    # Upload validation happens before the stream starts so errors keep their status codes
+    validate_pdf_upload(file)
+    pdf_path, file_size = await spool_pdf_upload(file)
+    file_size_mb = round(file_size / (1024 * 1024), 2)
+    filename = file.filename
+    subject = rate_limit_key(request)
+    
+    async def event_stream():
+        try:
+            yield _sse_event("received", {"filename": filename, "file_size_mb": file_size_mb})
             
-            # Try to extract JSON from response (sometimes AI wraps it in markdown)
-            import re
-            json_match = re.search(r'\{[\s\S]*\}', analysis_result_str)
+            document = await extract_for_analysis_async(pdf_path)
+            texto_completo = document["prompt_text"]
+            num_paginas = document["pages"]
+            word_count = len(document["text"].split())
+            yield _sse_event("extracted", {"pages": num_paginas, "word_count": word_count})
             
-            if json_match:
-                try:
-                    analysis_result_json = json.loads(json_match.group())
-                    logger.info("✅ JSON extraído exitosamente del texto")
-                except json.JSONDecodeError:
-                    analysis_result_json = _create_fallback_response(analysis_result_str)
+            routing = route_document(document)
+            tier = routing["tier"]
+            if tier == "template":
+                # All-normal report answered locally; nothing to stream
+                ai_response, cache_hit = build_template_response(document), False
             else:
-                analysis_result_json = _create_fallback_response(analysis_result_str)
-        
-        # Check if the PDF is a valid lab exam
-        if not analysis_result_json.get("isValid", True):
-            error_message = analysis_result_json.get("errorMessage", "El documento no es un resultado de laboratorio válido.")
-            logger.warning(f"⚠️ PDF no válido: {error_message}")
-            raise HTTPException(
-                status_code=400, 
-                detail=error_message
+                # Long reports are analyzed (and cached) by sections, so a whole-text lookup would always miss
+                sectioned = estimate_tokens(texto_completo) > AI_SECTION_THRESHOLD_TOKENS
+                ai_response = None if sectioned else await analysis_cache.lookup(texto_completo, tier)
+                cache_hit = ai_response is not None
+                if not cache_hit:
+                    async with token_ledger.reserve(subject, texto_completo) as reservation:
+                        if sectioned:
+                            # Sections are analyzed in parallel; only the merged result is sent
+                            ai_response, cache_hit = await analyze_prompt_text(texto_completo)
+                        else:
+                            async for kind, value in stream_lab_results_async(texto_completo, tier):
+                                if kind == "chunk":
+                                    yield _sse_event("analysis", {"text": value})
+                                else:
+                                    ai_response = value
+                            await analysis_cache.store(texto_completo, ai_response, tier)
+                        reservation.charge(ai_response, cache_hit)
+            logger.info(f"Modelo: {ai_response['model']}, Tokens: {ai_response['tokens']['total']}")
+            raise_for_ai_error(ai_response)
+            
+            analysis_result_json = ai_response.get("analysis")
+            if analysis_result_json is None:
+                with stage_timer("json_parse"):
+                    analysis_result_json = parse_analysis_response(ai_response["text"])
+            
+            # Check if the PDF is a valid lab exam
+            if not analysis_result_json.get("isValid", True):
+                error_message = analysis_result_json.get("errorMessage", "El documento no es un resultado de laboratorio válido.")
+                INVALID_DOCUMENTS.inc()
+                logger.warning(f"⚠️ PDF no válido: {error_message}")
+                yield _sse_event("error", {"status_code": 400, "detail": error_message})
+                return
+            
+            processing_time = round(time.time() - start_time, 2)
+            logger.info(f"Tiempo de procesamiento (stream): {processing_time}s")
+            result = build_upload_response(
+                filename, num_paginas, processing_time, file_size_mb,
+                word_count, ai_response, cache_hit, analysis_result_json,
+                extraction=document["extraction"], document=document, routing=routing
             )
-        
-        # Calculate processing time
-        end_time = time.time()
-        processing_time = round(end_time - start_time, 2)
-        analysis_timestamp = datetime.now().isoformat()
-        logger.info(f"Tiempo de procesamiento: {processing_time}s")
-        
-        return {
-            "message": "PDF procesado correctamente",
-            "filename": file.filename,
-            "pages": num_paginas,
-            "processing_time": processing_time,
-            "file_size_mb": file_size_mb,
-            "word_count": word_count,
-            "timestamp": analysis_timestamp,
-            "ai_model": ai_model,
-            "ai_tokens": ai_tokens,
-            "analysis_result": analysis_result_json
-        }
-        
-    except Exception as e:
-        logger.error(f"❌ Error procesando PDF: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error procesando PDF: {str(e)}")
+            yield _sse_event("result", await save_to_history(user, filename, result))
+        except HTTPException as e:
+            yield _sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"❌ Error procesando PDF: {str(e)}")
+            yield _sse_event("error", {"status_code": 500, "detail": f"Error procesando PDF: {str(e)}"})
+        finally:
+            os.unlink(pdf_path)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the analysis cache."""
+    return analysis_cache.get_stats()
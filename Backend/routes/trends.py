@@ -0,0 +1,29 @@
+# routes/trends.py
+# Per-analyte trends across the authenticated user's saved analyses
+
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Query
+
+from config import TRENDS_MAX_POINTS
+from models import run_db
+from routes.auth import get_current_user
+from services.auth_cache_service import CurrentUser
+from services.trends_service import query_trend
+
+router = APIRouter(prefix="/trends", tags=["trends"])
+
+
+@router.get("/{analyte}")
+async def get_trend(
+    analyte: str,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    limit: int = Query(TRENDS_MAX_POINTS, ge=1, le=TRENDS_MAX_POINTS),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Values of one analyte (e.g. /trends/hemoglobina) over time, oldest first.
+    Defaults to the last TRENDS_DEFAULT_DAYS days; accepts ISO dates in ?since= and ?until=.
+    """
+    return await run_db(query_trend, user.id, analyte, since, until, limit)
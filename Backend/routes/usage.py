@@ -0,0 +1,24 @@
+# routes/usage.py
+# Daily AI token consumption of the caller (user or client IP) and of the whole deployment
+
+from fastapi import APIRouter, Query, Request
+
+from models import run_db
+from services.rate_limit_service import rate_limit_key
+from services.usage_service import daily_usage, token_ledger
+
+router = APIRouter(prefix="/usage", tags=["usage"])
+
+
+@router.get("")
+async def get_usage(request: Request, days: int = Query(7, ge=1, le=90)):
+    """
+    Today's token usage against the daily budgets (as seen by this worker, including
+    calls in flight) and the caller's recorded usage over the last `days` days.
+    """
+    subject = rate_limit_key(request)
+    return {
+        "subject": subject,
+        **token_ledger.snapshot(subject),
+        "history": await run_db(daily_usage, subject, days),
+    }
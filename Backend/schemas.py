@@ -0,0 +1,26 @@
+# schemas.py
+# Structured output expected from the AI: sent to Gemini as the response schema and used to validate replies
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class LabAnalysis(BaseModel):
+    """
+    The analysis JSON described in build_prompt.
+
+    Fields have no defaults on purpose: Gemini's response_schema does not
+    accept them, and required fields make the model always emit all five.
+    Descriptions are part of the schema the model sees, hence in Spanish.
+    """
+
+    model_config = ConfigDict(extra="ignore")
+
+    isValid: bool = Field(description="true si el documento es un resultado de laboratorio clínico válido")
+    errorMessage: str = Field(description="Motivo por el que el documento no es válido; vacío si es válido")
+    interpretacionConceptos: str = Field(description="Análisis técnico en Markdown; vacío si no es válido")
+    resultadosSimplificados: str = Field(description="Explicación en lenguaje simple en Markdown; vacío si no es válido")
+    resumenEjecutivo: str = Field(description="Resumen breve de los hallazgos; vacío si no es válido")
+
+
+# Fields filled in when a repaired response left them out
+LAB_ANALYSIS_TEXT_FIELDS = ("errorMessage", "interpretacionConceptos", "resultadosSimplificados", "resumenEjecutivo")
@@ -0,0 +1,225 @@
+# services/ai_backends.py
+# Pluggable AI backends: Google Gemini and a deterministic local fake for load testing
+
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from typing import AsyncIterator, Protocol
+
+from config import (
+    AI_BACKEND,
+    FAKE_AI_ERROR_RATE,
+    FAKE_AI_LATENCY_DISTRIBUTION,
+    FAKE_AI_LATENCY_MS,
+    FAKE_AI_LATENCY_STDDEV_MS,
+    FAKE_AI_RESPONSE_FILE,
+    FAKE_AI_SEED,
+    FAKE_AI_STREAM_CHUNKS,
+    GEMINI_API_KEY,
+    GEMINI_MODEL,
+)
+from schemas import LabAnalysis
+
+logger = logging.getLogger(__name__)
+
+
+class TransientAIError(RuntimeError):
+    """A backend failure worth retrying (overload, dropped connection, 5xx)."""
+
+
+class AIBackend(Protocol):
+    """
+    Interface every AI backend implements.
+
+    generate/generate_async return the analysis dict used across the app:
+    {"text": str, "model": str, "tokens": {"input": int, "output": int, "total": int}}.
+    Failures are raised as exceptions; ai_service retries the transient ones
+    (see resilience_service) and turns the rest into error responses.
+    """
+
+    model_name: str
+
+    def generate(self, prompt: str) -> dict: ...
+
+    async def generate_async(self, prompt: str) -> dict: ...
+
+    def stream_async(self, prompt: str) -> AsyncIterator[tuple[str, str | dict]]:
+        """Yield ("chunk", text) fragments, then ("done", analysis_dict)."""
+        ...
+
+
+def _analysis_dict(text: str, model_name: str, input_tokens: int, output_tokens: int, total_tokens: int) -> dict:
+    return {
+        "text": text,
+        "model": model_name,
+        "tokens": {
+            "input": input_tokens,
+            "output": output_tokens,
+            "total": total_tokens
+        }
+    }
+
+
+class GeminiBackend:
+    """Google Gemini through google.generativeai, configured on construction (not at import)."""
+
+    def __init__(self, model_name: str = GEMINI_MODEL, api_key: str | None = GEMINI_API_KEY):
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY no encontrada en variables de entorno")
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        # Configure model to always return JSON matching the LabAnalysis schema
+        generation_config = genai.types.GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=LabAnalysis
+        )
+        self.model = genai.GenerativeModel(
+            model_name,
+            generation_config=generation_config
+        )
+
+    def _build_response(self, response) -> dict:
+        """Convert a Gemini response into the analysis dict (text, model, tokens)."""
+        # Extract token usage if available
+        input_tokens = 0
+        output_tokens = 0
+        total_tokens = 0
+
+        if hasattr(response, 'usage_metadata'):
+            input_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0)
+            output_tokens = getattr(response.usage_metadata, 'candidates_token_count', 0)
+            total_tokens = getattr(response.usage_metadata, 'total_token_count', 0)
+            logger.info(f"Tokens utilizados - Input: {input_tokens}, Output: {output_tokens}, Total: {total_tokens}")
+
+        return _analysis_dict(response.text, self.model_name, input_tokens, output_tokens, total_tokens)
+
+    def generate(self, prompt: str) -> dict:
+        return self._build_response(self.model.generate_content(prompt))
+
+    async def generate_async(self, prompt: str) -> dict:
+        return self._build_response(await self.model.generate_content_async(prompt))
+
+    async def stream_async(self, prompt: str) -> AsyncIterator[tuple[str, str | dict]]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.parts:
+                yield "chunk", chunk.text
+        # Text and usage metadata are aggregated once the stream is consumed
+        yield "done", self._build_response(response)
+
+
+DEFAULT_FAKE_RESPONSE = {
+    "isValid": True,
+    "errorMessage": "",
+    "interpretacionConceptos": "**Análisis simulado.** Respuesta generada por el backend local de pruebas.",
+    "resultadosSimplificados": "Resultados simulados. Esta interpretación no sustituye la consulta médica profesional.",
+    "resumenEjecutivo": "Estudio simulado para pruebas de carga; no contiene una interpretación real."
+}
+
+
+class FakeBackend:
+    """
+    Offline backend returning canned JSON after a sampled latency.
+
+    Latency distributions: "fixed", "uniform" (mean ± stddev), "normal" and
+    "lognormal" (mean/stddev in ms). A share of calls (error_rate) raises a
+    TransientAIError to exercise retries and the circuit breaker. Token usage is estimated from text length.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = FAKE_AI_LATENCY_MS,
+        latency_stddev_ms: float = FAKE_AI_LATENCY_STDDEV_MS,
+        distribution: str = FAKE_AI_LATENCY_DISTRIBUTION,
+        error_rate: float = FAKE_AI_ERROR_RATE,
+        response_file: str | None = FAKE_AI_RESPONSE_FILE,
+        stream_chunks: int = FAKE_AI_STREAM_CHUNKS,
+        seed: int | None = FAKE_AI_SEED,
+        model_name: str | None = None,
+    ):
+        # The simulated model is part of the name so cache keys and responses tell tiers apart
+        self.model_name = f"fake-local:{model_name}" if model_name else "fake-local"
+        self.latency_ms = latency_ms
+        self.latency_stddev_ms = latency_stddev_ms
+        self.distribution = distribution
+        self.error_rate = error_rate
+        self.stream_chunks = max(1, stream_chunks)
+        self._random = random.Random(seed)
+        if response_file:
+            with open(response_file, encoding="utf-8") as f:
+                self.responses = json.load(f)
+            if isinstance(self.responses, dict):
+                self.responses = [self.responses]
+        else:
+            self.responses = [DEFAULT_FAKE_RESPONSE]
+
+    def sample_latency(self) -> float:
+        """Return the next simulated latency in seconds."""
+        mean, stddev = self.latency_ms, self.latency_stddev_ms
+        if self.distribution == "uniform":
+            value = self._random.uniform(mean - stddev, mean + stddev)
+        elif self.distribution == "normal":
+            value = self._random.gauss(mean, stddev)
+        elif self.distribution == "lognormal" and mean > 0:
+            # Parameters chosen so the distribution has the configured mean and stddev
+            sigma2 = math.log(1 + (stddev / mean) ** 2)
+            mu = math.log(mean) - sigma2 / 2
+            value = self._random.lognormvariate(mu, sigma2 ** 0.5)
+        else:
+            value = mean
+        return max(0.0, value) / 1000
+
+    def _next(self, prompt: str) -> tuple[float, dict | None]:
+        """Sample latency and outcome; None means this call fails after the latency."""
+        latency = self.sample_latency()
+        if self._random.random() < self.error_rate:
+            return latency, None
+        text = json.dumps(self._random.choice(self.responses), ensure_ascii=False)
+        input_tokens = (len(prompt) + 3) // 4
+        output_tokens = (len(text) + 3) // 4
+        return latency, _analysis_dict(text, self.model_name, input_tokens, output_tokens, input_tokens + output_tokens)
+
+    def generate(self, prompt: str) -> dict:
+        latency, result = self._next(prompt)
+        time.sleep(latency)
+        if result is None:
+            raise TransientAIError("Fallo simulado del backend de IA")
+        return result
+
+    async def generate_async(self, prompt: str) -> dict:
+        latency, result = self._next(prompt)
+        await asyncio.sleep(latency)
+        if result is None:
+            raise TransientAIError("Fallo simulado del backend de IA")
+        return result
+
+    async def stream_async(self, prompt: str) -> AsyncIterator[tuple[str, str | dict]]:
+        latency, result = self._next(prompt)
+        if result is None:
+            await asyncio.sleep(latency)
+            raise TransientAIError("Fallo simulado del backend de IA")
+        text = result["text"]
+        size = -(-len(text) // self.stream_chunks)
+        for start in range(0, len(text), size):
+            await asyncio.sleep(latency / self.stream_chunks)
+            yield "chunk", text[start:start + size]
+        yield "done", result
+
+
+_BACKENDS = {
+    "gemini": GeminiBackend,
+    "fake": FakeBackend,
+}
+
+
+def create_ai_backend(name: str = AI_BACKEND, model_name: str | None = None) -> AIBackend:
+    """Instantiate the backend selected by AI_BACKEND, for model_name (default: GEMINI_MODEL)."""
+    if name not in _BACKENDS:
+        raise ValueError(f"AI_BACKEND desconocido: {name}. Opciones: {', '.join(_BACKENDS)}")
+    logger.info(f"Backend de IA: {name}" + (f" ({model_name})" if model_name else ""))
+    return _BACKENDS[name](**({"model_name": model_name} if model_name else {}))
@@ -1,37 +1,106 @@
 # services/ai_service.py
-# AI analysis using Google Gemini
+# AI analysis of lab results through the configured AI backend (Gemini by default)
 
-import google.generativeai as genai
+import asyncio
+import json
 import logging
-from config import GEMINI_API_KEY, GEMINI_MODEL
+from typing import AsyncIterator
+from config import AI_BACKEND, MAX_CONCURRENT_AI_CALLS, ROUTER_LIGHT_MODEL
+from services.ai_backends import AIBackend, create_ai_backend
+from services.metrics_service import AI_TOKENS, stage_timer
+from services.resilience_service import (
+    CircuitOpenError, call_with_resilience, stream_with_resilience
+)
 
 logger = logging.getLogger(__name__)
 
-# Configure Gemini
-genai.configure(api_key=GEMINI_API_KEY)
+# Bump whenever build_prompt / build_short_prompt changes so cached analyses are not reused
+PROMPT_VERSION = "1"
+SHORT_PROMPT_VERSION = "short-1"
 
-# Configure model to always return JSON
-generation_config = genai.types.GenerationConfig(
-    response_mime_type="application/json"
-)
+# Routing tiers that call the AI (see routing_service): "full" is GEMINI_MODEL
+# with build_prompt, "light" is ROUTER_LIGHT_MODEL with build_short_prompt
+AI_TIERS = ("full", "light")
 
-model = genai.GenerativeModel(
-    GEMINI_MODEL,
-    generation_config=generation_config
-)
+# Backends selected by AI_BACKEND, per tier, created on first use
+_backends: dict[str, AIBackend] = {}
+
+# Bounds how many Gemini requests a worker keeps in flight at once
+_ai_semaphore = asyncio.Semaphore(MAX_CONCURRENT_AI_CALLS)
+
+
+def _backend_tier(tier: str) -> str:
+    # Without ROUTER_LIGHT_MODEL the light tier only shortens the prompt
+    return "light" if tier == "light" and (ROUTER_LIGHT_MODEL or "light" in _backends) else "full"
+
+
+def get_ai_backend(tier: str = "full") -> AIBackend:
+    """Return the configured AI backend of a routing tier, creating it on first use."""
+    tier = _backend_tier(tier)
+    if tier not in _backends:
+        _backends[tier] = create_ai_backend(model_name=ROUTER_LIGHT_MODEL if tier == "light" else None)
+    return _backends[tier]
+
+
+def set_ai_backend(backend: AIBackend, tier: str = "full") -> None:
+    """Replace the AI backend of a routing tier (e.g. a FakeBackend for benchmarks)."""
+    _backends[tier] = backend
+
+
+def prompt_version(tier: str = "full") -> str:
+    """Version of the prompt a tier sends, part of the analysis cache key."""
+    return SHORT_PROMPT_VERSION if tier == "light" else PROMPT_VERSION
+
+
+def estimate_tokens_from_chars(num_chars: int) -> int:
+    """Cheap offline token estimate (~4 characters per token for Gemini on Spanish/English text)."""
+    return (num_chars + 3) // 4
 
 
-def analyze_lab_results(texto_completo: str) -> dict:
+def estimate_tokens(text: str) -> int:
+    """Estimate the tokens of a text without calling the API."""
+    return estimate_tokens_from_chars(len(text))
+
+
+def split_prompt_sections(texto: str, max_tokens: int) -> list[str]:
+    """
+    Split a document's prompt text into sections of at most max_tokens
+    (estimated), cutting at line boundaries. Lines longer than a section
+    are cut at the character budget.
+    """
+    max_chars = max_tokens * 4
+    if len(texto) <= max_chars:
+        return [texto]
+    
+    sections, current, current_chars = [], [], 0
+    for line in texto.splitlines():
+        while len(line) > max_chars:
+            line_head, line = line[:max_chars], line[max_chars:]
+            if current:
+                sections.append("\n".join(current))
+                current, current_chars = [], 0
+            sections.append(line_head)
+        if current and current_chars + len(line) + 1 > max_chars:
+            sections.append("\n".join(current))
+            current, current_chars = [], 0
+        current.append(line)
+        current_chars += len(line) + 1
+    if current:
+        sections.append("\n".join(current))
+    return sections
+
+
+def build_prompt(texto_completo: str) -> str:
     """
-    Analyze laboratory results using Gemini AI.
+    Build the Gemini prompt for the extracted lab results text.
     
     Args:
         texto_completo: The extracted text from the lab results PDF
         
     Returns:
-        Dict with analysis results and metadata (tokens, model)
+        The full prompt string
     """
-    prompt = f"""
+    return f"""
         Eres un hematólogo experto analizando resultados de laboratorio. 
         
         REGLAS GENERALES:
@@ -107,34 +176,106 @@ def analyze_lab_results(texto_completo: str) -> dict:
         {texto_completo}
         --- Fin de los datos del documento ---
     """
+
+
+def build_short_prompt(texto_completo: str) -> str:
+    """
+    Shorter prompt for the light tier: small reports whose parsed values are
+    mostly within range. Same JSON fields and rules as build_prompt, with
+    the instructions condensed.
+    """
+    return f"""
+        Eres un hematólogo experto. Responde ÚNICAMENTE con un objeto JSON válido con las claves
+        isValid, errorMessage, interpretacionConceptos, resultadosSimplificados y resumenEjecutivo.
+        - Interpreta solo valores presentes en el documento; NO alucines. Si un dato no es claro, indica "Dato ilegible".
+        - Si no es un resultado de laboratorio clínico (faltan al menos 2 de: datos de paciente, valores numéricos,
+          laboratorio), responde isValid false, explica el motivo en errorMessage y deja los demás campos vacíos.
+        - interpretacionConceptos (máx 250 palabras, Markdown): hallazgos anormales clasificados como CRÍTICO,
+          MODERADO o LEVE y su significado clínico; si todo es normal, indícalo.
+        - resultadosSimplificados (máx 200 palabras, Markdown): explicación en lenguaje simple y posibles siguientes
+          pasos sin diagnosticar. Termina con: "Esta interpretación no sustituye la consulta médica profesional."
+        - resumenEjecutivo (máx 80 palabras): tipo de estudio y hallazgos clave.
+
+        --- Inicio de los datos del documento ---
+        {texto_completo}
+        --- Fin de los datos del documento ---
+    """
+
+
+def _build_tier_prompt(texto_completo: str, tier: str) -> str:
+    return build_short_prompt(texto_completo) if tier == "light" else build_prompt(texto_completo)
+
+
+def _record_tokens(ai_response: dict) -> dict:
+    """Add the tokens of a successful AI call to the token counters."""
+    AI_TOKENS.inc(ai_response["tokens"]["input"], type="input")
+    AI_TOKENS.inc(ai_response["tokens"]["output"], type="output")
+    return ai_response
+
+
+def _build_error_response(e: Exception, tier: str = "full") -> dict:
+    """Build the analysis dict returned when the AI call fails."""
+    logger.error(f'Error generating response from AI backend: {e}')
+    backend = _backends.get(_backend_tier(tier))
+    response = {
+        "text": json.dumps({"error": "No se pudo generar el análisis.", "details": str(e)}, ensure_ascii=False),
+        # The backend itself may be what failed to start (e.g. missing API key)
+        "model": backend.model_name if backend is not None else AI_BACKEND,
+        "tokens": {"input": 0, "output": 0, "total": 0},
+        "error": str(e)
+    }
+    if isinstance(e, CircuitOpenError):
+        response["retry_after"] = e.retry_after
+    return response
+
+
+async def analyze_lab_results_async(texto_completo: str, tier: str = "full") -> dict:
+    """
+    Analyze laboratory results using the configured AI backend without blocking the event loop.
     
-    try:
-        response = model.generate_content(prompt)
-        
-        # Extract token usage if available
-        input_tokens = 0
-        output_tokens = 0
-        total_tokens = 0
+    Uses the backend's native async path and is bounded by MAX_CONCURRENT_AI_CALLS.
+    Each attempt has a deadline; retryable errors are retried with backoff and
+    slow calls may be hedged (see resilience_service).
+    
+    Args:
+        texto_completo: The extracted text from the lab results PDF
+        tier: Routing tier, "full" or "light" (lighter model and shorter prompt)
         
-        if hasattr(response, 'usage_metadata'):
-            input_tokens = getattr(response.usage_metadata, 'prompt_token_count', 0)
-            output_tokens = getattr(response.usage_metadata, 'candidates_token_count', 0)
-            total_tokens = getattr(response.usage_metadata, 'total_token_count', 0)
-            logger.info(f"Tokens utilizados - Input: {input_tokens}, Output: {output_tokens}, Total: {total_tokens}")
+    Returns:
+        Dict with analysis results and metadata (tokens, model)
+    """
+    with stage_timer("prompt_build"):
+        prompt = _build_tier_prompt(texto_completo, tier)
+    
+    async with _ai_semaphore:
+        try:
+            with stage_timer("llm"):
+                return _record_tokens(await call_with_resilience(lambda: get_ai_backend(tier).generate_async(prompt)))
+        except Exception as e:
+            return _build_error_response(e, tier)
+
+
+async def stream_lab_results_async(texto_completo: str, tier: str = "full") -> AsyncIterator[tuple[str, str | dict]]:
+    """
+    Stream the AI analysis as it is generated.
+    
+    Args:
+        texto_completo: The extracted text from the lab results PDF
+        tier: Routing tier, "full" or "light" (lighter model and shorter prompt)
         
-        return {
-            "text": response.text,
-            "model": GEMINI_MODEL,
-            "tokens": {
-                "input": input_tokens,
-                "output": output_tokens,
-                "total": total_tokens
-            }
-        }
-    except Exception as e:
-        logger.error(f'Error generating response from Gemini: {e}')
-        return {
-            "text": '{ "error": "No se pudo generar el análisis.", "details": "' + str(e) + '" }',
-            "model": GEMINI_MODEL,
-            "tokens": {"input": 0, "output": 0, "total": 0}
-        }
+    Yields:
+        ("chunk", text) for each generated fragment, then ("done", analysis_dict)
+        with the same shape returned by analyze_lab_results_async.
+    """
+    with stage_timer("prompt_build"):
+        prompt = _build_tier_prompt(texto_completo, tier)
+    
+    async with _ai_semaphore:
+        try:
+            with stage_timer("llm"):
+                async for kind, value in stream_with_resilience(lambda: get_ai_backend(tier).stream_async(prompt)):
+                    if kind == "done":
+                        _record_tokens(value)
+                    yield kind, value
+        except Exception as e:
+            yield "done", _build_error_response(e, tier)
@@ -0,0 +1,347 @@
+# services/analysis_service.py
+# Shared analysis pipeline: extraction, cached AI analysis and response parsing
+
+import asyncio
+import json
+import logging
+import math
+import time
+from datetime import datetime
+from functools import partial
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from schemas import LAB_ANALYSIS_TEXT_FIELDS, LabAnalysis
+from config import AI_MAX_SECTIONS, AI_SECTION_MAX_TOKENS, AI_SECTION_THRESHOLD_TOKENS
+from services.pdf_service import extract_for_analysis_async
+from services.ai_service import analyze_lab_results_async, estimate_tokens, split_prompt_sections
+from services.cache_service import analysis_cache
+from services.metrics_service import AI_RESPONSES, INVALID_DOCUMENTS, stage_timer
+from services.routing_service import build_template_response, route_document
+from services.usage_service import token_ledger
+
+logger = logging.getLogger(__name__)
+
+# Closing sentence build_prompt asks for; kept once when sections are merged
+_DISCLAIMER = "Esta interpretación no sustituye la consulta médica profesional."
+
+_lenient_decoder = json.JSONDecoder(strict=False)
+
+
+def _create_fallback_response(raw_text: str) -> dict:
+    """
+    Create a user-friendly fallback response when JSON parsing fails.
+    """
+    return {
+        "isValid": True,
+        "errorMessage": "",
+        "interpretacionConceptos": "⚠️ **Nota:** Hubo un problema al estructurar la respuesta. A continuación se muestra el análisis en formato de texto.",
+        "resultadosSimplificados": raw_text.strip().replace('\\n', '\n'),
+        "resumenEjecutivo": "La respuesta de la IA no pudo ser procesada correctamente. Por favor, revisa los resultados simplificados."
+    }
+
+
+def _repair_candidates(candidate: str):
+    """The reply as-is, then closed inside a string, closed after a value, and cut back to the last comma."""
+    yield candidate
+    yield candidate + '"}'
+    yield candidate + "}"
+    last_comma = candidate.rfind(",")
+    if last_comma != -1:
+        yield candidate[:last_comma] + "}"
+
+
+def _repair_analysis(text: str) -> LabAnalysis | None:
+    """
+    Recover the analysis object from a reply that is not clean JSON.
+
+    Handles, in a fixed number of attempts: text or code fences around the
+    object, raw newlines inside strings, trailing garbage, a reply truncated
+    inside the last string, and fields left out.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+    
+    for candidate in _repair_candidates(text[start:]):
+        try:
+            data, _ = _lenient_decoder.raw_decode(candidate)
+            break
+        except json.JSONDecodeError:
+            continue
+    else:
+        return None
+    
+    if not isinstance(data, dict) or not data.keys() & LabAnalysis.model_fields.keys():
+        return None
+    try:
+        return LabAnalysis.model_validate({
+            "isValid": True,
+            **dict.fromkeys(LAB_ANALYSIS_TEXT_FIELDS, ""),
+            **{key: value for key, value in data.items() if value is not None},
+        })
+    except ValidationError:
+        return None
+
+
+def parse_analysis_response(analysis_result_str: str) -> dict:
+    """
+    Parse and validate the AI response against LabAnalysis in one pass,
+    falling back to a bounded repair and then to a plain-text response.
+    """
+    try:
+        analysis = LabAnalysis.model_validate_json(analysis_result_str)
+    except ValidationError as e:
+        logger.warning(f"Respuesta de la IA fuera del esquema ({e.error_count()} errores), intentando repararla")
+    else:
+        AI_RESPONSES.inc(outcome="schema")
+        return analysis.model_dump()
+    
+    repaired = _repair_analysis(analysis_result_str)
+    if repaired is not None:
+        AI_RESPONSES.inc(outcome="repaired")
+        logger.info("✅ Respuesta de la IA reparada")
+        return repaired.model_dump()
+    
+    AI_RESPONSES.inc(outcome="fallback")
+    logger.error("Respuesta de la IA no recuperable, se devuelve como texto")
+    return _create_fallback_response(analysis_result_str)
+
+
+def raise_for_ai_error(ai_response: dict) -> None:
+    """
+    Turn a failed AI call into an HTTP error instead of parsing its error payload as an analysis.
+    
+    Raises:
+        HTTPException: 503 with Retry-After while the AI circuit is open, 502 when the call failed
+    """
+    if "error" in ai_response:
+        AI_RESPONSES.inc(outcome="error")
+        if "retry_after" in ai_response:
+            raise HTTPException(
+                status_code=503,
+                detail="El servicio de IA no está disponible temporalmente. Intenta de nuevo más tarde.",
+                headers={"Retry-After": str(math.ceil(ai_response["retry_after"]))}
+            )
+        raise HTTPException(
+            status_code=502,
+            detail="No se pudo generar el análisis con la IA. Intenta de nuevo en unos momentos."
+        )
+
+
+def merge_section_analyses(analyses: list[dict]) -> dict:
+    """
+    Reduce the per-section analyses of a long report into one LabAnalysis dict.
+    
+    The report is valid if any section is (bundles mix lab results with
+    other paperwork); each field keeps the valid sections in order, under a
+    heading, with the medical disclaimer only once at the end.
+    """
+    valid = [(number, analysis) for number, analysis in enumerate(analyses, 1) if analysis.get("isValid", True)]
+    if not valid:
+        return analyses[0]
+    
+    def merged(field: str) -> str:
+        parts = []
+        for number, analysis in valid:
+            text = analysis.get(field, "").replace(_DISCLAIMER, "").strip()
+            if text:
+                parts.append(f"### Sección {number} de {len(analyses)}\n\n{text}")
+        return "\n\n".join(parts)
+    
+    return {
+        "isValid": True,
+        "errorMessage": "",
+        "interpretacionConceptos": merged("interpretacionConceptos"),
+        "resultadosSimplificados": f"{merged('resultadosSimplificados')}\n\n{_DISCLAIMER}",
+        "resumenEjecutivo": merged("resumenEjecutivo"),
+    }
+
+
+async def analyze_prompt_text(prompt_text: str, tier: str = "full", skip_db: bool = False) -> tuple[dict, bool]:
+    """
+    Analyze a document's prompt text, map-reducing it when it is long.
+    
+    Up to AI_SECTION_THRESHOLD_TOKENS the text is analyzed in one call on
+    the routing tier ("full" or "light"). Longer texts (always routed to
+    "full") are split into sections of AI_SECTION_MAX_TOKENS, analyzed
+    concurrently (each cached on its own) and merged; the merged analysis is
+    returned in ai_response["analysis"] with the tokens of all sections, and
+    ai_response["spent_tokens"] holds those of the sections not served from
+    cache (what the token ledger charges, also when a section failed).
+    skip_db is passed to get_or_analyze for single-call texts whose SQLite
+    cache tier the caller already read.
+    
+    Returns:
+        A tuple of (ai_response, cache_hit)
+        
+    Raises:
+        HTTPException: 400 if the document needs more than AI_MAX_SECTIONS sections
+    """
+    if estimate_tokens(prompt_text) <= AI_SECTION_THRESHOLD_TOKENS:
+        return await analysis_cache.get_or_analyze(
+            prompt_text, partial(analyze_lab_results_async, tier=tier), tier, skip_db=skip_db
+        )
+    
+    sections = split_prompt_sections(prompt_text, AI_SECTION_MAX_TOKENS)
+    if len(sections) > AI_MAX_SECTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El documento es demasiado extenso para analizarlo ({len(sections)} secciones, máximo {AI_MAX_SECTIONS})."
+        )
+    logger.info(f"✂️ Documento dividido en {len(sections)} secciones")
+    
+    # The section header is part of the text, so it is also part of each section's cache key
+    results = await asyncio.gather(*(
+        analysis_cache.get_or_analyze(
+            f"[Sección {number} de {len(sections)} de un informe más extenso]\n{section}",
+            analyze_lab_results_async,
+        )
+        for number, section in enumerate(sections, 1)
+    ))
+    responses = [ai_response for ai_response, _ in results]
+    tokens = {key: sum(ai_response["tokens"][key] for ai_response in responses) for key in ("input", "output", "total")}
+    spent_tokens = {
+        key: sum(ai_response["tokens"][key] for ai_response, cache_hit in results if not cache_hit)
+        for key in ("input", "output", "total")
+    }
+    failed = next((ai_response for ai_response in responses if "error" in ai_response), None)
+    if failed is not None:
+        # The sections that did succeed were paid for
+        return {**failed, "tokens": tokens, "spent_tokens": spent_tokens}, False
+    
+    with stage_timer("json_parse"):
+        analysis = merge_section_analyses([parse_analysis_response(ai_response["text"]) for ai_response in responses])
+    return {
+        "text": json.dumps(analysis, ensure_ascii=False),
+        "model": responses[0]["model"],
+        "tokens": tokens,
+        "spent_tokens": spent_tokens,
+        "sections": len(sections),
+        "analysis": analysis,
+    }, all(cache_hit for _, cache_hit in results)
+
+
+def build_upload_response(
+    filename: str,
+    num_paginas: int,
+    processing_time: float,
+    file_size_mb: float,
+    word_count: int,
+    ai_response: dict,
+    cache_hit: bool,
+    analysis_result_json: dict,
+    extraction: dict | None = None,
+    document: dict | None = None,
+    routing: dict | None = None,
+) -> dict:
+    """
+    Build the /upload-pdf response payload (shared with the streaming endpoint).
+
+    lab_results carries the lab rows and report metadata parsed from the
+    extracted document; saved analyses index them for per-analyte trends.
+    routing is the model router's decision (see routing_service.route_document).
+    """
+    return {
+        "message": "PDF procesado correctamente",
+        "filename": filename,
+        "pages": num_paginas,
+        "processing_time": processing_time,
+        "file_size_mb": file_size_mb,
+        "word_count": word_count,
+        "timestamp": datetime.now().isoformat(),
+        "ai_model": ai_response["model"],
+        "ai_tokens": ai_response["tokens"],
+        "cache_hit": cache_hit,
+        "extraction": extraction or {},
+        "routing": routing or {},
+        "lab_results": {
+            "rows": document["lab_rows"] if document else [],
+            "metadata": document["lab_metadata"] if document else {},
+        },
+        "analysis_result": analysis_result_json
+    }
+
+
+async def analyze_pdf(
+    pdf_path: str, filename: str, file_size: int, start_time: float, subject: str | None = None
+) -> dict:
+    """
+    Run the full analysis pipeline on a spooled PDF.
+    
+    Used by /upload-pdf and the background job workers.
+    
+    Args:
+        pdf_path: Path to the validated PDF on disk
+        filename: Original filename of the upload
+        file_size: Size of the PDF in bytes
+        start_time: time.time() when the request started (for processing_time)
+        subject: Token ledger subject ("user:<id>" or "ip:<address>"); None only counts against the global budget
+        
+    Returns:
+        The /upload-pdf response payload
+        
+    Raises:
+        HTTPException: 400 if the document is not a valid lab result, 429 if it does not fit in
+            the token budgets, 502 if the AI call failed
+    """
+    # Calculate file size in MB
+    file_size_mb = round(file_size / (1024 * 1024), 2)
+    
+    # Extract text from PDF (runs in the extraction executor, opened by path)
+    document = await extract_for_analysis_async(pdf_path)
+    num_paginas = document["pages"]
+    
+    # Count words extracted
+    word_count = len(document["text"].split())
+    logger.info(f"Palabras extraídas: {word_count}")
+    
+    # All-normal reports are answered locally and cached analyses cost no tokens; only the
+    # rest go through the daily token budgets (as in the streaming endpoint) and are
+    # charged with the tokens actually used
+    prompt_text = document["prompt_text"]
+    routing = route_document(document)
+    ai_response, cache_hit, looked_up = None, False, False
+    if routing["tier"] == "template":
+        ai_response = build_template_response(document)
+    elif estimate_tokens(prompt_text) <= AI_SECTION_THRESHOLD_TOKENS:
+        # get_or_analyze below counts the miss and skips the SQLite tier already read here
+        ai_response = await analysis_cache.lookup(prompt_text, routing["tier"], count_miss=False)
+        cache_hit, looked_up = ai_response is not None, True
+    if ai_response is None:
+        async with token_ledger.reserve(subject, prompt_text) as reservation:
+            ai_response, cache_hit = await analyze_prompt_text(prompt_text, routing["tier"], skip_db=looked_up)
+            reservation.charge(ai_response, cache_hit)
+    analysis_result_str = ai_response["text"]
+    ai_model = ai_response["model"]
+    ai_tokens = ai_response["tokens"]
+    logger.info(f"Respuesta de IA recibida: {analysis_result_str[:200]}...")
+    logger.info(f"Modelo: {ai_model}, Tokens: {ai_tokens['total']}")
+    raise_for_ai_error(ai_response)
+    
+    # Parse JSON response with better error recovery
+    analysis_result_json = ai_response.get("analysis")
+    if analysis_result_json is None:
+        with stage_timer("json_parse"):
+            analysis_result_json = parse_analysis_response(analysis_result_str)
+    
+    # Check if the PDF is a valid lab exam
+    if not analysis_result_json.get("isValid", True):
+        error_message = analysis_result_json.get("errorMessage", "El documento no es un resultado de laboratorio válido.")
+        INVALID_DOCUMENTS.inc()
+        logger.warning(f"⚠️ PDF no válido: {error_message}")
+        raise HTTPException(
+            status_code=400, 
+            detail=error_message
+        )
+    
+    # Calculate processing time
+    end_time = time.time()
+    processing_time = round(end_time - start_time, 2)
+    logger.info(f"Tiempo de procesamiento: {processing_time}s")
+    
+    return build_upload_response(
+        filename, num_paginas, processing_time, file_size_mb,
+        word_count, ai_response, cache_hit, analysis_result_json,
+        extraction=document["extraction"], document=document, routing=routing
+    )
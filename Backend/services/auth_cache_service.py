@@ -0,0 +1,145 @@
+# services/auth_cache_service.py
+# In-memory TTL/LRU cache of decoded token claims and user records for get_current_user
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import event
+
+from config import AUTH_CACHE_ENABLED, AUTH_CACHE_MAX_ITEMS, AUTH_CACHE_TTL_SECONDS
+from models import User
+from services.metrics_service import AUTH_CACHE_REQUESTS
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """The authenticated user as seen by route handlers (detached from any session)."""
+
+    id: int
+    username: str
+    email: str
+
+    @classmethod
+    def from_model(cls, user: User) -> "CurrentUser":
+        return cls(id=user.id, username=user.username, email=user.email)
+
+
+class _TTLCache:
+    """OrderedDict LRU whose entries also expire after a TTL (or an explicit deadline)."""
+
+    def __init__(self, max_items: int, ttl_seconds: float):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        entry = self._items.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value, max_ttl: float | None = None) -> None:
+        ttl = self.ttl_seconds if max_ttl is None else min(self.ttl_seconds, max_ttl)
+        if ttl <= 0:
+            return
+        self._items[key] = (time.monotonic() + ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def pop(self, key) -> None:
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class UserCache:
+    """
+    Caches token -> claims (decoded JWT payload) and user id -> CurrentUser.
+
+    Token entries never outlive the token's own exp. User entries are dropped
+    when the User row is updated or deleted in this process; other workers see
+    the change once AUTH_CACHE_TTL_SECONDS has passed.
+    """
+
+    def __init__(self, max_items: int, ttl_seconds: float, enabled: bool = True):
+        self.enabled = enabled
+        self._tokens = _TTLCache(max_items, ttl_seconds)
+        self._users = _TTLCache(max_items, ttl_seconds)
+        self.stats = {
+            "token_hits": 0,
+            "token_misses": 0,
+            "user_hits": 0,
+            "user_misses": 0,
+        }
+
+    def get_token(self, token: str) -> dict | None:
+        if not self.enabled:
+            return None
+        claims = self._tokens.get(token)
+        self._count("token", claims is not None)
+        return claims
+
+    def put_token(self, token: str, claims: dict) -> None:
+        """Remember the claims of a decoded token, never past its exp (epoch seconds)."""
+        if self.enabled:
+            expires_at = claims.get("exp")
+            max_ttl = expires_at - time.time() if expires_at else None
+            self._tokens.put(token, claims, max_ttl)
+
+    def get_user(self, user_id: int) -> CurrentUser | None:
+        if not self.enabled:
+            return None
+        user = self._users.get(user_id)
+        self._count("user", user is not None)
+        return user
+
+    def put_user(self, user: CurrentUser) -> None:
+        if self.enabled:
+            self._users.put(user.id, user)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self._users.pop(user_id)
+
+    def clear(self) -> None:
+        self._tokens.clear()
+        self._users.clear()
+
+    def _count(self, kind: str, hit: bool) -> None:
+        self.stats[f"{kind}_{'hits' if hit else 'misses'}"] += 1
+        AUTH_CACHE_REQUESTS.inc(cache=kind, result="hit" if hit else "miss")
+
+    def get_stats(self) -> dict:
+        """Hit/miss counters and hit rates for GET /auth/cache/stats."""
+        stats = dict(self.stats)
+        for kind in ("token", "user"):
+            lookups = stats[f"{kind}_hits"] + stats[f"{kind}_misses"]
+            stats[f"{kind}_hit_rate"] = round(stats[f"{kind}_hits"] / lookups, 3) if lookups else 0.0
+        stats["tokens_cached"] = len(self._tokens)
+        stats["users_cached"] = len(self._users)
+        stats["enabled"] = self.enabled
+        return stats
+
+
+user_cache = UserCache(
+    max_items=AUTH_CACHE_MAX_ITEMS,
+    ttl_seconds=AUTH_CACHE_TTL_SECONDS,
+    enabled=AUTH_CACHE_ENABLED,
+)
+
+
+# Drop cached records whenever a user row changes or is deleted through the ORM
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target: User) -> None:
+    user_cache.invalidate_user(target.id)
@@ -0,0 +1,282 @@
+# services/cache_service.py
+# Content-addressed cache for AI analyses (in-memory LRU + persistent SQLite tier)
+
+import asyncio
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from config import (
+    ANALYSIS_CACHE_ENABLED,
+    ANALYSIS_CACHE_MAX_ROWS,
+    ANALYSIS_CACHE_MEMORY_ITEMS,
+    ANALYSIS_CACHE_TOUCH_SECONDS,
+    ANALYSIS_CACHE_TTL_SECONDS,
+)
+from models import AnalysisCacheEntry, SessionLocal
+from services.ai_service import PROMPT_VERSION, get_ai_backend, prompt_version
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(texto: str) -> str:
+    """
+    Normalize extracted text so re-exports of the same report hash identically.
+
+    Applies Unicode NFKC normalization and collapses all whitespace runs.
+    """
+    texto = unicodedata.normalize("NFKC", texto)
+    return _WHITESPACE_RE.sub(" ", texto).strip()
+
+
+def make_cache_key(texto: str, model: str | None = None, prompt_version: str = PROMPT_VERSION) -> str:
+    """Return the SHA-256 cache key for a document's text, model (default: active backend) and prompt version."""
+    model = model or get_ai_backend().model_name
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt_version.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_text(texto).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def make_tier_cache_key(texto: str, tier: str = "full") -> str:
+    """Cache key of a document analyzed on a routing tier (the tier's model and prompt version)."""
+    return make_cache_key(texto, get_ai_backend(tier).model_name, prompt_version(tier))
+
+
+class AnalysisCache:
+    """
+    Two-tier cache in front of the AI analysis.
+
+    Lookups go memory LRU -> SQLite -> AI call. Concurrent requests for the
+    same key share a single in-flight call. Only successful AI responses are stored.
+    """
+
+    def __init__(self, max_items: int, max_rows: int, ttl_seconds: int, enabled: bool = True):
+        self.max_items = max_items
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._memory: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.stats = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "inflight_shared": 0,
+            "misses": 0,
+        }
+
+    # Memory tier
+
+    def _memory_get(self, key: str) -> dict | None:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key: str, value: dict) -> None:
+        self._memory[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    # SQLite tier (sync, always called through asyncio.to_thread)
+
+    def _db_get(self, key: str) -> dict | None:
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(seconds=self.ttl_seconds)
+        db = SessionLocal()
+        try:
+            entry = db.get(AnalysisCacheEntry, key)
+            if entry is None:
+                return None
+            if entry.created_at < cutoff.replace(tzinfo=None):
+                db.delete(entry)
+                db.commit()
+                return None
+            response = entry.response_json
+            # Hits stay reads: the access time only drives size eviction, so a
+            # minute-old value orders entries well enough without a write per hit
+            touch_before = (now - timedelta(seconds=ANALYSIS_CACHE_TOUCH_SECONDS)).replace(tzinfo=None)
+            if entry.last_accessed_at is None or entry.last_accessed_at < touch_before:
+                entry.last_accessed_at = now
+                db.commit()
+            return response
+        finally:
+            db.close()
+
+    def _db_put(self, key: str, value: dict, version: str = PROMPT_VERSION) -> None:
+        now = datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            db.merge(AnalysisCacheEntry(
+                cache_key=key,
+                model=value["model"],
+                prompt_version=version,
+                response_json=value,
+                created_at=now,
+                last_accessed_at=now,
+            ))
+            # TTL eviction
+            db.query(AnalysisCacheEntry).filter(
+                AnalysisCacheEntry.created_at < now - timedelta(seconds=self.ttl_seconds)
+            ).delete(synchronize_session=False)
+            # Size eviction: drop least recently used rows beyond max_rows
+            overflow = db.query(AnalysisCacheEntry.cache_key).order_by(
+                AnalysisCacheEntry.last_accessed_at.desc()
+            ).offset(self.max_rows).all()
+            if overflow:
+                db.query(AnalysisCacheEntry).filter(
+                    AnalysisCacheEntry.cache_key.in_([row.cache_key for row in overflow])
+                ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    # Public API
+
+    async def get_or_analyze(
+        self,
+        texto_completo: str,
+        analyze_fn: Callable[[str], Awaitable[dict]],
+        tier: str = "full",
+        skip_db: bool = False,
+    ) -> tuple[dict, bool]:
+        """
+        Return the cached analysis for the text, or run analyze_fn and cache it.
+
+        Args:
+            texto_completo: The extracted text from the lab results PDF
+            analyze_fn: Async function performing the AI analysis on a miss
+            tier: Routing tier analyze_fn runs on (its model and prompt are part of the key)
+            skip_db: The caller already missed the SQLite tier through lookup(); do not read it again
+
+        Returns:
+            A tuple of (ai_response, cache_hit)
+        """
+        if not self.enabled:
+            return await analyze_fn(texto_completo), False
+
+        key = make_tier_cache_key(texto_completo, tier)
+
+        cached = self._memory_get(key)
+        if cached is not None:
+            self.stats["memory_hits"] += 1
+            logger.info(f"♻️ Análisis recuperado de caché (memoria): {key[:12]}")
+            return cached, True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["inflight_shared"] += 1
+            logger.info(f"♻️ Compartiendo análisis en curso: {key[:12]}")
+            ai_response, _ = await asyncio.shield(task)
+            return ai_response, True
+
+        task = asyncio.ensure_future(self._resolve(key, texto_completo, analyze_fn, tier, skip_db))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _resolve(
+        self,
+        key: str,
+        texto_completo: str,
+        analyze_fn: Callable[[str], Awaitable[dict]],
+        tier: str,
+        skip_db: bool = False,
+    ) -> tuple[dict, bool]:
+        if not skip_db:
+            cached = await self._db_lookup(key)
+            if cached is not None:
+                return cached, True
+
+        self.stats["misses"] += 1
+        ai_response = await analyze_fn(texto_completo)
+        await self._store(key, ai_response, tier)
+        return ai_response, False
+
+    async def _db_lookup(self, key: str) -> dict | None:
+        cached = await asyncio.to_thread(self._db_get, key)
+        if cached is not None:
+            self.stats["db_hits"] += 1
+            self._memory_put(key, cached)
+            logger.info(f"♻️ Análisis recuperado de caché (SQLite): {key[:12]}")
+        return cached
+
+    async def _store(self, key: str, ai_response: dict, tier: str = "full") -> None:
+        if "error" in ai_response:
+            return
+        self._memory_put(key, ai_response)
+        try:
+            await asyncio.to_thread(self._db_put, key, ai_response, prompt_version(tier))
+        except Exception as e:
+            logger.error(f"Error guardando análisis en caché: {e}")
+
+    async def lookup(self, texto_completo: str, tier: str = "full", count_miss: bool = True) -> dict | None:
+        """
+        Return the cached analysis for the text without calling the AI.
+
+        An identical analysis in flight in get_or_analyze is awaited and shared.
+        Used by callers that run the AI themselves (e.g. streaming), which count
+        a miss when absent, and to serve cached analyses before the token budget
+        admission (count_miss=False, get_or_analyze(skip_db=True) counts it afterwards).
+        """
+        if not self.enabled:
+            return None
+
+        key = make_tier_cache_key(texto_completo, tier)
+        cached = self._memory_get(key)
+        if cached is not None:
+            self.stats["memory_hits"] += 1
+            return cached
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["inflight_shared"] += 1
+            logger.info(f"♻️ Compartiendo análisis en curso: {key[:12]}")
+            ai_response, _ = await asyncio.shield(task)
+            return ai_response
+
+        cached = await self._db_lookup(key)
+        if cached is None and count_miss:
+            self.stats["misses"] += 1
+        return cached
+
+    async def store(self, texto_completo: str, ai_response: dict, tier: str = "full") -> None:
+        """Store an analysis produced outside get_or_analyze (failed responses are skipped)."""
+        if self.enabled:
+            await self._store(make_tier_cache_key(texto_completo, tier), ai_response, tier)
+
+    def get_stats(self) -> dict:
+        """Return hit/miss counters and current memory tier size."""
+        hits = self.stats["memory_hits"] + self.stats["db_hits"] + self.stats["inflight_shared"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "enabled": self.enabled,
+        }
+
+
+analysis_cache = AnalysisCache(
+    max_items=ANALYSIS_CACHE_MEMORY_ITEMS,
+    max_rows=ANALYSIS_CACHE_MAX_ROWS,
+    ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS,
+    enabled=ANALYSIS_CACHE_ENABLED,
+)
@@ -0,0 +1,85 @@
+# services/history_service.py
+# Server-side analysis history: saving results and keyset-paginated listing
+
+import base64
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, undefer
+
+from models import AnalysisResult
+from services.trends_service import index_analysis_result
+
+
+def add_analysis_result(db: Session, user_id: int, filename: str, result: dict) -> int:
+    """Add an /upload-pdf payload and its per-analyte observations to the user's history, without committing."""
+    entry = AnalysisResult(user_id=user_id, filename=filename, results_json=result)
+    db.add(entry)
+    db.flush()
+    index_analysis_result(db, entry, result)
+    return entry.id
+
+
+def save_analysis_result(db: Session, user_id: int, filename: str, result: dict) -> int:
+    """Store an /upload-pdf payload in the user's history, with its per-analyte observations, and return its id."""
+    entry_id = add_analysis_result(db, user_id, filename, result)
+    db.commit()
+    return entry_id
+
+
+def encode_cursor(entry: AnalysisResult) -> str:
+    """Opaque cursor pointing just after entry in (created_at DESC, id DESC) order."""
+    raw = f"{entry.created_at.isoformat()}|{entry.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, entry_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(entry_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido") from exc
+
+
+def _summary(entry: AnalysisResult) -> dict:
+    # SQLite returns naive datetimes; they are stored in UTC
+    return {
+        "id": entry.id,
+        "filename": entry.filename,
+        "created_at": entry.created_at.replace(tzinfo=timezone.utc).isoformat(),
+    }
+
+
+def list_history(db: Session, user_id: int, limit: int, cursor: str | None = None) -> dict:
+    """
+    One page of a user's history, newest first.
+
+    Keyset pagination on (created_at, id) served by ix_analysis_results_user_created,
+    so every page costs the same regardless of how deep it is. results_json is
+    deferred and never loaded here.
+    """
+    query = db.query(AnalysisResult).filter(AnalysisResult.user_id == user_id)
+    if cursor:
+        created_at, entry_id = decode_cursor(cursor)
+        query = query.filter(tuple_(AnalysisResult.created_at, AnalysisResult.id) < (created_at, entry_id))
+
+    # Fetch one extra row to know whether there is a next page
+    entries = query.order_by(AnalysisResult.created_at.desc(), AnalysisResult.id.desc()).limit(limit + 1).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    return {
+        "items": [_summary(entry) for entry in entries],
+        "next_cursor": encode_cursor(entries[-1]) if has_more else None,
+    }
+
+
+def get_history_item(db: Session, user_id: int, result_id: int) -> dict | None:
+    """A single history entry including its full results_json."""
+    entry = db.query(AnalysisResult).options(undefer(AnalysisResult.results_json)).filter(
+        AnalysisResult.id == result_id,
+        AnalysisResult.user_id == user_id,
+    ).first()
+    if entry is None:
+        return None
+    return {**_summary(entry), "result": entry.results_json}
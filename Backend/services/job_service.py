@@ -0,0 +1,380 @@
+# services/job_service.py
+# SQLite-backed background job queue for PDF analysis with a bounded worker pool
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from config import JOB_LEASE_SECONDS, JOB_MAX_PENDING_PER_CLIENT, JOB_QUEUE_MAX_DEPTH, JOB_WORKERS
+from models import AnalysisJob, SessionLocal
+from services.analysis_service import analyze_pdf
+from services.history_service import add_analysis_result
+
+logger = logging.getLogger(__name__)
+
+PENDING_STATUSES = ("queued", "processing")
+
+# Number of recent jobs used for the wait/processing time metrics
+METRICS_WINDOW = 500
+
+
+def _percentile(samples: list[float], percentile: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 3)
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    """SQLite returns naive datetimes; they are stored in UTC."""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def serialize_job(job: AnalysisJob) -> dict:
+    """Public representation of a job for GET /jobs/{id}."""
+    created_at = _as_utc(job.created_at)
+    started_at = _as_utc(job.started_at)
+    finished_at = _as_utc(job.finished_at)
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "filename": job.filename,
+        "created_at": created_at.isoformat() if created_at else None,
+        "started_at": started_at.isoformat() if started_at else None,
+        "finished_at": finished_at.isoformat() if finished_at else None,
+        "queue_wait_seconds": round((started_at - created_at).total_seconds(), 3) if started_at else None,
+        "processing_seconds": round((finished_at - started_at).total_seconds(), 3) if finished_at and started_at else None,
+        "result": job.result_json,
+        "error": {"status_code": job.error_status_code, "detail": job.error_message} if job.status == "failed" else None,
+    }
+
+
+def get_job(db: Session, job_id: str, user_id: int | None, client_key: str) -> dict | None:
+    """
+    A job as returned by GET /jobs/{id}; run through models.run_db.
+
+    None when the job does not exist or was submitted by someone else: the
+    authenticated user who submitted it, or for anonymous jobs the same
+    client (rate_limit_key).
+    """
+    job = db.get(AnalysisJob, job_id)
+    if job is None:
+        return None
+    owner = job.user_id == user_id if job.user_id is not None else job.client_key == client_key
+    return serialize_job(job) if owner else None
+
+
+class JobQueue:
+    """
+    Bounded pool of in-process workers consuming analysis jobs.
+
+    Jobs are persisted in the analysis_jobs table and shared by every server
+    process. A process claims a queued job with a conditional UPDATE, so each
+    job runs once, and holds a lease on it that it renews while alive. Jobs
+    whose lease expired (their process died or was stopped) and jobs left
+    queued by another process are picked up on start and then periodically.
+    """
+
+    def __init__(self, workers: int, max_depth: int, max_pending_per_client: int, lease_seconds: int = JOB_LEASE_SECONDS):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_pending_per_client = max_pending_per_client
+        self.lease_seconds = lease_seconds
+        self.worker_id = ""
+        self._queue: asyncio.Queue[str] | None = None
+        self._queued_ids: set[str] = set()
+        self._tasks: list[asyncio.Task] = []
+        self._wait_times: deque[float] = deque(maxlen=METRICS_WINDOW)
+        self._processing_times: deque[float] = deque(maxlen=METRICS_WINDOW)
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected_queue_full": 0,
+            "rejected_client_limit": 0,
+        }
+
+    # Lifecycle
+
+    async def start(self) -> None:
+        """Recover persisted jobs and start the worker and lease tasks."""
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue = asyncio.Queue()
+        self._queued_ids = set()
+        for job_id in await asyncio.to_thread(self._recover_jobs, True):
+            self._enqueue(job_id)
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"analysis-job-worker-{i}")
+            for i in range(self.workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._maintain_leases(), name="analysis-job-leases"))
+        logger.info(f"Cola de trabajos iniciada: {self.workers} workers, {self._queue.qsize()} pendientes")
+
+    async def stop(self) -> None:
+        """Cancel the worker tasks and expire this process' leases so its interrupted jobs are recovered."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.to_thread(self._update_own_leases, datetime.now(timezone.utc))
+
+    def _enqueue(self, job_id: str) -> None:
+        if job_id not in self._queued_ids:
+            self._queued_ids.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    def _recover_jobs(self, startup: bool = False) -> list[str]:
+        """
+        Re-queue processing jobs whose lease expired and return the jobs this
+        process should try to claim: all queued jobs on startup, afterwards
+        only those queued longer than a lease (their process stopped serving them).
+        """
+        now = datetime.now(timezone.utc)
+        stale = (AnalysisJob.lease_expires_at.is_(None)) | (AnalysisJob.lease_expires_at < now)
+        db = SessionLocal()
+        try:
+            recovered = db.query(AnalysisJob).filter(AnalysisJob.status == "processing", stale).update(
+                {"status": "queued", "started_at": None, "worker_id": None, "lease_expires_at": None},
+                synchronize_session=False,
+            )
+            db.commit()
+            if recovered:
+                logger.warning(f"♻️ {recovered} trabajos con la concesión vencida vuelven a la cola")
+            query = db.query(AnalysisJob.id).filter(AnalysisJob.status == "queued")
+            if not startup:
+                query = query.filter(AnalysisJob.created_at < now - timedelta(seconds=self.lease_seconds))
+            return [row.id for row in query.order_by(AnalysisJob.created_at).all()]
+        finally:
+            db.close()
+
+    def _update_own_leases(self, expires_at: datetime) -> None:
+        db = SessionLocal()
+        try:
+            db.query(AnalysisJob).filter(
+                AnalysisJob.worker_id == self.worker_id, AnalysisJob.status == "processing"
+            ).update({"lease_expires_at": expires_at}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _maintain_leases(self) -> None:
+        """Renew the leases of this process' jobs and pick up jobs other processes left behind."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)
+                await asyncio.to_thread(self._update_own_leases, expires_at)
+                for job_id in await asyncio.to_thread(self._recover_jobs):
+                    self._enqueue(job_id)
+            except Exception as e:
+                logger.error(f"Error renovando las concesiones de trabajos: {e}")
+
+    # Submission
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(
+        self, pdf_path: str, filename: str, file_size: int, client_key: str, user_id: int | None = None
+    ) -> dict:
+        """
+        Persist and enqueue a job for an already validated PDF.
+
+        The queue depth limit counts the queued jobs of every process (in the
+        database), so it holds however many workers share the table.
+
+        Raises:
+            HTTPException: 503 when the queue is full, 429 when the client has too many pending jobs
+        """
+        if self._queue is None:
+            raise HTTPException(status_code=503, detail="La cola de procesamiento no está disponible.")
+
+        job, rejection = await asyncio.to_thread(self._create_job, pdf_path, filename, file_size, client_key, user_id)
+        if rejection == "queue_full":
+            self.stats["rejected_queue_full"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="El servidor está ocupado. Intenta de nuevo en unos momentos.",
+                headers={"Retry-After": "30"},
+            )
+        if rejection == "client_limit":
+            self.stats["rejected_client_limit"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail=f"Tienes demasiados análisis pendientes (máximo {self.max_pending_per_client}).",
+                headers={"Retry-After": "30"},
+            )
+
+        self.stats["submitted"] += 1
+        self._enqueue(job["job_id"])
+        logger.info(f"📥 Trabajo encolado: {job['job_id']} ({filename}) | Profundidad: {self.queue_depth()}")
+        return job
+
+    def _create_job(
+        self, pdf_path: str, filename: str, file_size: int, client_key: str, user_id: int | None
+    ) -> tuple[dict | None, str | None]:
+        """Insert a queued job; returns (job, None), or (None, "queue_full" / "client_limit")."""
+        db = SessionLocal()
+        try:
+            queued = db.query(AnalysisJob).filter(AnalysisJob.status == "queued").count()
+            if queued >= self.max_depth:
+                return None, "queue_full"
+
+            pending = db.query(AnalysisJob).filter(
+                AnalysisJob.client_key == client_key,
+                AnalysisJob.status.in_(PENDING_STATUSES),
+            ).count()
+            if pending >= self.max_pending_per_client:
+                return None, "client_limit"
+
+            job = AnalysisJob(
+                id=uuid.uuid4().hex,
+                status="queued",
+                client_key=client_key,
+                user_id=user_id,
+                filename=filename,
+                file_path=pdf_path,
+                file_size=file_size,
+            )
+            db.add(job)
+            db.commit()
+            return serialize_job(job), None
+        finally:
+            db.close()
+
+    # Workers
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._queued_ids.discard(job_id)
+            try:
+                await self._process(job_id)
+            except Exception as e:
+                logger.error(f"❌ Error en worker {worker_id} con el trabajo {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self._claim_job, job_id)
+        if job is None:
+            return
+
+        start_time = time.time()
+        self._wait_times.append(job["queue_wait_seconds"])
+        try:
+            result = await analyze_pdf(job["file_path"], job["filename"], job["file_size"], start_time, job["client_key"])
+            fields = {"status": "completed", "result_json": result}
+            self.stats["completed"] += 1
+        except asyncio.CancelledError:
+            # Shutdown: the row and the spooled PDF are left for recovery on next start
+            logger.info(f"⏸️ Trabajo interrumpido, se reanudará al reiniciar: {job_id}")
+            raise
+        except HTTPException as e:
+            fields = {"status": "failed", "error_status_code": e.status_code, "error_message": str(e.detail)}
+            self.stats["failed"] += 1
+        except Exception as e:
+            logger.error(f"❌ Error procesando trabajo {job_id}: {e}")
+            fields = {"status": "failed", "error_status_code": 500, "error_message": f"Error procesando PDF: {str(e)}"}
+            self.stats["failed"] += 1
+        
+        # Only a completed or failed analysis finishes the job and drops its PDF,
+        # and only while this process still owns it (its lease may have been taken over)
+        self._processing_times.append(time.time() - start_time)
+        fields.update(finished_at=datetime.now(timezone.utc), lease_expires_at=None)
+        if await asyncio.to_thread(self._finish, job, fields) and os.path.exists(job["file_path"]):
+            os.unlink(job["file_path"])
+
+    def _claim_job(self, job_id: str) -> dict | None:
+        """Atomically move a queued job to processing under this process' lease; None if another process has it."""
+        now = datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            claimed = db.query(AnalysisJob).filter(
+                AnalysisJob.id == job_id, AnalysisJob.status == "queued"
+            ).update(
+                {
+                    "status": "processing",
+                    "started_at": now,
+                    "worker_id": self.worker_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+            if not claimed:
+                return None
+            job = db.get(AnalysisJob, job_id)
+            data = serialize_job(job)
+            data.update(file_path=job.file_path, file_size=job.file_size, client_key=job.client_key, user_id=job.user_id)
+            return data
+        finally:
+            db.close()
+
+    def _finish(self, job: dict, fields: dict) -> bool:
+        """
+        Store the outcome of a job this process still owns. A completed job of
+        an authenticated user is saved to their history in the same transaction.
+        """
+        job_id = job["job_id"]
+        db = SessionLocal()
+        try:
+            if fields["status"] == "completed" and job["user_id"] is not None:
+                result = fields["result_json"]
+                fields["result_json"] = {
+                    **result, "history_id": add_analysis_result(db, job["user_id"], job["filename"], result)
+                }
+            updated = db.query(AnalysisJob).filter(
+                AnalysisJob.id == job_id,
+                AnalysisJob.worker_id == self.worker_id,
+                AnalysisJob.status == "processing",
+            ).update(fields, synchronize_session=False)
+            if not updated:
+                db.rollback()
+                logger.warning(f"⚠️ El trabajo {job_id} ya no pertenece a este proceso; se descarta su resultado")
+                return False
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    # Metrics
+
+    def get_stats(self) -> dict:
+        """Queue depth, counters and queue wait vs. processing time percentiles (seconds)."""
+        wait_times = list(self._wait_times)
+        processing_times = list(self._processing_times)
+        return {
+            **self.stats,
+            "queue_depth": self.queue_depth(),
+            "max_depth": self.max_depth,
+            "workers": self.workers,
+            "queue_wait_seconds": {
+                "p50": _percentile(wait_times, 50),
+                "p95": _percentile(wait_times, 95),
+                "max": round(max(wait_times), 3) if wait_times else 0.0,
+            },
+            "processing_seconds": {
+                "p50": _percentile(processing_times, 50),
+                "p95": _percentile(processing_times, 95),
+                "max": round(max(processing_times), 3) if processing_times else 0.0,
+            },
+        }
+
+
+job_queue = JobQueue(
+    workers=JOB_WORKERS,
+    max_depth=JOB_QUEUE_MAX_DEPTH,
+    max_pending_per_client=JOB_MAX_PENDING_PER_CLIENT,
+)
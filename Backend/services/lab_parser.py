@@ -0,0 +1,203 @@
+# services/lab_parser.py
+# Deterministic extraction of lab rows (analyte, value, unit, range, flag) from PDF layout
+
+import re
+import fitz  # PyMuPDF
+
+# Words whose vertical centers are this close (points) belong to the same visual row
+ROW_TOLERANCE = 3.0
+
+_NUMBER_RE = re.compile(r"^[<>≤≥]?\d+(?:[.,]\d+)?$")
+_RANGE_RE = re.compile(
+    r"(?P<low>\d+(?:[.,]\d+)?)\s*(?:-|–|a|to)\s*(?P<high>\d+(?:[.,]\d+)?)"
+    r"|(?P<op>[<>≤≥])\s*(?P<limit>\d+(?:[.,]\d+)?)"
+)
+_UNIT_RE = re.compile(r"^(?=.*[A-Za-zµμ%/])[A-Za-zµμ%/^\d.³]+$")
+_FLAGS = {"H", "L", "*", "ALTO", "BAJO", "HIGH", "LOW", "↑", "↓"}
+_HIGH_FLAGS = {"H", "ALTO", "HIGH", "↑"}
+_LOW_FLAGS = {"L", "BAJO", "LOW", "↓"}
+
+_METADATA_PATTERNS = {
+    "paciente": re.compile(r"\b(?:paciente|nombre|patient|name)\s*:\s*(.+?)(?=\s{2,}|\s+\w+\s*:|$)", re.IGNORECASE),
+    "edad": re.compile(r"\b(?:edad|age)\s*:\s*(\d+[^\s]*(?:\s*años)?)", re.IGNORECASE),
+    "sexo": re.compile(r"\b(?:sexo|sex|género)\s*:\s*(\w+)", re.IGNORECASE),
+    "fecha": re.compile(r"\b(?:fecha(?: de toma| de muestra)?|date)\s*:\s*([\d/.\-]+)", re.IGNORECASE),
+}
+_LEADER_RE = re.compile(r"^[._·…\-:]+$")
+_PAGE_WORDS = {"página", "pagina", "page", "hoja", "pág", "pag"}
+_PAGE_LABEL_RE = re.compile(r"\b(?:p[áa]gina|page|hoja|p[áa]g)\.?\s*\d+(?:\s*(?:de|of|/)\s*\d+)?", re.IGNORECASE)
+_LAB_RE = re.compile(r"\b(laboratorio|laboratory|cl[ií]nica|hospital|diagn[oó]stico)\b", re.IGNORECASE)
+
+
+def parse_number(value: str) -> float | None:
+    try:
+        return float(value.lstrip("<>≤≥").replace(",", "."))
+    except ValueError:
+        return None
+
+
+def parse_reference(reference: str) -> tuple[float | None, float | None]:
+    """(low, high) bounds of a printed reference range ("12-16", "<200", ">40"); None for an open side."""
+    match = _RANGE_RE.search(reference)
+    if not match:
+        return None, None
+    if match.group("low"):
+        return parse_number(match.group("low")), parse_number(match.group("high"))
+    limit = parse_number(match.group("limit"))
+    return (None, limit) if match.group("op") in "<≤" else (limit, None)
+
+
+def page_lines(page: fitz.Page) -> list[str]:
+    """
+    Rebuild the visual rows of a page from PyMuPDF word positions.
+
+    Table columns are often separate text blocks, so words are grouped by
+    vertical position rather than by block/line number.
+    """
+    words = sorted(page.get_text("words"), key=lambda w: ((w[1] + w[3]) / 2, w[0]))
+    rows: list[list[tuple]] = []
+    row_center = None
+    for word in words:
+        center = (word[1] + word[3]) / 2
+        if row_center is None or abs(center - row_center) > ROW_TOLERANCE:
+            rows.append([])
+            row_center = center
+        rows[-1].append(word)
+    return [" ".join(w[4] for w in sorted(row, key=lambda w: w[0])) for row in rows]
+
+
+def parse_lab_line(line: str) -> dict | None:
+    """
+    Parse one visual row into a lab result, or return None if it is not one.
+
+    A row needs an analyte name, a numeric value and at least a unit or a reference range.
+    """
+    tokens = line.split()
+    value_index = next((i for i, token in enumerate(tokens) if _NUMBER_RE.match(token)), None)
+    if not value_index:
+        return None
+
+    # Drop dot leaders ("Glucosa ........ 95")
+    analyte_tokens = [t for t in tokens[:value_index] if not _LEADER_RE.match(t)]
+    analyte = " ".join(analyte_tokens).rstrip(".")
+    # "Edad: 45", "Página 1 de 2" and similar are metadata, not results
+    if analyte.endswith(":") or not any(c.isalpha() for c in analyte):
+        return None
+    if analyte_tokens[0].lower().rstrip(".") in _PAGE_WORDS:
+        return None
+
+    value = tokens[value_index]
+    rest = tokens[value_index + 1:]
+    flag = ""
+    if rest and rest[0].upper() in _FLAGS:
+        flag = rest.pop(0).upper()
+
+    unit = ""
+    if rest and _UNIT_RE.match(rest[0]) and not _RANGE_RE.match(rest[0]):
+        unit = rest.pop(0)
+
+    remainder = " ".join(rest)
+    reference = ""
+    range_match = _RANGE_RE.search(remainder)
+    if range_match:
+        reference = range_match.group(0).replace(" ", "")
+        remainder = remainder[:range_match.start()] + remainder[range_match.end():]
+
+    if not flag:
+        flag = next((t.upper() for t in remainder.split() if t.upper() in _FLAGS), "")
+
+    if not unit and not reference:
+        return None
+
+    # Derive the flag from the reference range when the report does not print one
+    numeric_value = parse_number(value)
+    if not flag and range_match and numeric_value is not None:
+        if range_match.group("low"):
+            low, high = parse_number(range_match.group("low")), parse_number(range_match.group("high"))
+            if numeric_value < low:
+                flag = "L"
+            elif numeric_value > high:
+                flag = "H"
+        else:
+            limit = parse_number(range_match.group("limit"))
+            op = range_match.group("op")
+            if op in "<≤" and numeric_value > limit:
+                flag = "H"
+            elif op in ">≥" and numeric_value < limit:
+                flag = "L"
+
+    if flag in _HIGH_FLAGS:
+        flag = "H"
+    elif flag in _LOW_FLAGS:
+        flag = "L"
+
+    return {"analito": analyte, "valor": value, "unidad": unit, "referencia": reference, "bandera": flag}
+
+
+def _is_candidate_line(line: str) -> bool:
+    """Lines that look like they could carry a result (text plus a number)."""
+    return any(c.isalpha() for c in line) and any(_NUMBER_RE.match(t) for t in line.split())
+
+
+def _is_metadata_line(line: str) -> bool:
+    """Candidate lines fully explained by patient or page metadata ("Edad: 52 años", "Página 1 de 2")."""
+    rest = _PAGE_LABEL_RE.sub(" ", line)
+    for pattern in _METADATA_PATTERNS.values():
+        rest = pattern.sub(" ", rest)
+    return not _is_candidate_line(rest)
+
+
+def parse_lab_pages(pages: list[list[str]]) -> dict:
+    """
+    Extract lab rows and patient/lab metadata from the visual rows of each page.
+
+    Candidate lines that are neither a parsed row nor metadata are kept
+    verbatim in "unparsed": they may carry results the parser cannot read.
+
+    Returns:
+        Dict with rows, metadata, unparsed and confidence (parsed rows / candidate lines)
+    """
+    rows = []
+    unparsed = []
+    metadata: dict[str, str] = {}
+    candidates = 0
+
+    for lines in pages:
+        for line in lines:
+            for key, pattern in _METADATA_PATTERNS.items():
+                if key not in metadata:
+                    match = pattern.search(line)
+                    if match:
+                        metadata[key] = match.group(1).strip()
+            if "laboratorio" not in metadata and _LAB_RE.search(line) and not _is_candidate_line(line):
+                metadata["laboratorio"] = line.strip()
+
+            if not _is_candidate_line(line):
+                continue
+            candidates += 1
+            row = parse_lab_line(line)
+            if row:
+                rows.append(row)
+            elif not _is_metadata_line(line):
+                unparsed.append(line)
+
+    confidence = round(len(rows) / candidates, 3) if candidates else 0.0
+    return {"rows": rows, "metadata": metadata, "unparsed": unparsed, "confidence": confidence}
+
+
+def build_compact_table(parsed: dict) -> str:
+    """
+    Render parsed rows and metadata as the compact table embedded in the prompt.
+
+    Unparsed candidate lines follow the table verbatim so no result is lost.
+    """
+    lines = ["DATOS EXTRAÍDOS AUTOMÁTICAMENTE DEL REPORTE (tabla de resultados)"]
+    for key, value in parsed["metadata"].items():
+        lines.append(f"{key.upper()}: {value}")
+    lines.append("analito | valor | unidad | referencia | bandera")
+    for row in parsed["rows"]:
+        lines.append(f"{row['analito']} | {row['valor']} | {row['unidad']} | {row['referencia']} | {row['bandera']}")
+    if parsed["unparsed"]:
+        lines.append("OTRAS LÍNEAS DEL REPORTE NO INTERPRETADAS AUTOMÁTICAMENTE (texto original)")
+        lines.extend(parsed["unparsed"])
+    return "\n".join(lines)
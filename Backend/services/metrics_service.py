@@ -0,0 +1,237 @@
+# services/metrics_service.py
+# In-process latency histograms and counters (Prometheus text format) and per-request Server-Timing
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds (seconds) of the stage latency buckets; +Inf is implicit
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage durations (ms) of the current request, set by the Server-Timing middleware
+_request_timings: ContextVar[dict[str, float] | None] = ContextVar("request_timings", default=None)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labels:
+            values = [((), 0)]
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # key -> [per-bucket counts (+Inf last), sum, count]
+        self._series: dict[tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, [list(counts), total, count]) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = bound if isinstance(bound, str) else f"{bound:g}"
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+STAGE_DURATION = Histogram(
+    "webcheck_stage_duration_seconds",
+    "Duration of each analysis pipeline stage (read, extract, prompt_build, llm, json_parse).",
+    labels=("stage",),
+)
+AI_TOKENS = Counter(
+    "webcheck_ai_tokens_total",
+    "Tokens reported by the AI backend, by direction (input/output).",
+    labels=("type",),
+)
+AI_RESPONSES = Counter(
+    "webcheck_ai_responses_total",
+    "AI responses by parse outcome (schema/repaired/fallback/error); repair and fallback rates are shares of the total.",
+    labels=("outcome",),
+)
+AI_CALL_ATTEMPTS = Counter(
+    "webcheck_ai_call_attempts_total",
+    "AI backend attempts, retries included, by outcome (success/timeout/retryable_error/error).",
+    labels=("outcome",),
+)
+AI_HEDGES = Counter(
+    "webcheck_ai_hedged_requests_total",
+    "Hedged second AI requests, by result (launched/won).",
+    labels=("result",),
+)
+AI_CIRCUIT_REJECTIONS = Counter(
+    "webcheck_ai_circuit_rejections_total",
+    "AI calls rejected without reaching the backend because the circuit was open.",
+)
+OCR_PAGES = Counter(
+    "webcheck_ocr_pages_total",
+    "Extracted pages by text source (text_layer/ocr/ocr_cached/ocr_skipped).",
+    labels=("source",),
+)
+OCR_PAGE_DURATION = Histogram(
+    "webcheck_ocr_page_seconds",
+    "Time to rasterize and OCR one scanned page.",
+)
+TOKEN_ADMISSIONS = Counter(
+    "webcheck_token_admissions_total",
+    "Token budget admission checks, by result (admitted/queued/rejected_user/rejected_global).",
+    labels=("result",),
+)
+ROUTING_DECISIONS = Counter(
+    "webcheck_routing_decisions_total",
+    "Analysis path chosen by the model router, by tier (template/light/full).",
+    labels=("tier",),
+)
+INVALID_DOCUMENTS = Counter(
+    "webcheck_invalid_documents_total",
+    "Uploads rejected because the AI judged them not to be lab results.",
+)
+RATE_LIMIT_HITS = Counter(
+    "webcheck_rate_limit_hits_total",
+    "Requests rejected by the rate limiter, by endpoint.",
+    labels=("endpoint",),
+)
+AUTH_CACHE_REQUESTS = Counter(
+    "webcheck_auth_cache_requests_total",
+    "Authentication cache lookups, by cache (token/user) and result (hit/miss).",
+    labels=("cache", "result"),
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "webcheck_password_hash_seconds",
+    "Time spent hashing or verifying a password on the hashing executor.",
+    labels=("operation",),
+)
+PASSWORD_HASH_QUEUE_WAIT = Histogram(
+    "webcheck_password_hash_queue_seconds",
+    "Time a hash/verify call waited for a free hashing worker.",
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "webcheck_password_hash_rejected_total",
+    "Register/login requests rejected with 503 because the hashing queue was full.",
+)
+
+REGISTRY = [
+    STAGE_DURATION, AI_TOKENS, AI_RESPONSES, AI_CALL_ATTEMPTS, AI_HEDGES, AI_CIRCUIT_REJECTIONS,
+    OCR_PAGES, OCR_PAGE_DURATION, TOKEN_ADMISSIONS, ROUTING_DECISIONS, INVALID_DOCUMENTS, RATE_LIMIT_HITS, AUTH_CACHE_REQUESTS,
+    PASSWORD_HASH_DURATION, PASSWORD_HASH_QUEUE_WAIT, PASSWORD_HASH_REJECTED,
+]
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Time a pipeline stage into STAGE_DURATION and the current request's Server-Timing.
+
+    Stages that run several times in one request (e.g. a batch upload) are summed.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed * 1000
+
+
+def start_request_timing() -> dict[str, float]:
+    """Start collecting stage durations for the current request (called by the middleware)."""
+    timings: dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def format_server_timing(timings: dict[str, float], total_seconds: float) -> str:
+    """Build the Server-Timing header value, e.g. 'extract;dur=12.3, llm;dur=950.1, total;dur=970.4'."""
+    entries = [f"{stage};dur={duration:.1f}" for stage, duration in timings.items()]
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """
+    Add a Server-Timing header with the stage durations recorded by stage_timer.
+
+    Plain ASGI middleware (not @app.middleware) so it adds no extra task per request.
+    Streaming responses only include the stages finished before their headers are sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings = start_request_timing()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = format_server_timing(timings, time.perf_counter() - start)
+                message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
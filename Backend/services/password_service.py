@@ -0,0 +1,92 @@
+# services/password_service.py
+# Password hashing on a dedicated, bounded executor (kept off the event loop and the shared threadpool)
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+
+from fastapi import HTTPException
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from config import PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS
+from services.metrics_service import PASSWORD_HASH_DURATION, PASSWORD_HASH_QUEUE_WAIT, PASSWORD_HASH_REJECTED
+
+# hashlib releases the GIL while hashing, so threads give real parallelism here
+_executor: ThreadPoolExecutor | None = None
+
+# Hash/verify calls submitted and not finished yet (queued + running)
+_pending = 0
+
+
+def get_password_executor() -> ThreadPoolExecutor:
+    """Return the hashing executor, creating it on first use (again after a shutdown)."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    return _executor
+
+
+@cache
+def current_hash_method() -> str:
+    """PASSWORD_HASH_METHOD with werkzeug's defaults filled in, as stored in hashes (e.g. "scrypt" -> "scrypt:32768:8:1")."""
+    name, *params = PASSWORD_HASH_METHOD.split(":")
+    if name == "scrypt":
+        defaults = ["32768", "8", "1"]
+    elif name == "pbkdf2":
+        defaults = ["sha256", str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        return PASSWORD_HASH_METHOD
+    return ":".join([name, *params, *defaults[len(params):]])
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """True when a stored hash was made with a different algorithm or cost than the configured one."""
+    return password_hash.split("$", 1)[0] != current_hash_method()
+
+
+async def _run(operation: str, fn, *args):
+    """Run fn on the hashing executor, rejecting with 503 when too many calls are already waiting."""
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        PASSWORD_HASH_REJECTED.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="El servidor está ocupado. Intenta de nuevo en unos momentos.",
+            headers={"Retry-After": "5"},
+        )
+
+    submitted_at = time.perf_counter()
+
+    def timed_call():
+        started_at = time.perf_counter()
+        PASSWORD_HASH_QUEUE_WAIT.observe(started_at - submitted_at)
+        try:
+            return fn(*args)
+        finally:
+            PASSWORD_HASH_DURATION.observe(time.perf_counter() - started_at, operation=operation)
+
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_password_executor(), timed_call)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+async def verify_password(password_hash: str, password: str) -> bool:
+    return await _run("verify", check_password_hash, password_hash, password)
+
+
+def pending_hashes() -> int:
+    return _pending
+
+
+def shutdown_password_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -1,33 +1,504 @@
 # services/pdf_service.py
 # PDF processing and text extraction
 
+import asyncio
 import fitz  # PyMuPDF
+import hashlib
 import logging
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cache
+from fastapi import HTTPException
+from config import (
+    LAB_PARSER_ENABLED, LAB_PARSER_MIN_CONFIDENCE, LAB_PARSER_MIN_ROWS, MAX_PDF_PAGES,
+    OCR_CACHE_MAX_ITEMS, OCR_DPI, OCR_ENABLED, OCR_LANGUAGE, OCR_MAX_PAGES, OCR_MIN_TEXT_CHARS,
+    PDF_EXECUTOR_TYPE, PDF_EXECUTOR_WORKERS, PDF_PAGE_WORKERS, PDF_PAGES_PER_TASK, PDF_PARALLEL_MIN_PAGES,
+    REPEATED_LINE_MIN_PAGE_RATIO, TEXT_COMPACTION_ENABLED
+)
+from services.ai_service import estimate_tokens, estimate_tokens_from_chars
+from services.lab_parser import build_compact_table, page_lines, parse_lab_line, parse_lab_pages
+from services.metrics_service import OCR_PAGE_DURATION, OCR_PAGES, stage_timer
 
 logger = logging.getLogger(__name__)
 
+# Executor used to keep PyMuPDF work off the event loop (created on first use)
+_executor: Executor | None = None
 
-def extract_text_from_pdf(pdf_bytes: bytes) -> tuple[str, int]:
+# Process pool reading page ranges of large PDFs in parallel (created on first use)
+_page_executor: ProcessPoolExecutor | None = None
+
+# OCR results by page image hash -> (text, layout_lines), LRU in the main process
+_ocr_cache: OrderedDict[str, tuple[str, list[str]]] = OrderedDict()
+_ocr_cache_lock = threading.Lock()
+
+_PAGE_NUMBER_RE = re.compile(
+    r"^(?:p[áa]gina|page|hoja|p[áa]g\.?)\s*\d+(?:\s*(?:de|of|/)\s*\d+)?$",
+    re.IGNORECASE
+)
+# A bare "2/3" or "2 de 3" can also be a result (titer 1/160, blood pressure 120/80);
+# it is only a page number as the first or last line of a page and out of the document's page count
+_BARE_PAGE_NUMBER_RE = re.compile(r"^(\d+)\s*(?:de|of|/)\s*(\d+)$", re.IGNORECASE)
+# Headers/footers are only looked for in the first/last lines of each page,
+# and short lines (units, single values) are never treated as boilerplate
+_EDGE_LINES = 8
+_MIN_BOILERPLATE_CHARS = 8
+# A value followed by a unit ("95 mg/dL", "38.6 %", "6.5 10^3/uL"): results repeated
+# across pages (cumulative reports, repeat measurements) are never boilerplate
+_VALUE_WITH_UNIT_RE = re.compile(
+    r"(?<![\w.,/-])[<>≤≥]?\d+(?:[.,]\d+)?\s?(?:%|[A-Za-zµμ]{1,3}|[\w^³µμ]+/[\w³µμ]+)(?=[\s,;)]|$)"
+)
+
+_LEADER_RUN_RE = re.compile(r"(?:\s*[._·…]){3,}\s*")
+_SPACE_RE = re.compile(r"[ \t\u00a0]+")
+
+
+def open_pdf(pdf_source: str | bytes) -> fitz.Document:
+    """Open a PDF from a file path or from in-memory bytes."""
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return fitz.open(stream=pdf_source, filetype="pdf")
+    return fitz.open(pdf_source, filetype="pdf")
+
+
+def extract_text_from_pdf(pdf_source: str | bytes) -> tuple[str, int]:
     """
     Extract text content from a PDF file.
     
     Args:
-        pdf_bytes: The PDF file content as bytes
+        pdf_source: Path to the PDF file (preferred, opened without copying) or its content as bytes
         
     Returns:
         A tuple of (extracted_text, page_count)
     """
-    texto_completo = ""
-    
-    pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+    pdf_document = open_pdf(pdf_source)
     num_paginas = pdf_document.page_count
     logger.info(f"📄 Total de páginas: {num_paginas}")
     
-    for page_num in range(num_paginas):
-        page = pdf_document.load_page(page_num)
-        texto_completo += page.get_text()
+    texto_completo = "".join(page.get_text() for page in pdf_document)
     
     pdf_document.close()
     logger.info(f"✅ Texto extraído: {len(texto_completo)} caracteres")
     
     return texto_completo, num_paginas
+
+
+def _normalize_line(line: str) -> str:
+    """Replace dot leaders and collapse whitespace inside a line."""
+    line = _LEADER_RUN_RE.sub(" ", line)
+    return _SPACE_RE.sub(" ", line).strip()
+
+
+def _is_bare_page_number(line: str, page_count: int) -> bool:
+    match = _BARE_PAGE_NUMBER_RE.match(line)
+    return match is not None and int(match.group(2)) == page_count and 1 <= int(match.group(1)) <= page_count
+
+
+def _is_result_line(line: str) -> bool:
+    return _VALUE_WITH_UNIT_RE.search(line) is not None or parse_lab_line(line) is not None
+
+
+def compact_page_texts(page_texts: list[str]) -> tuple[str, dict]:
+    """
+    Normalize per-page text before prompting.
+    
+    Lines near the top or bottom of a page that repeat on at least
+    REPEATED_LINE_MIN_PAGE_RATIO of the pages (letterhead, patient banner,
+    legal footer) are kept only once, unless they look like a result, page
+    numbers are dropped (a bare "2/3" only at the edge of a page and
+    matching the page count, so values like 1/160 stay), dot leaders and layout whitespace are collapsed,
+    and the result is built with a single join.
+    
+    Args:
+        page_texts: The text of each page, in order
+        
+    Returns:
+        A tuple of (compacted_text, stats)
+    """
+    pages = [[line for line in map(_normalize_line, text.splitlines()) if line] for text in page_texts]
+    
+    repeated = set()
+    if len(pages) >= 2:
+        min_pages = max(2, math.ceil(len(pages) * REPEATED_LINE_MIN_PAGE_RATIO))
+        counts = Counter(
+            line
+            for lines in pages
+            for line in set(lines[:_EDGE_LINES] + lines[-_EDGE_LINES:])
+            if len(line) >= _MIN_BOILERPLATE_CHARS and not _is_result_line(line)
+        )
+        repeated = {line for line, count in counts.items() if count >= min_pages}
+    
+    seen = set()
+    kept = []
+    removed = 0
+    for lines in pages:
+        edge_start, edge_end = _EDGE_LINES, len(lines) - _EDGE_LINES
+        for index, line in enumerate(lines):
+            if _PAGE_NUMBER_RE.match(line) or (
+                (index == 0 or index == len(lines) - 1) and _is_bare_page_number(line, len(pages))
+            ):
+                removed += 1
+                continue
+            if line in repeated and (index < edge_start or index >= edge_end):
+                if line in seen:
+                    removed += 1
+                    continue
+                seen.add(line)
+            kept.append(line)
+    
+    text = "\n".join(kept)
+    chars_before = sum(len(page_text) for page_text in page_texts)
+    stats = {
+        "chars_before": chars_before,
+        "chars_after": len(text),
+        "chars_saved": chars_before - len(text),
+        "tokens_saved_estimate": estimate_tokens_from_chars(chars_before) - estimate_tokens(text),
+        "repeated_lines_removed": removed,
+    }
+    return text, stats
+
+
+def count_pages(pdf_source: str | bytes) -> int:
+    """Page count of a PDF (only the cross-reference table is read)."""
+    with open_pdf(pdf_source) as pdf_document:
+        return pdf_document.page_count
+
+
+def page_needs_ocr(page: fitz.Page, text: str) -> bool:
+    """A page with (almost) no text layer that carries an image, i.e. a scanned page."""
+    return len(text.strip()) < OCR_MIN_TEXT_CHARS and bool(page.get_images())
+
+
+def page_image_hash(pdf_document: fitz.Document, page: fitz.Page) -> str:
+    """
+    OCR cache key of a page: its content stream and the stored bytes of its
+    images (no rasterizing needed), plus the OCR settings.
+    """
+    digest = hashlib.sha256(f"{OCR_DPI}|{OCR_LANGUAGE}|".encode())
+    digest.update(page.read_contents())
+    for image in page.get_images():
+        digest.update(pdf_document.xref_stream_raw(image[0]) or b"")
+    return digest.hexdigest()
+
+
+def extract_page_range(
+    pdf_source: str | bytes, start: int, stop: int
+) -> tuple[list[str], list[list[str]], list[tuple[int, str]]]:
+    """
+    Read pages [start, stop) of a PDF: their text and, for the lab parser, their visual rows.
+    
+    Opens the document itself so it can run in any worker process.
+    
+    Returns:
+        A tuple of (page_texts, layout_lines, scanned pages as (page_number, image_hash))
+    """
+    page_texts = []
+    layout_lines = []
+    scans = []
+    with open_pdf(pdf_source) as pdf_document:
+        for page_number in range(start, min(stop, pdf_document.page_count)):
+            page = pdf_document[page_number]
+            text = page.get_text()
+            page_texts.append(text)
+            if LAB_PARSER_ENABLED:
+                layout_lines.append(page_lines(page))
+            if OCR_ENABLED and page_needs_ocr(page, text):
+                scans.append((page_number, page_image_hash(pdf_document, page)))
+    return page_texts, layout_lines, scans
+
+
+@cache
+def tessdata_dir() -> str | None:
+    """
+    Tesseract's language data folder, or None when Tesseract is not installed.
+    
+    Looked up once: PyMuPDF runs a subprocess to find it.
+    """
+    try:
+        return fitz.get_tessdata()
+    except RuntimeError:
+        logger.warning("⚠️ Tesseract no está instalado: las páginas escaneadas se analizarán sin OCR")
+        return None
+
+
+def ocr_page(pdf_source: str | bytes, page_number: int, tessdata: str) -> tuple[str, list[str], float]:
+    """
+    Rasterize one page at OCR_DPI and read it with Tesseract.
+    
+    Opens the document itself so it can run in any worker process.
+    
+    Returns:
+        A tuple of (text, layout_lines, seconds)
+    """
+    started = time.perf_counter()
+    with open_pdf(pdf_source) as pdf_document:
+        pixmap = pdf_document[page_number].get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY)
+    with fitz.open("pdf", pixmap.pdfocr_tobytes(language=OCR_LANGUAGE, tessdata=tessdata)) as ocr_document:
+        page = ocr_document[0]
+        text = page.get_text()
+        lines = page_lines(page) if LAB_PARSER_ENABLED else []
+    return text, lines, time.perf_counter() - started
+
+
+def _ocr_cache_get(image_hash: str) -> tuple[str, list[str]] | None:
+    with _ocr_cache_lock:
+        result = _ocr_cache.get(image_hash)
+        if result is not None:
+            _ocr_cache.move_to_end(image_hash)
+        return result
+
+
+def _ocr_cache_put(image_hash: str, result: tuple[str, list[str]]) -> None:
+    with _ocr_cache_lock:
+        _ocr_cache[image_hash] = result
+        _ocr_cache.move_to_end(image_hash)
+        while len(_ocr_cache) > OCR_CACHE_MAX_ITEMS:
+            _ocr_cache.popitem(last=False)
+
+
+def _plan_ocr(
+    scans: list[tuple[int, str]], tessdata: str | None
+) -> tuple[dict[int, tuple[str, list[str]]], list[tuple[int, str]]]:
+    """Split the scanned pages (up to OCR_MAX_PAGES) into cached OCR results and pages still to OCR."""
+    if tessdata is None:
+        return {}, []
+    cached, pending = {}, []
+    for page_number, image_hash in scans[:OCR_MAX_PAGES]:
+        result = _ocr_cache_get(image_hash)
+        if result is None:
+            pending.append((page_number, image_hash))
+        else:
+            cached[page_number] = result
+    return cached, pending
+
+
+def _apply_ocr(
+    page_texts: list[str],
+    layout_lines: list[list[str]],
+    scans: list[tuple[int, str]],
+    cached: dict[int, tuple[str, list[str]]],
+    pending: list[tuple[int, str]],
+    results: list[tuple[str, list[str], float]],
+    available: bool,
+) -> dict:
+    """Replace the empty text layers with OCR text (in place) and summarize the OCR work."""
+    recognized = dict(cached)
+    timings_ms = []
+    for (page_number, image_hash), (text, lines, seconds) in zip(pending, results):
+        _ocr_cache_put(image_hash, (text, lines))
+        OCR_PAGE_DURATION.observe(seconds)
+        timings_ms.append(round(seconds * 1000, 1))
+        recognized[page_number] = (text, lines)
+    for page_number, (text, lines) in recognized.items():
+        page_texts[page_number] = text
+        if LAB_PARSER_ENABLED:
+            layout_lines[page_number] = lines
+    
+    skipped = len(scans) - len(recognized)
+    OCR_PAGES.inc(len(page_texts) - len(scans), source="text_layer")
+    for source, count in (("ocr", len(pending)), ("ocr_cached", len(cached)), ("ocr_skipped", skipped)):
+        if count:
+            OCR_PAGES.inc(count, source=source)
+    if scans:
+        logger.info(
+            f"🔍 OCR: {len(scans)} páginas escaneadas | {len(pending)} leídas, {len(cached)} en caché, "
+            f"{skipped} omitidas | {sum(timings_ms):.0f} ms"
+        )
+    return {
+        "available": available,
+        "scanned_pages": len(scans),
+        "ocr_pages": len(pending),
+        "cached_pages": len(cached),
+        "skipped_pages": skipped,
+        "ocr_share": round(len(recognized) / len(page_texts), 3) if page_texts else 0.0,
+        "page_ms": timings_ms,
+    }
+
+
+def ocr_scanned_pages(
+    pdf_source: str | bytes, page_texts: list[str], layout_lines: list[list[str]], scans: list[tuple[int, str]]
+) -> dict:
+    """
+    OCR the scanned pages found by extract_page_range in this process and put
+    their text in place (cached by page image hash).
+    
+    Returns:
+        OCR stats for the extraction metadata
+    """
+    tessdata = tessdata_dir() if scans else None
+    cached, pending = _plan_ocr(scans, tessdata)
+    results = [ocr_page(pdf_source, page_number, tessdata) for page_number, _ in pending]
+    return _apply_ocr(page_texts, layout_lines, scans, cached, pending, results, available=tessdata is not None)
+
+
+def extract_for_analysis(pdf_source: str | bytes) -> dict:
+    """
+    Extract a PDF and prepare the text that will be sent to the AI.
+    
+    Scanned pages without a text layer are OCR'd; all other pages skip OCR.
+    
+    Args:
+        pdf_source: Path to the PDF file or its content as bytes
+        
+    Returns:
+        Dict with text, prompt_text, pages, lab_rows and extraction metadata
+    """
+    num_paginas = count_pages(pdf_source)
+    page_texts, layout_lines, scans = extract_page_range(pdf_source, 0, num_paginas)
+    ocr_stats = ocr_scanned_pages(pdf_source, page_texts, layout_lines, scans)
+    document = build_analysis_document(page_texts, layout_lines, num_paginas)
+    document["extraction"]["ocr"] = ocr_stats
+    return document
+
+
+def build_analysis_document(page_texts: list[str], layout_lines: list[list[str]], num_paginas: int) -> dict:
+    """
+    Prepare the text that will be sent to the AI from the extracted pages.
+    
+    Page text is compacted (see compact_page_texts). When the structured lab
+    parser is confident enough, the prompt carries a compact (analyte, value,
+    unit, range, flag) table instead of the page text, followed by the
+    candidate lines the parser could not read.
+    
+    Args:
+        page_texts: The text of each page, in order
+        layout_lines: The visual rows of each page (empty when the lab parser is off)
+        num_paginas: Page count of the PDF
+        
+    Returns:
+        Dict with text, prompt_text, pages, lab_rows, lab_metadata and extraction metadata
+    """
+    raw_chars = sum(len(page_text) for page_text in page_texts)
+    extraction = {"mode": "raw", "rows": 0, "unparsed_lines": 0, "confidence": 0.0}
+    if TEXT_COMPACTION_ENABLED:
+        text, extraction["compaction"] = compact_page_texts(page_texts)
+        logger.info(
+            f"🧹 Texto compactado: {extraction['compaction']['chars_saved']} caracteres "
+            f"(~{extraction['compaction']['tokens_saved_estimate']} tokens) ahorrados"
+        )
+    else:
+        text = "".join(page_texts)
+    prompt_text = text
+    lab_rows = []
+    lab_metadata = {}
+    
+    if LAB_PARSER_ENABLED:
+        parsed = parse_lab_pages(layout_lines)
+        lab_rows = parsed["rows"]
+        lab_metadata = parsed["metadata"]
+        extraction.update(rows=len(lab_rows), unparsed_lines=len(parsed["unparsed"]), confidence=parsed["confidence"])
+        if len(parsed["rows"]) >= LAB_PARSER_MIN_ROWS and parsed["confidence"] >= LAB_PARSER_MIN_CONFIDENCE:
+            compact_table = build_compact_table(parsed)
+            # Already-compact reports can be shorter as text than as a table
+            if len(compact_table) < len(text):
+                prompt_text = compact_table
+                extraction["mode"] = "structured"
+    
+    extraction["raw_tokens_estimate"] = estimate_tokens_from_chars(raw_chars)
+    extraction["prompt_tokens_estimate"] = estimate_tokens(prompt_text)
+    logger.info(
+        f"✅ Texto extraído: {raw_chars} caracteres, {num_paginas} páginas | "
+        f"Modo: {extraction['mode']} ({extraction['rows']} filas, confianza {extraction['confidence']}) | "
+        f"Tokens estimados: {extraction['raw_tokens_estimate']} -> {extraction['prompt_tokens_estimate']}"
+    )
+    
+    return {
+        "text": text,
+        "prompt_text": prompt_text,
+        "pages": num_paginas,
+        "lab_rows": lab_rows,
+        "lab_metadata": lab_metadata,
+        "extraction": extraction,
+    }
+
+
+def get_pdf_executor() -> Executor:
+    """
+    Return the shared executor for PDF extraction, creating it on first use.
+
+    PDF_EXECUTOR_TYPE selects a thread pool (default) or a process pool.
+    """
+    global _executor
+    if _executor is None:
+        if PDF_EXECUTOR_TYPE == "process":
+            _executor = ProcessPoolExecutor(max_workers=PDF_EXECUTOR_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=PDF_EXECUTOR_WORKERS,
+                thread_name_prefix="pdf-extract"
+            )
+        logger.info(f"Executor de PDF iniciado: {PDF_EXECUTOR_TYPE} ({PDF_EXECUTOR_WORKERS} workers)")
+    return _executor
+
+
+def get_page_executor() -> ProcessPoolExecutor:
+    """Return the process pool for page ranges, creating it on first use."""
+    global _page_executor
+    if _page_executor is None:
+        _page_executor = ProcessPoolExecutor(max_workers=PDF_PAGE_WORKERS)
+        logger.info(f"Executor de páginas iniciado: {PDF_PAGE_WORKERS} procesos")
+    return _page_executor
+
+
+def shutdown_pdf_executor() -> None:
+    """Shut down the PDF extraction executors if they were started."""
+    global _executor, _page_executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    if _page_executor is not None:
+        _page_executor.shutdown(wait=False, cancel_futures=True)
+        _page_executor = None
+
+
+async def extract_for_analysis_async(pdf_source: str | bytes) -> dict:
+    """
+    Extract a PDF for analysis without blocking the event loop.
+    
+    Short PDFs are read in one task on the extraction executor. From
+    PDF_PARALLEL_MIN_PAGES pages on (and with at least two page workers),
+    ranges of PDF_PAGES_PER_TASK pages are read in parallel by the page
+    process pool, each process opening the document itself. Scanned pages
+    not in the OCR cache are then OCR'd in parallel on the same pool.
+    
+    Raises:
+        HTTPException: 400 if the PDF has more than MAX_PDF_PAGES pages
+    """
+    loop = asyncio.get_running_loop()
+    with stage_timer("extract"):
+        num_paginas = await loop.run_in_executor(get_pdf_executor(), count_pages, pdf_source)
+        if num_paginas > MAX_PDF_PAGES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"El PDF tiene demasiadas páginas ({num_paginas}). Máximo permitido: {MAX_PDF_PAGES}."
+            )
+        
+        if num_paginas < PDF_PARALLEL_MIN_PAGES or PDF_PAGE_WORKERS < 2:
+            page_texts, layout_lines, scans = await loop.run_in_executor(
+                get_pdf_executor(), extract_page_range, pdf_source, 0, num_paginas
+            )
+        else:
+            ranges = await asyncio.gather(*(
+                loop.run_in_executor(get_page_executor(), extract_page_range, pdf_source, start, start + PDF_PAGES_PER_TASK)
+                for start in range(0, num_paginas, PDF_PAGES_PER_TASK)
+            ))
+            page_texts = [text for texts, _, _ in ranges for text in texts]
+            layout_lines = [lines for _, page_layouts, _ in ranges for lines in page_layouts]
+            scans = [scan for _, _, range_scans in ranges for scan in range_scans]
+            logger.info(f"📄 {num_paginas} páginas extraídas en {len(ranges)} rangos paralelos")
+        
+        tessdata = await asyncio.to_thread(tessdata_dir) if scans else None
+        cached, pending = _plan_ocr(scans, tessdata)
+        results = await asyncio.gather(*(
+            loop.run_in_executor(get_page_executor(), ocr_page, pdf_source, page_number, tessdata)
+            for page_number, _ in pending
+        ))
+        ocr_stats = _apply_ocr(page_texts, layout_lines, scans, cached, pending, results, available=tessdata is not None)
+        
+        document = await loop.run_in_executor(
+            get_pdf_executor(), build_analysis_document, page_texts, layout_lines, num_paginas
+        )
+        document["extraction"]["ocr"] = ocr_stats
+        return document
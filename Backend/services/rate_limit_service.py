@@ -0,0 +1,216 @@
+# services/rate_limit_service.py
+# The single slowapi limiter shared by every router, its client key and the shared counter backends
+
+import ipaddress
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from fastapi import Request
+from jose import JWTError, jwt
+from limits.storage import Storage
+from slowapi import Limiter
+
+from config import (
+    JWT_ALGORITHM, JWT_SECRET_KEY, RATE_LIMIT_STORAGE_URI, RATE_LIMIT_TRUSTED_PROXIES,
+    SQLITE_BUSY_TIMEOUT_MS
+)
+from services.auth_cache_service import user_cache
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    return "*" in RATE_LIMIT_TRUSTED_PROXIES or host in RATE_LIMIT_TRUSTED_PROXIES
+
+
+def client_address(request: Request) -> str:
+    """
+    The client IP. X-Forwarded-For is only honoured when the direct peer is a
+    trusted proxy, and then the right-most address that is not itself a
+    trusted proxy wins (left-most entries can be forged by the client).
+    """
+    host = request.client.host if request.client else "unknown"
+    if not RATE_LIMIT_TRUSTED_PROXIES or not _is_trusted_proxy(host):
+        return host
+
+    forwarded = request.headers.get("x-forwarded-for")
+    if not forwarded:
+        return host
+    for address in reversed([part.strip() for part in forwarded.split(",") if part.strip()]):
+        if not _is_trusted_proxy(address):
+            try:
+                return str(ipaddress.ip_address(address))
+            except ValueError:
+                return host
+    return host
+
+
+def _token_user_id(request: Request) -> int | None:
+    """User id from a valid Bearer token, without touching the database."""
+    authorization = request.headers.get("authorization")
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    token = authorization[7:].strip()
+
+    claims = user_cache.get_token(token)
+    if claims is not None:
+        return int(claims["sub"])
+    try:
+        claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        user_id = int(claims["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        return None
+    user_cache.put_token(token, claims)
+    return user_id
+
+
+def rate_limit_key(request: Request) -> str:
+    """Authenticated requests are limited per user, anonymous ones per client IP."""
+    user_id = _token_user_id(request)
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"ip:{client_address(request)}"
+
+
+class SQLiteStorage(Storage):
+    """
+    Fixed-window counters in a SQLite file, shared by every worker process on
+    the host. URI: sqlite:///path/to/ratelimits.db
+
+    Each hit is a single UPSERT ... RETURNING statement, so concurrent workers
+    never lose increments; expired windows restart inside the same statement.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+    PURGE_EVERY = 1000  # hits between deletions of expired windows
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        # sqlite:///relative.db -> "relative.db", sqlite:////abs/path.db -> "/abs/path.db"
+        self.path = uri.split("://", 1)[1][1:] or ":memory:"
+        self._local = threading.local()
+        self._hits = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            "key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        connection = self._connection()
+        (count,) = connection.execute(
+            "INSERT INTO rate_limits (key, count, expires_at) VALUES (:key, :amount, :expires_at) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "count = CASE WHEN expires_at <= :now THEN :amount ELSE count + :amount END, "
+            "expires_at = CASE WHEN expires_at <= :now THEN :expires_at ELSE expires_at END "
+            "RETURNING count",
+            {"key": key, "amount": amount, "expires_at": now + expiry, "now": now},
+        ).fetchone()
+
+        self._hits += 1
+        if self._hits % self.PURGE_EVERY == 0:
+            connection.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+        return count
+
+    def get(self, key: str) -> int:
+        row = self._connection().execute(
+            "SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = self._connection().execute("SELECT expires_at FROM rate_limits WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            self._connection().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int | None:
+        return self._connection().execute("DELETE FROM rate_limits").rowcount
+
+    def clear(self, key: str) -> None:
+        self._connection().execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+
+class RedisCompatibleStorage(Storage):
+    """
+    Fixed-window counters on any Redis-compatible server (Redis, Valkey,
+    KeyDB, ...) using only SET NX EX, INCRBY, GET and PTTL - no Lua scripts.
+    URI: webcheck-redis://host:6379/0
+
+    A ready client can be passed instead through storage_options={"client": ...};
+    anything with the redis-py call signatures works, which is how the
+    benchmarks run against an in-process fake.
+    """
+
+    STORAGE_SCHEME = ["webcheck-redis"]
+    PREFIX = "webcheck:ratelimit:"
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, client=None, **options):
+        if client is None:
+            import redis  # Optional dependency, only needed for this backend
+
+            parsed = urlparse(uri)
+            client = redis.Redis.from_url(parsed._replace(scheme="redis").geturl(), **options)
+        self.client = client
+        super().__init__(uri, wrap_exceptions=wrap_exceptions)
+
+    @property
+    def base_exceptions(self):
+        try:
+            import redis
+
+            return redis.RedisError
+        except ImportError:
+            return ConnectionError
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        key = self.PREFIX + key
+        # MULTI/EXEC: the window gets its TTL when it is created, then the counter moves
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.set(key, 0, ex=expiry, nx=True)
+        pipeline.incrby(key, amount)
+        return int(pipeline.execute()[-1])
+
+    def get(self, key: str) -> int:
+        return int(self.client.get(self.PREFIX + key) or 0)
+
+    def get_expiry(self, key: str) -> float:
+        remaining_ms = self.client.pttl(self.PREFIX + key)
+        return time.time() + max(remaining_ms, 0) / 1000
+
+    def check(self) -> bool:
+        try:
+            return bool(self.client.ping())
+        except Exception:
+            return False
+
+    def reset(self) -> int | None:
+        keys = list(self.client.scan_iter(match=self.PREFIX + "*"))
+        return self.client.delete(*keys) if keys else 0
+
+    def clear(self, key: str) -> None:
+        self.client.delete(self.PREFIX + key)
+
+
+# One limiter for the whole app; routers decorate their endpoints with it and
+# main.py registers it on app.state
+limiter = Limiter(key_func=rate_limit_key, storage_uri=RATE_LIMIT_STORAGE_URI)
@@ -0,0 +1,283 @@
+# services/resilience_service.py
+# Deadlines, jittered retries, hedged requests and a circuit breaker around AI backend calls
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable
+
+from config import (
+    AI_BREAKER_FAILURE_RATE, AI_BREAKER_MIN_CALLS, AI_BREAKER_OPEN_SECONDS, AI_BREAKER_WINDOW_SECONDS,
+    AI_CALL_TIMEOUT_SECONDS, AI_HEDGE_ENABLED, AI_HEDGE_MIN_SAMPLES, AI_HEDGE_PERCENTILE, AI_MAX_RETRIES,
+    AI_RETRY_BASE_DELAY_SECONDS, AI_RETRY_MAX_DELAY_SECONDS
+)
+from services.ai_backends import TransientAIError
+from services.metrics_service import AI_CALL_ATTEMPTS, AI_CIRCUIT_REJECTIONS, AI_HEDGES
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses (google.api_core exceptions carry them in .code) worth retrying
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the backend while the circuit is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuito de IA abierto, reintentar en {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, connection problems, overload and 5xx; not bad requests or auth errors."""
+    if isinstance(exc, (TimeoutError, ConnectionError, TransientAIError)):
+        return True
+    return getattr(exc, "code", None) in RETRYABLE_STATUS_CODES
+
+
+def _outcome(exc: BaseException) -> str:
+    if isinstance(exc, TimeoutError):
+        return "timeout"
+    return "retryable_error" if is_retryable(exc) else "error"
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given retry (0-based)."""
+    return random.uniform(0, min(AI_RETRY_MAX_DELAY_SECONDS, AI_RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Opens when the share of failed calls in a sliding window reaches
+    failure_rate (with at least min_calls), rejects calls for open_seconds,
+    then lets a single probe through (half-open): success closes the circuit,
+    failure opens it again. Only retryable failures count; a backend that
+    answers with a client error is up.
+    """
+
+    def __init__(self, failure_rate: float, min_calls: int, window_seconds: float, open_seconds: float):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self._outcomes: deque[tuple[float, bool]] = deque()  # (monotonic time, failed)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            _, failed = self._outcomes.popleft()
+            self._failures -= failed
+
+    def _open(self, now: float) -> None:
+        self.state = "open"
+        self._opened_at = now
+        self._probe_in_flight = False
+        self.stats["opened"] += 1
+        logger.warning(f"⚠️ Circuito de IA abierto durante {self.open_seconds:.0f}s")
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError when the call must not reach the backend."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open":
+                remaining = self._opened_at + self.open_seconds - now
+                if remaining > 0:
+                    self._reject()
+                    raise CircuitOpenError(remaining)
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    self._reject()
+                    raise CircuitOpenError(1)
+                self._probe_in_flight = True
+
+    def _reject(self) -> None:
+        self.stats["rejected"] += 1
+        AI_CIRCUIT_REJECTIONS.inc()
+
+    def record(self, failed: bool) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "half_open":
+                if failed:
+                    self._open(now)
+                else:
+                    logger.info("✅ Circuito de IA cerrado")
+                    self.state = "closed"
+                    self._probe_in_flight = False
+                    self._outcomes.clear()
+                    self._failures = 0
+                return
+
+            self._outcomes.append((now, failed))
+            self._failures += failed
+            self._trim(now)
+            calls = len(self._outcomes)
+            if self.state == "closed" and calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+                self._open(now)
+
+    def release(self) -> None:
+        """Forget a half-open probe that ended without an outcome (e.g. the client went away)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        """Breaker state for GET /health."""
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            calls = len(self._outcomes)
+            return {
+                "state": self.state,
+                "calls_in_window": calls,
+                "failure_rate": round(self._failures / calls, 3) if calls else 0.0,
+                "retry_after_seconds": max(0, round(self._opened_at + self.open_seconds - now)) if self.state == "open" else 0,
+                **self.stats,
+            }
+
+
+class LatencyTracker:
+    """Latencies of recent successful calls, for the hedging threshold."""
+
+    def __init__(self, max_samples: int = 200):
+        self._samples: deque[float] = deque(maxlen=max_samples)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float, min_samples: int) -> float | None:
+        if len(self._samples) < min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[int(p / 100 * (len(ordered) - 1))]
+
+
+ai_breaker = CircuitBreaker(
+    failure_rate=AI_BREAKER_FAILURE_RATE,
+    min_calls=AI_BREAKER_MIN_CALLS,
+    window_seconds=AI_BREAKER_WINDOW_SECONDS,
+    open_seconds=AI_BREAKER_OPEN_SECONDS,
+)
+ai_latencies = LatencyTracker()
+
+
+async def _hedged_attempt(make_call: Callable[[], Awaitable[dict]]) -> dict:
+    """
+    One attempt under the deadline. With hedging on, a second identical
+    request starts once the first outlives the latency percentile; the first
+    success wins and the other request is cancelled.
+    """
+    started = time.perf_counter()
+    first = asyncio.ensure_future(asyncio.wait_for(make_call(), AI_CALL_TIMEOUT_SECONDS))
+    tasks = [first]
+    try:
+        hedge_after = ai_latencies.percentile(AI_HEDGE_PERCENTILE, AI_HEDGE_MIN_SAMPLES) if AI_HEDGE_ENABLED else None
+        if hedge_after is not None and hedge_after < AI_CALL_TIMEOUT_SECONDS:
+            done, _ = await asyncio.wait({first}, timeout=hedge_after)
+            if not done:
+                AI_HEDGES.inc(result="launched")
+                tasks.append(asyncio.ensure_future(
+                    asyncio.wait_for(make_call(), AI_CALL_TIMEOUT_SECONDS - hedge_after)
+                ))
+
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        AI_HEDGES.inc(result="won")
+                    ai_latencies.observe(time.perf_counter() - started)
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def call_with_resilience(make_call: Callable[[], Awaitable[dict]]) -> dict:
+    """
+    Run an AI backend call with a per-attempt deadline, optional hedging,
+    jittered retries of retryable errors and the circuit breaker.
+
+    Args:
+        make_call: Starts a new backend call each time it is invoked
+
+    Raises:
+        CircuitOpenError: When the circuit is open
+        Exception: The last backend error once retries are exhausted
+    """
+    attempt = 0
+    while True:
+        ai_breaker.before_call()
+        recorded = False
+        try:
+            result = await _hedged_attempt(make_call)
+            ai_breaker.record(failed=False)
+            recorded = True
+            AI_CALL_ATTEMPTS.inc(outcome="success")
+            return result
+        except Exception as exc:
+            retryable = is_retryable(exc)
+            ai_breaker.record(failed=retryable)
+            recorded = True
+            AI_CALL_ATTEMPTS.inc(outcome=_outcome(exc))
+            if not retryable or attempt >= AI_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logger.warning(f"Reintento {attempt}/{AI_MAX_RETRIES} de la llamada a la IA en {delay:.2f}s: {exc!r}")
+        finally:
+            if not recorded:
+                ai_breaker.release()
+        await asyncio.sleep(delay)
+
+
+async def stream_with_resilience(make_stream: Callable[[], AsyncIterator]) -> AsyncIterator:
+    """
+    Stream through the circuit breaker with an idle deadline between items.
+
+    A failed stream is retried only if nothing was yielded yet, since the
+    client has already received the earlier chunks.
+    """
+    attempt = 0
+    while True:
+        ai_breaker.before_call()
+        recorded, yielded = False, False
+        stream = make_stream()
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(stream.__anext__(), AI_CALL_TIMEOUT_SECONDS)
+                except StopAsyncIteration:
+                    break
+                yielded = True
+                yield item
+            ai_breaker.record(failed=False)
+            recorded = True
+            AI_CALL_ATTEMPTS.inc(outcome="success")
+            return
+        except Exception as exc:
+            retryable = is_retryable(exc)
+            ai_breaker.record(failed=retryable)
+            recorded = True
+            AI_CALL_ATTEMPTS.inc(outcome=_outcome(exc))
+            if yielded or not retryable or attempt >= AI_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logger.warning(f"Reintento {attempt}/{AI_MAX_RETRIES} del streaming de la IA en {delay:.2f}s: {exc!r}")
+        finally:
+            if not recorded:
+                ai_breaker.release()
+            await stream.aclose()
+        await asyncio.sleep(delay)
@@ -0,0 +1,155 @@
+# services/routing_service.py
+# Model router: cheap local signals pick the analysis path of a report (template, light or full)
+
+import json
+import logging
+from collections import Counter
+
+from config import (
+    AI_SECTION_THRESHOLD_TOKENS,
+    ROUTER_ENABLED,
+    ROUTER_LIGHT_MAX_ABNORMAL_ROWS,
+    ROUTER_LIGHT_MAX_PROMPT_TOKENS,
+    ROUTER_SIMPLE_MAX_PAGES,
+    ROUTER_TEMPLATE_ENABLED,
+    ROUTER_TEMPLATE_MAX_ROWS,
+)
+from services.lab_parser import parse_number, parse_reference
+from services.metrics_service import ROUTING_DECISIONS
+
+logger = logging.getLogger(__name__)
+
+# Reported as ai_model for templated answers
+TEMPLATE_MODEL_NAME = "template-local"
+
+# Prompt sent on each tier
+_TIER_PROMPTS = {"template": None, "light": "short", "full": "full"}
+
+# Metadata that identifies the patient or the lab (with the result rows, 2 of the 3 validity criteria of build_prompt)
+_IDENTITY_KEYS = ("paciente", "edad", "sexo", "laboratorio")
+
+
+def classify_row(row: dict) -> str:
+    """
+    "normal", "abnormal" or "unknown" for a parsed lab row.
+
+    A row is normal only when its value is a plain number inside a printed
+    reference range and the report does not flag it. Qualified values
+    ("<0.5") and rows without a range cannot be checked locally.
+    """
+    if row.get("bandera"):
+        return "abnormal"
+    value_text = row.get("valor", "")
+    value = parse_number(value_text)
+    low, high = parse_reference(row.get("referencia", ""))
+    if value is None or value_text[:1] in "<>≤≥" or (low is None and high is None):
+        return "unknown"
+    if (low is not None and value < low) or (high is not None and value > high):
+        return "abnormal"
+    return "normal"
+
+
+def _choose_tier(signals: dict, metadata: dict) -> tuple[str, str]:
+    if not ROUTER_ENABLED:
+        return "full", "disabled"
+    if signals["prompt_tokens"] > AI_SECTION_THRESHOLD_TOKENS or signals["pages"] > ROUTER_SIMPLE_MAX_PAGES:
+        return "full", "long_report"
+    if not signals["structured"]:
+        return "full", "unstructured"
+    if (
+        ROUTER_TEMPLATE_ENABLED
+        and signals["abnormal_rows"] == 0
+        and signals["unknown_rows"] == 0
+        and signals["unparsed_lines"] == 0
+        and signals["rows"] <= ROUTER_TEMPLATE_MAX_ROWS
+        and any(metadata.get(key) for key in _IDENTITY_KEYS)
+    ):
+        return "template", "all_normal"
+    if signals["abnormal_rows"] > ROUTER_LIGHT_MAX_ABNORMAL_ROWS:
+        return "full", "abnormal_values"
+    if signals["prompt_tokens"] > ROUTER_LIGHT_MAX_PROMPT_TOKENS:
+        return "full", "long_prompt"
+    if signals["abnormal_rows"]:
+        return "light", "few_abnormal"
+    if signals["unknown_rows"] or signals["unparsed_lines"]:
+        return "light", "unchecked_values"
+    return "light", "all_normal"
+
+
+def route_document(document: dict) -> dict:
+    """
+    Pick the analysis path of an extracted document (see build_analysis_document).
+
+    Tiers:
+        template: every parsed value is inside its reference range and every
+            candidate line was parsed (unparsed lines could hide abnormal
+            values); the answer is built locally, without an AI call
+        light: small structured reports with at most ROUTER_LIGHT_MAX_ABNORMAL_ROWS
+            values out of range; ROUTER_LIGHT_MODEL with build_short_prompt
+        full: everything else; GEMINI_MODEL with build_prompt (sectioned when long)
+
+    Returns:
+        Dict with tier, reason, prompt and the signals used, returned to the client as "routing"
+    """
+    extraction = document["extraction"]
+    rows = document["lab_rows"]
+    counts = Counter(classify_row(row) for row in rows)
+    signals = {
+        "pages": document["pages"],
+        "prompt_tokens": extraction["prompt_tokens_estimate"],
+        "structured": extraction["mode"] == "structured",
+        "confidence": extraction["confidence"],
+        "rows": len(rows),
+        "unparsed_lines": extraction["unparsed_lines"],
+        "abnormal_rows": counts["abnormal"],
+        "unknown_rows": counts["unknown"],
+    }
+    tier, reason = _choose_tier(signals, document["lab_metadata"])
+    ROUTING_DECISIONS.inc(tier=tier)
+    logger.info(
+        f"🧭 Ruta de análisis: {tier} ({reason}) | {signals['pages']} páginas, "
+        f"~{signals['prompt_tokens']} tokens, {signals['abnormal_rows']}/{signals['rows']} valores fuera de rango"
+    )
+    return {"tier": tier, "reason": reason, "prompt": _TIER_PROMPTS[tier], "signals": signals}
+
+
+def _row_line(row: dict) -> str:
+    value = f"{row['valor']} {row['unidad']}".strip()
+    return f"- **{row['analito']}**: {value} (referencia: {row['referencia']})"
+
+
+def build_template_response(document: dict) -> dict:
+    """
+    Analysis of an all-normal report built from its parsed rows, in the shape
+    of an AI response (zero tokens, the analysis already parsed in "analysis").
+    """
+    rows = document["lab_rows"]
+    names = [row["analito"] for row in rows]
+    listed = ", ".join(names[:5]) + (f" y {len(names) - 5} más" if len(names) > 5 else "")
+    laboratorio = document["lab_metadata"].get("laboratorio")
+    analysis = {
+        "isValid": True,
+        "errorMessage": "",
+        "interpretacionConceptos": (
+            f"**Todos los valores reportados ({len(rows)}) están dentro de su rango de referencia.**\n\n"
+            + "\n".join(_row_line(row) for row in rows)
+            + "\n\nNo se identificaron hallazgos anormales (críticos, moderados ni leves)."
+        ),
+        "resultadosSimplificados": (
+            f"Los {len(rows)} resultados de tu estudio están dentro de los valores que el laboratorio considera "
+            "esperados, por lo que no muestran nada fuera de lo habitual. Si tienes síntomas o dudas, coméntalos "
+            "con tu médico en tu próxima consulta.\n\n"
+            "Esta interpretación no sustituye la consulta médica profesional."
+        ),
+        "resumenEjecutivo": (
+            f"Estudio de laboratorio clínico{f' ({laboratorio})' if laboratorio else ''} con {len(rows)} "
+            f"determinaciones ({listed}). Todos los valores se encuentran dentro de los rangos de referencia; "
+            "no hay hallazgos anormales."
+        ),
+    }
+    return {
+        "text": json.dumps(analysis, ensure_ascii=False),
+        "model": TEMPLATE_MODEL_NAME,
+        "tokens": {"input": 0, "output": 0, "total": 0},
+        "analysis": analysis,
+    }
@@ -0,0 +1,206 @@
+# services/trends_service.py
+# Per-analyte observations of saved analyses: indexing on save, backfill and trend queries
+
+import logging
+import re
+import unicodedata
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session, undefer
+
+from config import OBSERVATIONS_BACKFILL_BATCH_SIZE, TRENDS_DEFAULT_DAYS
+from models import AnalysisResult, AnalyteObservation, SessionLocal
+from services.lab_parser import parse_number, parse_reference
+
+logger = logging.getLogger(__name__)
+
+# Spellings of the same analyte across labs -> one analyte code
+ANALYTE_ALIASES = {
+    "hb": "hemoglobina", "hgb": "hemoglobina", "hemoglobin": "hemoglobina",
+    "hto": "hematocrito", "hct": "hematocrito", "hematocrit": "hematocrito",
+    "rbc": "eritrocitos", "globulos_rojos": "eritrocitos",
+    "wbc": "leucocitos", "globulos_blancos": "leucocitos",
+    "plt": "plaquetas", "platelets": "plaquetas",
+    "glucose": "glucosa", "glucemia": "glucosa",
+    "creatinine": "creatinina",
+    "colesterol": "colesterol_total", "cholesterol": "colesterol_total",
+    "tgo": "tgo_ast", "ast": "tgo_ast",
+    "tgp": "tgp_alt", "alt": "tgp_alt",
+}
+
+_CODE_RE = re.compile(r"[^a-z0-9]+")
+_REPORT_DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y-%m-%d", "%d/%m/%y")
+
+
+def analyte_code(name: str) -> str:
+    """Normalized analyte code: no accents, lowercase, underscores ("Ácido úrico" -> "acido_urico")."""
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    code = _CODE_RE.sub("_", ascii_name.lower()).strip("_")[:80]
+    return ANALYTE_ALIASES.get(code, code)
+
+
+def _report_date(value: str | None) -> datetime | None:
+    """Sample date printed in the report (metadata "fecha"), if it parses."""
+    for date_format in _REPORT_DATE_FORMATS:
+        try:
+            return datetime.strptime(value or "", date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def _utc_naive(value: datetime) -> datetime:
+    # Stored datetimes are naive UTC
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+def build_observations(result_id: int, user_id: int, result: dict, saved_at: datetime) -> list[dict]:
+    """
+    Observation rows for the lab_results of an /upload-pdf payload.
+
+    Dated with the report's sample date when it has one (and it is not in the
+    future), otherwise with when the analysis was saved.
+    """
+    saved_at = _utc_naive(saved_at)
+    lab_results = result.get("lab_results") or {}
+    observed_at = _report_date(lab_results.get("metadata", {}).get("fecha"))
+    if observed_at is None or observed_at > saved_at:
+        observed_at = saved_at
+
+    observations = []
+    for row in lab_results.get("rows", []):
+        code = analyte_code(row.get("analito", ""))
+        if not code:
+            continue
+        reference = row.get("referencia", "")
+        reference_low, reference_high = parse_reference(reference)
+        observations.append({
+            "user_id": user_id,
+            "result_id": result_id,
+            "analyte_code": code,
+            "analyte_name": row["analito"][:120],
+            "value": parse_number(row.get("valor", "")),
+            "value_text": row.get("valor", "")[:40],
+            "unit": row.get("unidad", "")[:40],
+            "reference_low": reference_low,
+            "reference_high": reference_high,
+            "reference_text": reference[:60],
+            "flag": row.get("bandera", "")[:8],
+            "observed_at": observed_at,
+        })
+    return observations
+
+
+def index_analysis_result(db: Session, entry: AnalysisResult, result: dict) -> int:
+    """Insert the observations of a saved analysis in the caller's transaction; returns how many."""
+    observations = build_observations(entry.id, entry.user_id, result, entry.created_at)
+    if observations:
+        db.execute(insert(AnalyteObservation), observations)
+    return len(observations)
+
+
+def query_trend(
+    db: Session, user_id: int, analyte: str, since: datetime | None, until: datetime | None, limit: int
+) -> dict:
+    """
+    A user's values of one analyte between since and until, oldest first.
+
+    One range scan of ix_analyte_observations_user_code_date; no
+    results_json is read. Without since, the last TRENDS_DEFAULT_DAYS days
+    are returned. When there are more than limit points, the most recent
+    ones are kept.
+    """
+    code = analyte_code(analyte)
+    if not code:
+        raise HTTPException(status_code=400, detail="Analito inválido")
+    until = _utc_naive(until) if until else datetime.now(timezone.utc).replace(tzinfo=None)
+    since = _utc_naive(since) if since else until - timedelta(days=TRENDS_DEFAULT_DAYS)
+
+    rows = db.execute(
+        select(
+            AnalyteObservation.observed_at, AnalyteObservation.value, AnalyteObservation.value_text,
+            AnalyteObservation.unit, AnalyteObservation.reference_low, AnalyteObservation.reference_high,
+            AnalyteObservation.reference_text, AnalyteObservation.flag, AnalyteObservation.result_id,
+        )
+        .where(
+            AnalyteObservation.user_id == user_id,
+            AnalyteObservation.analyte_code == code,
+            AnalyteObservation.observed_at >= since,
+            AnalyteObservation.observed_at <= until,
+        )
+        .order_by(AnalyteObservation.observed_at.desc())
+        .limit(limit + 1)
+    ).all()
+    truncated = len(rows) > limit
+    rows = rows[:limit][::-1]
+    return {
+        "analyte": code,
+        "since": since.replace(tzinfo=timezone.utc).isoformat(),
+        "until": until.replace(tzinfo=timezone.utc).isoformat(),
+        "truncated": truncated,
+        "points": [
+            {
+                "observed_at": row.observed_at.replace(tzinfo=timezone.utc).isoformat(),
+                "value": row.value,
+                "value_text": row.value_text,
+                "unit": row.unit,
+                "reference": {"low": row.reference_low, "high": row.reference_high, "text": row.reference_text},
+                "flag": row.flag,
+                "result_id": row.result_id,
+            }
+            for row in rows
+        ],
+    }
+
+
+def backfill_observations(batch_size: int = OBSERVATIONS_BACKFILL_BATCH_SIZE, after_id: int = 0) -> dict:
+    """
+    Rebuild the observations of saved analyses in id order, one transaction per batch.
+
+    Each batch deletes and re-inserts its observations, so the job is
+    idempotent and can be resumed with after_id. Analyses saved before
+    lab_results was part of the payload have no rows to index.
+    """
+    stats = {"results": 0, "observations": 0, "last_id": after_id}
+    while True:
+        db = SessionLocal()
+        try:
+            entries = (
+                db.query(AnalysisResult)
+                .options(undefer(AnalysisResult.results_json))
+                .filter(AnalysisResult.id > stats["last_id"])
+                .order_by(AnalysisResult.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not entries:
+                break
+            db.execute(delete(AnalyteObservation).where(
+                AnalyteObservation.result_id.in_([entry.id for entry in entries])
+            ))
+            inserted = sum(index_analysis_result(db, entry, entry.results_json or {}) for entry in entries)
+            last_id = entries[-1].id
+            db.commit()
+        finally:
+            db.close()
+        stats["results"] += len(entries)
+        stats["observations"] += inserted
+        stats["last_id"] = last_id
+        logger.info(f"Backfill de observaciones: {stats['results']} análisis, {stats['observations']} valores (último id {stats['last_id']})")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from models import init_db
+
+    parser = argparse.ArgumentParser(description="Index the lab values of already saved analyses")
+    parser.add_argument("--batch-size", type=int, default=OBSERVATIONS_BACKFILL_BATCH_SIZE)
+    parser.add_argument("--after-id", type=int, default=0, help="Resume after this analysis id")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    print(backfill_observations(args.batch_size, args.after_id))
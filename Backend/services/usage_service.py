@@ -0,0 +1,348 @@
+# services/usage_service.py
+# Daily AI token ledger per user/IP and for the whole deployment, with budget admission before AI calls
+
+import asyncio
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from functools import cache
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from config import (
+    AI_SECTION_MAX_TOKENS, AI_SECTION_THRESHOLD_TOKENS, TOKEN_ADMISSION_WAIT_SECONDS, TOKEN_DAILY_BUDGET_GLOBAL,
+    TOKEN_DAILY_BUDGET_PER_USER, TOKEN_ESTIMATED_OUTPUT_TOKENS, TOKEN_USAGE_FLUSH_SECONDS
+)
+from models import SessionLocal, TokenUsage, engine
+from services.ai_service import build_prompt, estimate_tokens
+from services.metrics_service import TOKEN_ADMISSIONS
+
+logger = logging.getLogger(__name__)
+
+# Ledger subject holding the usage of the whole deployment
+GLOBAL_SUBJECT = "*"
+
+# Retry-After while the budget is only held by in-flight calls
+_IN_FLIGHT_RETRY_SECONDS = 5
+
+# INSERT ... ON CONFLICT DO UPDATE constructs of the databases token_usage can be flushed to
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+@cache
+def _prompt_overhead_tokens() -> int:
+    """Estimated tokens of the instructions around the document in every prompt."""
+    return estimate_tokens(build_prompt(""))
+
+
+def estimate_request_tokens(prompt_text: str) -> int:
+    """
+    Expected tokens of analyzing prompt_text: the document plus, per AI call
+    (one, or one per section for long reports), the instructions and
+    TOKEN_ESTIMATED_OUTPUT_TOKENS of answer. Only the text length is used.
+    """
+    document_tokens = estimate_tokens(prompt_text)
+    calls = 1 if document_tokens <= AI_SECTION_THRESHOLD_TOKENS else math.ceil(document_tokens / AI_SECTION_MAX_TOKENS)
+    return document_tokens + calls * (_prompt_overhead_tokens() + TOKEN_ESTIMATED_OUTPUT_TOKENS)
+
+
+def _utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def seconds_until_reset() -> int:
+    """Seconds until the daily budgets restart (UTC midnight)."""
+    now = datetime.now(timezone.utc)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+    return math.ceil((midnight - now).total_seconds())
+
+
+class Reservation:
+    """Tokens held for one analysis until its actual usage is known."""
+
+    def __init__(self, ledger: "TokenLedger", subject: str | None, tokens: int, day: date):
+        self.ledger = ledger
+        self.subject = subject
+        self.tokens = tokens
+        self.day = day
+        self.settled = False
+
+    def charge(self, ai_response: dict, cache_hit: bool) -> None:
+        """
+        Replace the reservation with the tokens the AI reported (cached analyses
+        cost nothing; sectioned analyses report what their uncached sections spent).
+        """
+        tokens = ai_response.get("spent_tokens", ai_response.get("tokens", {}))
+        input_tokens, output_tokens = (0, 0) if cache_hit else (tokens.get("input", 0), tokens.get("output", 0))
+        self.ledger._settle(self, input_tokens, output_tokens, counted=True)
+
+    def release(self) -> None:
+        """Drop the reservation without charging anything (the analysis failed before the AI answered)."""
+        if not self.settled:
+            self.ledger._settle(self, 0, 0, counted=False)
+
+
+class TokenLedger:
+    """
+    Per-worker view of today's token usage, checked before every AI call.
+
+    The admission check only touches in-memory dicts: the totals read from
+    token_usage at the last flush, this worker's unflushed usage and the
+    reservations of calls in flight. Usage is written every
+    TOKEN_USAGE_FLUSH_SECONDS in one batched UPSERT, which also refreshes
+    the totals of the other workers, so budgets are shared across workers
+    with at most one flush interval of lag.
+    """
+
+    def __init__(self, user_budget: int, global_budget: int):
+        self.user_budget = user_budget
+        self.global_budget = global_budget
+        self._day = _utc_today()
+        self._committed: dict[str, int] = {}  # subject -> today's tokens in the database at the last flush
+        self._pending: dict[tuple[date, str], list[int]] = {}  # (day, subject) -> [input, output, requests] not written yet
+        self._flushing: dict[tuple[date, str], list[int]] = {}  # Batch being written by flush(), same shape
+        self._reserved: dict[str, int] = {}  # subject -> tokens held by calls in flight
+        self._settled_event: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def _rollover(self) -> None:
+        today = _utc_today()
+        if today != self._day:
+            self._day = today
+            self._committed = {}
+
+    def _used(self, subject: str) -> int:
+        used = self._committed.get(subject, 0)
+        for batch in (self._pending, self._flushing):
+            usage = batch.get((self._day, subject))
+            if usage:
+                used += usage[0] + usage[1]
+        return used
+
+    def _budgets(self, subject: str | None):
+        if subject is not None and self.user_budget:
+            yield "user", subject, self.user_budget
+        if self.global_budget:
+            yield "global", GLOBAL_SUBJECT, self.global_budget
+
+    def _over_budget(self, subject: str | None, tokens: int, include_reserved: bool) -> str | None:
+        """The budget ("user" or "global") that tokens more would exceed, if any."""
+        for scope, key, budget in self._budgets(subject):
+            load = self._used(key) + (self._reserved.get(key, 0) if include_reserved else 0)
+            if load + tokens > budget:
+                return scope
+        return None
+
+    def try_reserve(self, subject: str | None, tokens: int) -> Reservation | None:
+        """Reserve tokens if they fit in both budgets, calls in flight included; None otherwise. No I/O."""
+        self._rollover()
+        if self._over_budget(subject, tokens, include_reserved=True):
+            return None
+        for key in (subject, GLOBAL_SUBJECT):
+            if key is not None:
+                self._reserved[key] = self._reserved.get(key, 0) + tokens
+        return Reservation(self, subject, tokens, self._day)
+
+    def _settle(self, reservation: Reservation, input_tokens: int, output_tokens: int, counted: bool) -> None:
+        if reservation.settled:
+            return
+        reservation.settled = True
+        for key in (reservation.subject, GLOBAL_SUBJECT):
+            if key is None:
+                continue
+            remaining = self._reserved.get(key, 0) - reservation.tokens
+            if remaining > 0:
+                self._reserved[key] = remaining
+            else:
+                self._reserved.pop(key, None)
+            if counted:
+                pending = self._pending.setdefault((reservation.day, key), [0, 0, 0])
+                pending[0] += input_tokens
+                pending[1] += output_tokens
+                pending[2] += 1
+        # Wake the requests waiting for reserved tokens to come back
+        if self._settled_event is not None:
+            self._settled_event.set()
+            self._settled_event = None
+
+    async def admit(self, subject: str | None, prompt_text: str) -> Reservation:
+        """
+        Reserve the estimated tokens of analyzing prompt_text for subject.
+
+        When the budget is only taken by calls in flight, waits up to
+        TOKEN_ADMISSION_WAIT_SECONDS for them to settle (their actual usage
+        is usually below the estimate).
+
+        Raises:
+            HTTPException: 429 with Retry-After when the request does not fit in the user or global budget
+        """
+        tokens = estimate_request_tokens(prompt_text)
+        deadline = time.monotonic() + TOKEN_ADMISSION_WAIT_SECONDS
+        queued = False
+        while True:
+            reservation = self.try_reserve(subject, tokens)
+            if reservation is not None:
+                TOKEN_ADMISSIONS.inc(result="queued" if queued else "admitted")
+                return reservation
+
+            scope = self._over_budget(subject, tokens, include_reserved=False)
+            remaining = deadline - time.monotonic()
+            if scope is None and remaining > 0:
+                queued = True
+                if self._settled_event is None:
+                    self._settled_event = asyncio.Event()
+                try:
+                    await asyncio.wait_for(self._settled_event.wait(), remaining)
+                except TimeoutError:
+                    pass
+                continue
+
+            in_flight = scope is None
+            scope = scope or self._over_budget(subject, tokens, include_reserved=True)
+            TOKEN_ADMISSIONS.inc(result=f"rejected_{scope}")
+            logger.warning(f"⛔ Presupuesto de tokens ({scope}) agotado para {subject or 'anónimo'}: ~{tokens} tokens solicitados")
+            if scope == "user":
+                detail = "Alcanzaste tu límite diario de análisis. Inténtalo de nuevo mañana."
+            else:
+                detail = "El servicio alcanzó su límite diario de análisis. Inténtalo de nuevo más tarde."
+            retry_after = _IN_FLIGHT_RETRY_SECONDS if in_flight else seconds_until_reset()
+            raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+    @asynccontextmanager
+    async def reserve(self, subject: str | None, prompt_text: str):
+        """admit() as a context manager; the reservation is released if it was not charged."""
+        reservation = await self.admit(subject, prompt_text)
+        try:
+            yield reservation
+        finally:
+            reservation.release()
+
+    def snapshot(self, subject: str | None) -> dict:
+        """Today's usage of subject and of the deployment as seen by this worker (for GET /usage)."""
+        self._rollover()
+
+        def view(key: str, budget: int) -> dict:
+            used = self._used(key)
+            return {
+                "used": used,
+                "reserved": self._reserved.get(key, 0),
+                "budget": budget or None,
+                "remaining": max(0, budget - used) if budget else None,
+            }
+
+        return {
+            "day": self._day.isoformat(),
+            "resets_in_seconds": seconds_until_reset(),
+            "user": view(subject, self.user_budget) if subject is not None else None,
+            "global": view(GLOBAL_SUBJECT, self.global_budget),
+        }
+
+    # Persistence
+
+    def _write(self, pending: dict[tuple[date, str], list[int]], day: date) -> dict[str, int]:
+        """Add the pending usage to token_usage in one statement and read back today's totals."""
+        db = SessionLocal()
+        try:
+            if pending:
+                dialect_insert = _UPSERT_INSERTS[engine.dialect.name]
+                table = TokenUsage.__table__
+                statement = dialect_insert(table)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[table.c.subject, table.c.day],
+                    set_={
+                        "input_tokens": table.c.input_tokens + statement.excluded.input_tokens,
+                        "output_tokens": table.c.output_tokens + statement.excluded.output_tokens,
+                        "requests": table.c.requests + statement.excluded.requests,
+                    },
+                )
+                db.execute(statement, [
+                    {"subject": subject, "day": usage_day, "input_tokens": usage[0], "output_tokens": usage[1], "requests": usage[2]}
+                    for (usage_day, subject), usage in pending.items()
+                ])
+            totals = db.execute(
+                select(TokenUsage.subject, TokenUsage.input_tokens + TokenUsage.output_tokens).where(TokenUsage.day == day)
+            ).all()
+            db.commit()
+            return {subject: total for subject, total in totals}
+        finally:
+            db.close()
+
+    async def flush(self) -> None:
+        """
+        Write this worker's usage since the last flush and refresh today's totals.
+
+        The batch being written stays counted by _used() (as _flushing) until
+        the refreshed totals, which include it, replace _committed.
+        """
+        self._rollover()
+        day = self._day
+        pending, self._pending = self._pending, {}
+        self._flushing = pending
+        try:
+            committed = await asyncio.to_thread(self._write, pending, day)
+        except Exception as e:
+            # Keep the usage for the next flush
+            for key, usage in pending.items():
+                current = self._pending.setdefault(key, [0, 0, 0])
+                for index, value in enumerate(usage):
+                    current[index] += value
+            logger.error(f"❌ Error guardando el consumo de tokens: {e}")
+            return
+        finally:
+            self._flushing = {}
+        if day == self._day:
+            self._committed = committed
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(TOKEN_USAGE_FLUSH_SECONDS)
+            await self.flush()
+
+    async def start(self) -> None:
+        """
+        Load today's totals and start the periodic flush.
+
+        Raises:
+            ValueError: if token_usage cannot be upserted on the configured database
+        """
+        if engine.dialect.name not in _UPSERT_INSERTS:
+            raise ValueError(
+                f"El registro de tokens no soporta la base de datos {engine.dialect.name}. "
+                f"Opciones: {', '.join(_UPSERT_INSERTS)}"
+            )
+        await self.flush()
+        self._task = asyncio.create_task(self._flush_periodically(), name="token-ledger-flush")
+
+    async def stop(self) -> None:
+        """Stop the periodic flush and write what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+def daily_usage(db: Session, subject: str, days: int) -> list[dict]:
+    """Flushed usage of subject over the last days (UTC), newest first."""
+    rows = db.query(TokenUsage).filter(
+        TokenUsage.subject == subject,
+        TokenUsage.day > _utc_today() - timedelta(days=days),
+    ).order_by(TokenUsage.day.desc()).all()
+    return [
+        {
+            "day": row.day.isoformat(),
+            "input_tokens": row.input_tokens,
+            "output_tokens": row.output_tokens,
+            "total_tokens": row.input_tokens + row.output_tokens,
+            "requests": row.requests,
+        }
+        for row in rows
+    ]
+
+
+token_ledger = TokenLedger(user_budget=TOKEN_DAILY_BUDGET_PER_USER, global_budget=TOKEN_DAILY_BUDGET_GLOBAL)
@@ -0,0 +1,2 @@
+# tests/__init__.py
+# Regression tests for performance budgets (run from the Backend folder)
@@ -0,0 +1,22 @@
+# tests/test_startup.py
+# Worker cold start budget: import main (create_app) and run the lifespan startup in a fresh interpreter
+#
+# Run from the Backend folder: python -m unittest discover tests (or python -m pytest tests)
+
+import tempfile
+import unittest
+
+from benchmarks.bench_startup import DEFAULT_BUDGET_MS, median_total_ms, prepare_env
+
+REPEATS = 3
+
+
+class StartupBudgetTest(unittest.TestCase):
+    def test_cold_start_within_budget(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            total_ms = median_total_ms(prepare_env(tmp), REPEATS)
+        self.assertLessEqual(total_ms, DEFAULT_BUDGET_MS, f"median import + startup {total_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+# tests/test_upload_memory.py
+# Peak RSS of one upload: the spooled path must not hold the body in memory
+#
+# Run from the Backend folder: python -m unittest discover tests (or python -m pytest tests)
+
+import os
+import tempfile
+import unittest
+
+from benchmarks.bench_upload_memory import make_padded_pdf, measure
+
+UPLOAD_MB = 9
+# RSS growth allowed for one spooled upload, well under the upload itself
+SPOOL_MAX_GROWTH_MB = UPLOAD_MB / 2
+
+
+class UploadMemoryTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory()
+        cls.accepted = os.path.join(cls._tmp.name, "accepted.pdf")
+        cls.oversized = os.path.join(cls._tmp.name, "oversized.pdf")
+        from config import MAX_FILE_SIZE_MB
+
+        for path, size_mb in ((cls.accepted, UPLOAD_MB), (cls.oversized, MAX_FILE_SIZE_MB * 2)):
+            with open(path, "wb") as f:
+                f.write(make_padded_pdf(size_mb))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._tmp.cleanup()
+
+    def test_spooled_upload_peak_rss(self):
+        spooled = measure("spool", self.accepted)
+        self.assertEqual(spooled["result"], "2 pages")
+        self.assertLess(spooled["growth_mb"], SPOOL_MAX_GROWTH_MB)
+
+    def test_legacy_read_holds_the_body(self):
+        # Guards the measurement itself: RSS must see a whole-body read
+        legacy = measure("legacy", self.accepted)
+        self.assertGreater(legacy["growth_mb"], UPLOAD_MB)
+
+    def test_oversized_upload_aborts_early(self):
+        spooled = measure("spool", self.oversized)
+        self.assertEqual(spooled["result"], "HTTP 413")
+        self.assertLess(spooled["growth_mb"], SPOOL_MAX_GROWTH_MB)
+
+
+if __name__ == "__main__":
+    unittest.main()
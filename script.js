@@ -126,14 +126,11 @@ async function handleFiles(files) {
         // Step 2: Start request - Extracting (25-50%)
         updateProgress(30, 2);
         
-        const response = await fetch('http://127.0.0.1:8000/upload-pdf', {
+        const response = await fetch('http://127.0.0.1:8000/upload-pdf/stream', {
             method: 'POST',
             body: formData
         });
         
-        updateProgress(50, 2);
-        await sleep(200);
-        
         if (!response.ok) {
             // Parse error message from server
             let errorMessage = `Error del servidor: ${response.status}`;
@@ -148,17 +145,27 @@ async function handleFiles(files) {
             throw new Error(errorMessage);
         }
         
-        // Step 3: Analyzing with AI (50-90%)
-        updateProgress(60, 3);
-        await sleep(300);
-        updateProgress(75, 3);
+        // Progress follows the server events: extracted -> analysis chunks -> result
+        let result = null;
+        let analysisChunks = 0;
+        await readServerSentEvents(response, (event, data) => {
+            if (event === 'extracted') {
+                updateProgress(50, 3);
+            } else if (event === 'analysis') {
+                analysisChunks++;
+                updateProgress(Math.min(90, 50 + analysisChunks * 2), 3);
+            } else if (event === 'result') {
+                result = data;
+            } else if (event === 'error') {
+                throw new Error(data.detail || 'Error procesando PDF');
+            }
+        });
         
-        const result = await response.json();
+        if (!result) {
+            throw new Error('La conexión se cerró antes de recibir el análisis.');
+        }
         console.log(`✅ ${file.name} enviado exitosamente:`, result);
         
-        updateProgress(90, 3);
-        await sleep(200);
-        
         // Step 4: Completed (100%)
         updateProgress(100, 4);
         await sleep(500);
@@ -192,6 +199,33 @@ async function handleFiles(files) {
     }
 }
 
+// Read a text/event-stream response, calling onEvent(event, data) for each event
+async function readServerSentEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let separator;
+        while ((separator = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, separator);
+            buffer = buffer.slice(separator + 2);
+            
+            let event = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            onEvent(event, data ? JSON.parse(data) : null);
+        }
+    }
+}
+
 // Helper function for delays
 function sleep(ms) {
     return new Promise(resolve => setTimeout(resolve, ms));